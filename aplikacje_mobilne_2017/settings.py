@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'diet_app.metrics.MetricsMiddleware',
+    'diet_app.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +86,62 @@ DATABASES = {
 }
 
 
+# REST framework
+# Requests are authenticated with signed tokens returned by /api/login/, valid for TOKEN_MAX_AGE seconds.
+# JSON is rendered and parsed by JSON['BACKEND']: 'orjson', 'json' (standard library) or 'auto' (orjson when
+# installed).
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'diet_app.authentication.SignedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'diet_app.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'diet_app.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+TOKEN_MAX_AGE = 60 * 60 * 24 * 30
+
+JSON = {
+    'BACKEND': 'auto',
+}
+
+
+# Request metrics
+# When ENABLED, responses get Server-Timing header and /api/metrics/ serves per-route histograms of query count,
+# database and application time and response size in Prometheus text format.
+
+METRICS = {
+    'ENABLED': False,
+}
+
+
+# Response compression
+# Responses of at least MIN_SIZE bytes are compressed with the first of ENCODINGS accepted by the client; br and
+# zstd are used only when brotli and zstandard packages are installed.
+
+COMPRESSION = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    'ENCODINGS': ['br', 'zstd', 'gzip'],
+}
+
+
+# Recent products ranking
+# Every use of a product by a user counts half after HALF_LIFE days in the ranking of /api/products/recent/.
+
+PRODUCT_RANKING = {
+    'HALF_LIFE': 7,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
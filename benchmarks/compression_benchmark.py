@@ -0,0 +1,93 @@
+"""Benchmark of response compression.
+
+Creates a test database with synthetic data, sends GET requests of every route from run_benchmarks.py and
+compresses their bodies with every installed content coding. Reports average bytes on the wire and CPU time
+of compression per route and coding, with responses smaller than COMPRESSION['MIN_SIZE'] sent uncompressed
+like the middleware does.
+
+Usage: python3 benchmarks/compression_benchmark.py [--users 100] [--requests 20] [--output results.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+from benchmarks.run_benchmarks import scenarios, send
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from benchmarks.dataset import generate
+from diet_app.compression import CODECS, DEFAULT_COMPRESSION, compress, compression_options
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    dataset = generate(users=args.users, days=args.days, products=args.products, seed=args.seed)
+    client = Client()
+    options = compression_options()
+    levels = dict(DEFAULT_COMPRESSION['LEVELS'], **options['LEVELS'])
+
+    results = []
+    for (name, method), build in sorted(scenarios(dataset, rng).items()):
+        if method != 'get' or name == 'metrics':
+            continue
+        bodies = [send(client, name, method, build()).content for _ in range(args.requests)]
+        identity = sum(len(body) for body in bodies)
+        for encoding in ['identity'] + sorted(CODECS):
+            size = 0
+            duration = 0.0
+            for body in bodies:
+                if encoding == 'identity' or len(body) < options['MIN_SIZE']:
+                    size += len(body)
+                    continue
+                start = time.perf_counter()
+                content = compress(encoding, body, levels[encoding])
+                duration += time.perf_counter() - start
+                size += min(len(content), len(body))
+            results.append({'route': name, 'encoding': encoding,
+                            'bytes': size / len(bodies),
+                            'ratio': size / identity if identity else 1.0,
+                            'compress_ms': duration / len(bodies) * 1000})
+            print('{:15} {:8} {:10.0f} bytes  ratio {:5.2f}  {:7.3f} ms'.format(
+                name, encoding, results[-1]['bytes'], results[-1]['ratio'], results[-1]['compress_ms']),
+                file=sys.stderr)
+
+    return {'meta': {'users': args.users, 'days': args.days, 'products': args.products,
+                     'requests': args.requests, 'seed': args.seed, 'min_size': options['MIN_SIZE'],
+                     'levels': levels},
+            'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark response size and compression time of API routes.')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--days', type=int, default=30, help='diaries and weights per user')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=20, help='responses compressed per route')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='file to write JSON results to, stdout by default')
+    args = parser.parse_args()
+
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results = run(args)
+
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
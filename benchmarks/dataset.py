@@ -0,0 +1,68 @@
+import datetime
+import random
+
+from populate.populate_database import (import_disciplines, import_products, import_users, iter_json,
+                                        synthetic_products, synthetic_users)
+from django.db import transaction
+
+from diet_app.models import *
+
+PASSWORD = 'benchmark'
+"""Password of every generated user."""
+
+MEAL_TYPES = ['Breakfast', 'Lunch', 'Dinner', 'Supper']
+
+
+class Dataset:
+    """Ids of generated rows used to build benchmark requests."""
+
+    def __init__(self):
+        self.users = []
+        self.products = []
+        self.disciplines = []
+        self.diaries = []
+        self.meal_types = []
+        self.meals = []
+        self.ingredients = []
+        self.activities = []
+        self.weights = []
+
+
+def generate(users=1000, days=7, products=1000, ingredients_per_meal=3, seed=0):
+    """Fills empty database with synthetic data based on populate/*.json files and returns ids of created rows."""
+    rng = random.Random(seed)
+    dataset = Dataset()
+    start = datetime.date(2017, 1, 1)
+    import_products(synthetic_products(products, [row['name'] for row in iter_json('populate/products.json')], seed))
+    import_disciplines(iter_json('populate/disciplines.json'))
+    import_users(synthetic_users(users, PASSWORD), workers=1)
+    dataset.products = list(Product.objects.order_by('id').values_list('id', flat=True))
+    dataset.disciplines = list(Discipline.objects.order_by('id').values_list('id', flat=True))
+    dataset.users = list(Profile.objects.order_by('pk').values_list('pk', flat=True))
+
+    with transaction.atomic():
+        Weight.objects.bulk_create([Weight(user_id=user_id, date=start + datetime.timedelta(days=day),
+                                           value=rng.uniform(50, 110))
+                                    for user_id in dataset.users for day in range(days)])
+        Diary.objects.bulk_create([Diary(user_id=user_id, date=start + datetime.timedelta(days=day))
+                                   for user_id in dataset.users for day in range(days)])
+        dataset.diaries = list(Diary.objects.order_by('id').values_list('id', flat=True))
+        MealType.objects.bulk_create([MealType(diary_id=diary_id, name=name)
+                                      for diary_id in dataset.diaries for name in MEAL_TYPES])
+        dataset.meal_types = list(MealType.objects.order_by('id').values_list('id', flat=True))
+        Meal.objects.bulk_create([Meal(meal_type_id=meal_type_id) for meal_type_id in dataset.meal_types])
+        dataset.meals = list(Meal.objects.order_by('id').values_list('id', flat=True))
+        Ingredient.objects.bulk_create([Ingredient(meal_id=meal_id, product_id=rng.choice(dataset.products),
+                                                   amount=rng.randint(10, 300))
+                                        for meal_id in dataset.meals for _ in range(ingredients_per_meal)])
+        Activity.objects.bulk_create([Activity(diary_id=diary_id, discipline_id=rng.choice(dataset.disciplines),
+                                               time=datetime.time(0, rng.choice([15, 30, 45])))
+                                      for diary_id in dataset.diaries])
+        Meal.objects.all().update_totals()
+        Diary.objects.all().summarize()
+        ProductUsage.objects.rebuild()
+
+    dataset.ingredients = list(Ingredient.objects.order_by('id').values_list('id', flat=True))
+    dataset.activities = list(Activity.objects.order_by('id').values_list('id', flat=True))
+    dataset.weights = list(Weight.objects.order_by('id').values_list('id', flat=True))
+    return dataset
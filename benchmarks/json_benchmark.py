@@ -0,0 +1,103 @@
+"""Benchmark of JSON backends on API payloads.
+
+Creates a test database with synthetic data, builds response data of a few list routes with their views and
+measures how long REST framework's JSONRenderer and every backend of diet_app.renderers take to render it
+and to parse it back.
+
+Usage: python3 benchmarks/json_benchmark.py [--users 100] [--days 60] [--repeat 50] [--output results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aplikacje_mobilne_2017.settings')
+import django
+django.setup()
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import resolve, reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from benchmarks.dataset import generate
+from diet_app.renderers import BACKENDS
+
+
+def payloads(dataset):
+    """Returns response data of list routes by route name, as passed to the renderer."""
+    requests = {
+        'meal-types': {'diary_id': dataset.diaries[0], 'limit': 1000},
+        'products': {'name': 'a', 'limit': 1000},
+        'weights': {'user_id': dataset.users[0], 'limit': 1000},
+        'activities': {'diary_id': dataset.diaries[0], 'limit': 1000},
+        'sync': {'user_id': dataset.users[0]},
+    }
+    factory = APIRequestFactory()
+    data = {}
+    for name, params in requests.items():
+        path = reverse(name)
+        response = resolve(path).func(factory.get(path, params))
+        data[name] = response.data
+    return data
+
+
+def timed(function, argument, repeat):
+    """Returns the best time of calling function in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def run(args):
+    dataset = generate(users=args.users, days=args.days, products=args.products)
+    encoders = {'rest_framework': (JSONRenderer().render, json.loads)}
+    encoders.update(BACKENDS)
+
+    results = []
+    for name, data in payloads(dataset).items():
+        content = JSONRenderer().render(data)
+        for encoder, (dumps, loads) in encoders.items():
+            results.append({'route': name, 'encoder': encoder, 'bytes': len(content),
+                            'render_ms': timed(dumps, data, args.repeat),
+                            'parse_ms': timed(loads, content, args.repeat)})
+            print('{:12} {:15} {:9} bytes  render {:8.3f} ms  parse {:8.3f} ms'.format(
+                name, encoder, len(content), results[-1]['render_ms'], results[-1]['parse_ms']), file=sys.stderr)
+
+    return {'meta': {'users': args.users, 'days': args.days, 'products': args.products, 'repeat': args.repeat},
+            'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark JSON backends on API payloads.')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--days', type=int, default=60, help='diaries and weights per user')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=50, help='runs of each encoder, the best one is reported')
+    parser.add_argument('--output', help='file to write JSON results to, stdout by default')
+    args = parser.parse_args()
+
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results = run(args)
+
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
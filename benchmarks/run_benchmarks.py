@@ -0,0 +1,235 @@
+"""Latency benchmark of the REST API.
+
+Creates a test database, fills it with synthetic data and sends requests to every route of diet_app/urls.py
+through Django test client. Prints (or saves) JSON with p50/p99 latency, throughput, queries per request and
+joins in them of every route. With --baseline it exits with status 1 if any route got slower or runs more
+queries or joins than in the baseline results.
+
+Usage: python3 benchmarks/run_benchmarks.py [--users 1000] [--requests 100] [--output results.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aplikacje_mobilne_2017.settings')
+import django
+django.setup()
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from benchmarks.dataset import PASSWORD, generate
+from diet_app import urls
+
+JSON_POSTS = {'sync'}
+"""Routes whose POST requests have nested data, sent as JSON instead of a form."""
+
+
+def scenarios(dataset, rng):
+    """Returns dictionary mapping (route name, method) to function building request parameters."""
+    pick = rng.choice
+    pop = lambda ids: ids.pop(rng.randrange(len(ids)))
+    counter = iter(range(10 ** 9))
+    date = lambda: '2018-{:02d}-{:02d}'.format(rng.randint(1, 12), rng.randint(1, 28))
+    return {
+        ('diary', 'get'): lambda: {'user_id': pick(dataset.users), 'date': '2017-01-01'},
+        ('diary', 'post'): lambda: {'user_id': pick(dataset.users), 'date': date()},
+        ('diary-snapshot', 'get'): lambda: {'diary_id': pick(dataset.diaries)},
+        ('daily-summaries', 'get'): lambda: {'user_id': pick(dataset.users), 'date_from': '2017-01-01',
+                                             'date_to': '2017-03-31'},
+        ('goals', 'get'): lambda: {'user_id': pick(dataset.users), 'date_from': '2017-01-01',
+                                   'date_to': '2017-12-31'},
+        ('activity', 'get'): lambda: {'id': pick(dataset.activities)},
+        ('activity', 'post'): lambda: {'diary_id': pick(dataset.diaries), 'discipline_id': pick(dataset.disciplines),
+                                       'time': '00:{:02d}:00'.format(rng.randint(1, 59))},
+        ('activity', 'delete'): lambda: {'id': pop(dataset.activities)},
+        ('activities', 'get'): lambda: {'diary_id': pick(dataset.diaries)},
+        ('product', 'get'): lambda: {'id': pick(dataset.products)},
+        ('product', 'post'): lambda: {'name': 'Product {}'.format(next(counter)), 'kcal': 100, 'carbs': 10,
+                                      'proteins': 10, 'fat': 5},
+        ('products', 'get'): lambda: {'name': pick(['app', 'chicken', 'sauce', 'ch', 'bread', 'wine'])},
+        ('products-suggest', 'get'): lambda: {'prefix': pick(['a', 'ch', 'chi', 'sau', 'bre', 'wine'])},
+        ('products-recent', 'get'): lambda: {'user_id': pick(dataset.users)},
+        ('ingredient', 'post'): lambda: {'product_id': pick(dataset.products), 'meal_id': pick(dataset.meals),
+                                         'amount': rng.randint(10, 300)},
+        ('ingredient', 'delete'): lambda: {'id': pop(dataset.ingredients)},
+        ('discipline', 'get'): lambda: {'id': pick(dataset.disciplines)},
+        ('disciplines', 'get'): lambda: {'name': pick(['Running', 'Swim', 'ing', 'Dancing'])},
+        ('meal', 'get'): lambda: {'id': pick(dataset.meals)},
+        ('meal', 'post'): lambda: {'meal_type_id': pick(dataset.meal_types)},
+        ('meal', 'put'): lambda: {'id': pick(dataset.meals), 'total_kcal': 500},
+        ('meal', 'delete'): lambda: {'id': pop(dataset.meals)},
+        ('meal-type', 'get'): lambda: {'id': pick(dataset.meal_types)},
+        ('meal-type', 'post'): lambda: {'diary_id': pick(dataset.diaries), 'name': 'Snack {}'.format(next(counter))},
+        ('meal-type', 'delete'): lambda: {'id': pop(dataset.meal_types)},
+        ('meal-types', 'get'): lambda: {'diary_id': pick(dataset.diaries)},
+        ('user', 'post'): lambda: {'username': 'new{}'.format(next(counter)), 'password': PASSWORD,
+                                   'email': 'new{}@example.com'.format(next(counter))},
+        ('user', 'put'): lambda: {'id': pick(dataset.users), 'height': rng.randint(150, 200)},
+        ('user', 'delete'): lambda: {'id': pop(dataset.users), 'password': PASSWORD},
+        ('profile', 'post'): lambda: {'id': pick(dataset.users)},
+        ('weights', 'get'): lambda: {'user_id': pick(dataset.users)},
+        ('weight-series', 'get'): lambda: {'user_id': pick(dataset.users), 'bucket': 'week', 'window': 4,
+                                           'max_points': 100},
+        ('weight', 'get'): lambda: {'user_id': pick(dataset.users), 'date': '2017-01-01'},
+        ('weight', 'post'): lambda: {'user_id': pick(dataset.users), 'date': date(), 'value': 80},
+        ('weight', 'delete'): lambda: {'id': pop(dataset.weights)},
+        ('sync', 'get'): lambda: {'user_id': pick(dataset.users), 'since': '2018-01-01T00:00:00Z'},
+        ('sync', 'post'): lambda: {'operations': [
+            {'model': 'diary', 'action': 'create', 'ref': 'd', 'data': {'user_id': pick(dataset.users),
+                                                                         'date': date()}},
+            {'model': 'mealtype', 'action': 'create', 'ref': 't',
+             'data': {'diary_id': {'$ref': 'd'}, 'name': 'Snack {}'.format(next(counter))}},
+            {'model': 'meal', 'action': 'create', 'ref': 'm', 'data': {'meal_type_id': {'$ref': 't'}}},
+            {'model': 'ingredient', 'action': 'create',
+             'data': {'meal_id': {'$ref': 'm'}, 'product_id': pick(dataset.products), 'amount': 100}},
+        ]},
+        ('login', 'post'): lambda: {'username': 'user{}'.format(rng.randrange(len(dataset.users) // 2)),
+                                    'password': PASSWORD},
+        ('metrics', 'get'): lambda: {},
+    }
+
+
+def path_of(name, params):
+    """Returns URL of route, moving path parameters out of params."""
+    if name == 'diary-snapshot':
+        return reverse(name, args=[params.pop('diary_id')])
+    return reverse(name)
+
+
+def send(client, name, method, params):
+    path = path_of(name, params)
+    if method == 'get':
+        return client.get(path, params)
+    if method == 'post' and name not in JSON_POSTS:
+        return client.post(path, params)
+    return getattr(client, method)(path, json.dumps(params), content_type='application/json')
+
+
+def percentile(values, fraction):
+    """Returns nearest-rank percentile of sorted values."""
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+
+def measure(client, name, method, build, requests):
+    """Sends requests to route and returns its statistics."""
+    statuses = {}
+    with CaptureQueriesContext(connection) as context:
+        response = send(client, name, method, build())
+    queries = len(context.captured_queries)
+    joins = sum(query['sql'].upper().count(' JOIN ') for query in context.captured_queries)
+    statuses[response.status_code] = 1
+
+    durations = []
+    size = 0
+    for _ in range(requests):
+        params = build()
+        start = time.perf_counter()
+        response = send(client, name, method, params)
+        durations.append(time.perf_counter() - start)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        size += len(response.content)
+
+    durations.sort()
+    return {'route': name,
+            'method': method.upper(),
+            'requests': requests,
+            'p50_ms': percentile(durations, 0.5) * 1000,
+            'p99_ms': percentile(durations, 0.99) * 1000,
+            'mean_ms': sum(durations) / len(durations) * 1000,
+            'throughput_rps': len(durations) / sum(durations),
+            'queries': queries,
+            'joins': joins,
+            'response_bytes': size / requests,
+            'statuses': {str(status): count for status, count in sorted(statuses.items())}}
+
+
+def compare(results, baseline, tolerance):
+    """Returns descriptions of routes slower or running more queries or joins than in baseline."""
+    previous = {(route['route'], route['method']): route for route in baseline['routes']}
+    regressions = []
+    for route in results['routes']:
+        old = previous.get((route['route'], route['method']))
+        if old is None:
+            continue
+        if route['queries'] > old['queries']:
+            regressions.append('{} {}: {} queries, was {}'.format(route['method'], route['route'],
+                                                                  route['queries'], old['queries']))
+        if route['joins'] > old.get('joins', route['joins']):
+            regressions.append('{} {}: {} joins, was {}'.format(route['method'], route['route'],
+                                                                route['joins'], old['joins']))
+        if route['p99_ms'] > old['p99_ms'] * (1 + tolerance):
+            regressions.append('{} {}: p99 {:.2f} ms, was {:.2f} ms'.format(route['method'], route['route'],
+                                                                            route['p99_ms'], old['p99_ms']))
+    return regressions
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    dataset = generate(users=args.users, days=args.days, products=args.products, seed=args.seed)
+    client = Client()
+    builders = scenarios(dataset, rng)
+    missing = {pattern.name for pattern in urls.urlpatterns} - {name for name, method in builders}
+    if missing:
+        raise SystemExit('No benchmark scenario for routes: {}'.format(', '.join(sorted(missing))))
+
+    routes = []
+    for (name, method), build in sorted(builders.items(), key=lambda item: item[0][1] == 'delete'):
+        if args.route and name not in args.route:
+            continue
+        requests = args.requests if (name, method) not in [('login', 'post'), ('user', 'post'),
+                                                           ('user', 'delete')] else max(1, args.requests // 10)
+        routes.append(measure(client, name, method, build, requests))
+        print('{:7} {:15} p50 {:8.2f} ms  p99 {:8.2f} ms  {:3} queries  {:3} joins'.format(
+            method.upper(), name, routes[-1]['p50_ms'], routes[-1]['p99_ms'], routes[-1]['queries'],
+            routes[-1]['joins']), file=sys.stderr)
+
+    return {'meta': {'users': args.users, 'days': args.days, 'products': args.products,
+                     'requests': args.requests, 'seed': args.seed, 'database': connection.vendor},
+            'routes': routes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark latency of the REST API routes.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=7, help='diaries and weights per user')
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=100, help='requests per route')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--route', action='append', help='benchmark only given route name (repeatable)')
+    parser.add_argument('--output', help='file to write JSON results to, stdout by default')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p99 slowdown against baseline')
+    args = parser.parse_args()
+
+    setup_test_environment(debug=False)
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results = run(args)
+
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        regressions = compare(results, json.load(open(args.baseline)), args.tolerance)
+        for regression in regressions:
+            print('Regression: ' + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+default_app_config = 'diet_app.apps.DietAppConfig'
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class DietAppConfig(AppConfig):
     name = 'diet_app'
+
+    def ready(self):
+        from diet_app import signals
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework import authentication, exceptions
+
+TOKEN_SALT = 'diet_app.authentication.token'
+
+DEFAULT_TOKEN_MAX_AGE = 60 * 60 * 24 * 30
+"""Default number of seconds token is valid for, overridden by TOKEN_MAX_AGE setting."""
+
+
+def password_fragment(user):
+    """Returns part of HMAC of the password hash of the user, so that tokens stop working when password changes."""
+    return salted_hmac(TOKEN_SALT, user.password).hexdigest()[:16]
+
+
+def issue_token(user):
+    """Returns signed token identifying given user."""
+    return signing.dumps({'user_id': user.id, 'password': password_fragment(user)}, salt=TOKEN_SALT)
+
+
+def read_token(token):
+    """Returns id of the user and fragment of their password hash from token, raises signing.BadSignature if
+    token is invalid or expired."""
+    max_age = getattr(settings, 'TOKEN_MAX_AGE', DEFAULT_TOKEN_MAX_AGE)
+    payload = signing.loads(token, salt=TOKEN_SALT, max_age=max_age)
+    try:
+        return payload['user_id'], payload['password']
+
+    except (KeyError, TypeError):
+        raise signing.BadSignature('Token without user or password.')
+
+
+class SignedTokenAuthentication(authentication.BaseAuthentication):
+    """Authenticates requests with ``Authorization: Token <token>`` header containing token from /api/login/.
+
+    Token signature is checked with SECRET_KEY in constant time, so unlike password, it is cheap to verify on
+    every request. The user is loaded with a single query to check that they still exist, are active and have
+    the password the token was issued for.
+    """
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+
+        try:
+            user_id, fragment = read_token(header[1].decode())
+
+        except (signing.BadSignature, UnicodeError):
+            raise exceptions.AuthenticationFailed('Invalid or expired token.')
+
+        user = User.objects.only('id', 'password', 'is_active', 'is_staff').filter(pk=user_id).first()
+        if user is None or not user.is_active or not constant_time_compare(fragment, password_fragment(user)):
+            raise exceptions.AuthenticationFailed('Invalid or expired token.')
+
+        return user, header[1].decode()
+
+    def authenticate_header(self, request):
+        return self.keyword
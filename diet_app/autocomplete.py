@@ -0,0 +1,162 @@
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+
+from diet_app.models import Product
+from diet_app.search import normalize_name
+
+DEFAULT_AUTOCOMPLETE = {
+    'MAX_AGE': 300,
+}
+"""Default autocomplete settings, overridden by AUTOCOMPLETE setting.
+
+MAX_AGE is the number of seconds after which the index is rebuilt, to pick up rows changed by other processes
+or by bulk updates that send no signals. None keeps the index until it is cleared.
+"""
+
+
+def autocomplete_options():
+    return dict(DEFAULT_AUTOCOMPLETE, **getattr(settings, 'AUTOCOMPLETE', {}))
+
+
+class PrefixIndex:
+    """In-memory index of names of all rows for prefix lookups.
+
+    Normalized names are kept in a sorted list of (name, id) pairs searched with bisect, and the rest of every
+    name starting at each of its following words in a second list, so that "chi" finds "Grilled chicken" after
+    names starting with it. The index is built on first use and updated by signals when writes are committed.
+    Once it is older than MAX_AGE it is rebuilt in a background thread while searches use the old one.
+    """
+
+    def __init__(self, model, field='name'):
+        self.model = model
+        self.field = field
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.names = None
+        self.starts = []
+        self.words = []
+        self.built_at = None
+        self.rebuilding = False
+        self.pending = None
+
+    @staticmethod
+    def keys(name):
+        """Returns keys of name: the whole normalized name and its remainders starting at following words."""
+        normalized = normalize_name(name)
+        return normalized, [normalized[i + 1:] for i, char in enumerate(normalized) if char == ' ']
+
+    def rows(self):
+        return self.model.objects.values_list('pk', self.field).iterator()
+
+    def build(self):
+        """Reads all rows into new lists without holding the lock and swaps them in.
+
+        Changes indexed while reading are recorded and applied again to the new lists, as the read could miss them.
+        """
+        with self.build_lock:
+            with self.lock:
+                self.pending = []
+            names, starts, words = {}, [], []
+            for pk, name in self.rows():
+                names[pk] = name
+                start, rest = self.keys(name)
+                starts.append((start, pk))
+                words.extend((word, pk) for word in rest)
+            starts.sort()
+            words.sort()
+
+            with self.lock:
+                self.names, self.starts, self.words = names, starts, words
+                for pk, name in self.pending:
+                    self.remove(pk)
+                    if name is not None:
+                        self.add(pk, name)
+                self.pending = None
+                self.built_at = time.monotonic()
+
+    def rebuild(self):
+        """Builds the index again, called in a background thread."""
+        try:
+            self.build()
+
+        finally:
+            connection.close()
+            with self.lock:
+                self.rebuilding = False
+
+    def add(self, pk, name):
+        self.names[pk] = name
+        start, words = self.keys(name)
+        insort(self.starts, (start, pk))
+        for word in words:
+            insort(self.words, (word, pk))
+
+    def remove(self, pk):
+        name = self.names.pop(pk, None)
+        if name is None:
+            return
+        start, words = self.keys(name)
+        for keys, key in [(self.starts, start)] + [(self.words, word) for word in words]:
+            i = bisect_left(keys, (key, pk))
+            if i < len(keys) and keys[i] == (key, pk):
+                del keys[i]
+
+    def ensure_built(self):
+        """Builds the index on first use and starts rebuilding it in background when it is older than MAX_AGE."""
+        max_age = autocomplete_options()['MAX_AGE']
+        with self.lock:
+            built = self.names is not None
+            stale = (built and not self.rebuilding and max_age is not None and
+                     time.monotonic() - self.built_at > max_age)
+            if stale:
+                self.rebuilding = True
+
+        if not built:
+            self.build()
+        elif stale:
+            threading.Thread(target=self.rebuild, daemon=True).start()
+
+    def search(self, prefix, limit):
+        """Returns up to limit (id, name) pairs of rows with names or their words starting with prefix.
+
+        Names starting with prefix come first, both groups in alphabetical order of normalized names.
+        """
+        prefix = normalize_name(prefix).strip()
+        found = []
+        self.ensure_built()
+        with self.lock:
+            for keys in (self.starts, self.words):
+                i = bisect_left(keys, (prefix,))
+                while i < len(keys) and len(found) < limit and keys[i][0].startswith(prefix):
+                    pk = keys[i][1]
+                    if pk not in found:
+                        found.append(pk)
+                    i += 1
+            return [(pk, self.names[pk]) for pk in found]
+
+    def update(self, pk, name):
+        """Indexes saved row, if the index was already built. Has to be called after the save is committed."""
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((pk, name))
+            if self.names is not None:
+                self.remove(pk)
+                if name is not None:
+                    self.add(pk, name)
+
+    def delete(self, pk):
+        """Removes deleted row from the index, if it was already built. Has to be called after the delete is
+        committed."""
+        self.update(pk, None)
+
+    def clear(self):
+        """Drops the index, it is built again on next search."""
+        with self.lock:
+            self.names = None
+
+
+products_index = PrefixIndex(Product)
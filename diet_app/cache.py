@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.forms.models import model_to_dict
+
+from diet_app.models import Discipline, Product
+
+DEFAULT_REFERENCE_CACHE = {
+    'CACHE': None,
+    'SIZE': 1024,
+    'TIMEOUT': 3600,
+}
+"""Default reference cache settings, overridden by REFERENCE_CACHE setting.
+
+CACHE is an alias from CACHES used as a shared backend, if it is None rows are kept in a process-local LRU cache
+of SIZE items. TIMEOUT (seconds) applies to the shared backend only.
+"""
+
+
+class ReferenceCache:
+    """Read-through cache of rarely changing rows, stored as dictionaries of field values."""
+
+    def __init__(self, model):
+        self.model = model
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+        self.changes = threading.local()
+
+    @property
+    def options(self):
+        return dict(DEFAULT_REFERENCE_CACHE, **getattr(settings, 'REFERENCE_CACHE', {}))
+
+    @property
+    def shared(self):
+        alias = self.options['CACHE']
+        return caches[alias] if alias else None
+
+    def key(self, pk):
+        return 'diet_app:{}:{}'.format(self.model._meta.model_name, pk)
+
+    @property
+    def uncommitted(self):
+        """Primary keys of rows changed in the transaction of this thread."""
+        if not hasattr(self.changes, 'pks'):
+            self.changes.pks = set()
+        return self.changes.pks
+
+    def get(self, pk):
+        """Returns row with given primary key or None if it does not exist.
+
+        Rows changed in the current transaction are read from the database and not cached, as the change can
+        still be rolled back.
+        """
+        if pk in self.uncommitted:
+            if connection.in_atomic_block:
+                return self.load(pk)
+            # The transaction was rolled back, on commit the row would have been discarded already.
+            self.uncommitted.discard(pk)
+
+        shared = self.shared
+        if shared is not None:
+            data = shared.get(self.key(pk))
+        else:
+            with self.lock:
+                data = self.local.get(pk)
+                if data is not None:
+                    self.local.move_to_end(pk)
+
+        if data is None:
+            data = self.load(pk)
+            if data is not None:
+                self.set(pk, data)
+        return data
+
+    def load(self, pk):
+        try:
+            return model_to_dict(self.model.objects.get(pk=pk))
+
+        except self.model.DoesNotExist:
+            return None
+
+    def set(self, pk, data):
+        shared = self.shared
+        if shared is not None:
+            shared.set(self.key(pk), data, self.options['TIMEOUT'])
+            return
+
+        with self.lock:
+            self.local[pk] = data
+            self.local.move_to_end(pk)
+            while len(self.local) > self.options['SIZE']:
+                self.local.popitem(last=False)
+
+    def invalidate(self, pk):
+        """Removes changed row with given primary key from the cache.
+
+        Inside a transaction the row is removed again when it commits, as other requests could cache the old
+        version in the meantime, and isn't cached by this one until then.
+        """
+        self.remove(pk)
+        if connection.in_atomic_block:
+            self.uncommitted.add(pk)
+            transaction.on_commit(partial(self.committed, pk))
+
+    def committed(self, pk):
+        self.uncommitted.discard(pk)
+        self.remove(pk)
+
+    def remove(self, pk):
+        shared = self.shared
+        if shared is not None:
+            shared.delete(self.key(pk))
+        with self.lock:
+            self.local.pop(pk, None)
+
+    def clear(self):
+        """Removes all rows from process-local cache."""
+        with self.lock:
+            self.local.clear()
+
+
+products_cache = ReferenceCache(Product)
+disciplines_cache = ReferenceCache(Discipline)
@@ -0,0 +1,171 @@
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_COMPRESSION = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    'ENCODINGS': ['br', 'zstd', 'gzip'],
+    'LEVELS': {'br': 4, 'zstd': 3, 'gzip': 6},
+}
+"""Default compression settings, overridden by COMPRESSION setting."""
+
+
+def compression_options():
+    return dict(DEFAULT_COMPRESSION, **getattr(settings, 'COMPRESSION', {}))
+
+
+class GzipCompressor:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        """Returns the rest of compressed data, so that the client can decompress it without waiting for more."""
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+CODECS = {
+    'gzip': GzipCompressor,
+}
+"""Compressors of installed codecs by content coding name."""
+
+if brotli is not None:
+    CODECS['br'] = BrotliCompressor
+if zstandard is not None:
+    CODECS['zstd'] = ZstdCompressor
+
+
+def compress(encoding, data, level):
+    """Returns data compressed at once with given content coding."""
+    compressor = CODECS[encoding](level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_sequence(encoding, chunks, level):
+    """Yields compressed chunks of streamed content, each of them decompressible as soon as it arrives."""
+    compressor = CODECS[encoding](level)
+    for data in chunks:
+        if data:
+            yield compressor.compress(data) + compressor.flush()
+    yield compressor.finish()
+
+
+def accepted_encodings(header):
+    """Returns quality values of content codings in Accept-Encoding header by lowercase name."""
+    accepted = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def negotiate(header, preferred):
+    """Returns the first of installed preferred codings accepted by the client, or None."""
+    accepted = accepted_encodings(header)
+    for encoding in preferred:
+        if encoding in CODECS and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    """Compresses responses with the best content coding accepted by the client.
+
+    Responses smaller than MIN_SIZE or not getting smaller are sent as they are, streaming responses are
+    compressed chunk by chunk. Strong ETags become weak, as the compressed body differs from the identity one.
+    The middleware removes itself from the chain when COMPRESSION['ENABLED'] is False.
+    """
+
+    def __init__(self, get_response):
+        options = compression_options()
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.min_size = options['MIN_SIZE']
+        self.encodings = options['ENCODINGS']
+        self.levels = dict(DEFAULT_COMPRESSION['LEVELS'], **options['LEVELS'])
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encodings)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(encoding, response.streaming_content,
+                                                           self.levels[encoding])
+            del response['Content-Length']
+        else:
+            content = compress(encoding, response.content, self.levels[encoding])
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
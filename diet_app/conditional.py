@@ -0,0 +1,37 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.response import Response
+
+
+def serializer_etag(serializer):
+    """Returns ETag of serializer data, based on request parameters and version of the resource."""
+    key = json.dumps([type(serializer).__name__, serializer.validated_data, serializer.version()],
+                     cls=DjangoJSONEncoder, sort_keys=True)
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+def is_not_modified(request, etag):
+    """Checks whether If-None-Match header of the request matches given ETag."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+
+    etags = parse_etags(header)
+    return '*' in etags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in etags]
+
+
+def conditional_response(request, serializer, build_response):
+    """Returns 304 response if client already has current data, otherwise response built by build_response.
+
+    Serializer has to implement version() returning value that changes whenever its data changes.
+    """
+    etag = serializer_etag(serializer)
+    if is_not_modified(request, etag):
+        response = Response(status=304)
+    else:
+        response = build_response()
+    response['ETag'] = etag
+    return response
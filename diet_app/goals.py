@@ -0,0 +1,88 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NUTRIENTS = ('kcal', 'carbs', 'proteins', 'fat')
+"""Nutrients with daily caps in profile, in the order of intake columns."""
+
+
+def evaluate_python(caps, logged, intake):
+    """Compares daily intake with caps in pure Python, see evaluate()."""
+    days = len(logged)
+    percents = [[None] * len(caps) for _ in range(days)]
+    adherence, streaks, deficits = [], [], []
+    for column, cap in enumerate(caps):
+        if cap is None:
+            adherence.append(None)
+            streaks.append(None)
+            deficits.append(None)
+            continue
+
+        within_days = 0
+        run = longest = 0
+        deficit = 0.0
+        for day in range(days):
+            value = intake[day][column]
+            percents[day][column] = value / cap * 100 if cap else None
+            within = logged[day] and value <= cap
+            within_days += within
+            run = run + 1 if within else 0
+            longest = max(longest, run)
+            if logged[day]:
+                deficit += cap - value
+        logged_days = sum(logged)
+        adherence.append(within_days / logged_days * 100 if logged_days else None)
+        streaks.append({'current': run, 'longest': longest})
+        deficits.append(deficit)
+    return percents, adherence, streaks, deficits
+
+
+def evaluate_numpy(caps, logged, intake):
+    """Compares daily intake with caps with NumPy array operations, see evaluate()."""
+    days = len(logged)
+    capped = numpy.array([cap is not None for cap in caps])
+    cap_values = numpy.array([cap or 0.0 for cap in caps], dtype=float)
+    logged = numpy.array(logged, dtype=bool).reshape(days, 1)
+    intake = numpy.array(intake, dtype=float).reshape(days, len(caps))
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        percents = numpy.where(capped & (cap_values != 0), intake / cap_values * 100, numpy.nan)
+    within = logged & (intake <= cap_values)
+
+    # Length of the run of days within cap ending on each day: distance to the last day that wasn't.
+    index = numpy.arange(days).reshape(days, 1)
+    last_break = numpy.maximum.accumulate(numpy.where(within, -1, index), axis=0)
+    runs = index - last_break
+
+    logged_days = int(logged.sum())
+    within_days = within.sum(axis=0)
+    deficits = ((cap_values - intake) * logged).sum(axis=0)
+
+    percents = [[None if numpy.isnan(value) else float(value) for value in row] for row in percents]
+    adherence, streaks, totals = [], [], []
+    for column, is_capped in enumerate(capped):
+        if not is_capped:
+            adherence.append(None)
+            streaks.append(None)
+            totals.append(None)
+            continue
+        adherence.append(float(within_days[column]) / logged_days * 100 if logged_days else None)
+        streaks.append({'current': int(runs[-1, column]) if days else 0,
+                        'longest': int(runs[:, column].max()) if days else 0})
+        totals.append(float(deficits[column]))
+    return percents, adherence, streaks, totals
+
+
+def evaluate(caps, logged, intake):
+    """Compares daily intake of nutrients with their caps, using NumPy when it is installed.
+
+    caps has a cap (or None when not set) of every nutrient, logged tells for every day whether it has a diary
+    and intake has a row of nutrient amounts for every day. Returns percents of caps for every day and nutrient,
+    and for every nutrient: percent of logged days within the cap, current and longest streak of consecutive
+    logged days within the cap and the sum of cap minus intake over logged days. Values of nutrients without cap
+    are None.
+    """
+    if numpy is not None:
+        return evaluate_numpy(caps, logged, intake)
+    return evaluate_python(caps, logged, intake)
@@ -0,0 +1,140 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+DEFAULT_METRICS = {
+    'ENABLED': False,
+}
+"""Default metrics settings, overridden by METRICS setting."""
+
+HISTOGRAMS = {
+    'request_duration_seconds': ('Time spent handling request.',
+                                 (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)),
+    'db_duration_seconds': ('Time spent executing SQL queries.',
+                            (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+    'app_duration_seconds': ('Time spent handling request outside of the database (views, serializers, rendering).',
+                             (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+    'db_queries': ('Number of SQL queries.', (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)),
+    'response_size_bytes': ('Size of response body.', (100, 1000, 10000, 100000, 1000000, 10000000)),
+}
+"""Names of recorded histograms with their help text and bucket upper bounds."""
+
+
+def metrics_options():
+    return dict(DEFAULT_METRICS, **getattr(settings, 'METRICS', {}))
+
+
+class Histogram:
+    """Counts of observed values falling into buckets, with their sum."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """In-process histograms of request metrics, labeled with route name and HTTP method."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, name, route, method, value):
+        with self.lock:
+            histogram = self.histograms.get((name, route, method))
+            if histogram is None:
+                histogram = self.histograms[name, route, method] = Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def render(self):
+        """Returns histograms in Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name, (help_text, buckets) in HISTOGRAMS.items():
+                metric = 'diet_app_' + name
+                lines += ['# HELP {} {}'.format(metric, help_text), '# TYPE {} histogram'.format(metric)]
+                for (histogram_name, route, method), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    labels = 'route="{}",method="{}"'.format(route, method)
+                    cumulative = 0
+                    for bound, count in zip(list(buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, labels, bound, cumulative))
+                    lines.append('{}_sum{{{}}} {}'.format(metric, labels, histogram.sum))
+                    lines.append('{}_count{{{}}} {}'.format(metric, labels, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class QueryTimer:
+    """Database execute wrapper counting queries and their total time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Records number of queries, database and application time and response size of every request.
+
+    Values are added to the response as Server-Timing header and to per-route histograms served by
+    /api/metrics/. The middleware removes itself from the chain when METRICS['ENABLED'] is False.
+    """
+
+    def __init__(self, get_response):
+        if not metrics_options()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        route = match.url_name if match is not None and match.url_name else 'unmatched'
+        registry.observe('request_duration_seconds', route, request.method, duration)
+        registry.observe('db_duration_seconds', route, request.method, timer.duration)
+        registry.observe('app_duration_seconds', route, request.method, duration - timer.duration)
+        registry.observe('db_queries', route, request.method, timer.count)
+        timing = 'db;dur={:.3f};desc="{} queries", app;dur={:.3f}, total;dur={:.3f}'.format(
+            timer.duration * 1000, timer.count, (duration - timer.duration) * 1000, duration * 1000)
+        if not response.streaming:
+            size = len(response.content)
+            registry.observe('response_size_bytes', route, request.method, size)
+            timing += ', size;desc="{} bytes"'.format(size)
+
+        response['Server-Timing'] = timing
+        return response
@@ -0,0 +1,51 @@
+# Generated by Django 2.0 on 2026-10-18 11:40
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Creates FTS5 trigram index over product names (SQLite 3.34+ only)."""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or connection.Database.sqlite_version_info < (3, 34, 0):
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+
+        cursor.execute("CREATE VIRTUAL TABLE diet_app_product_search USING fts5("
+                       "name, content='diet_app_product', content_rowid='id', tokenize='trigram')")
+        cursor.execute("CREATE TRIGGER diet_app_product_search_insert AFTER INSERT ON diet_app_product BEGIN "
+                       "INSERT INTO diet_app_product_search(rowid, name) VALUES (new.id, new.name); END")
+        cursor.execute("CREATE TRIGGER diet_app_product_search_delete AFTER DELETE ON diet_app_product BEGIN "
+                       "INSERT INTO diet_app_product_search(diet_app_product_search, rowid, name) "
+                       "VALUES ('delete', old.id, old.name); END")
+        cursor.execute("CREATE TRIGGER diet_app_product_search_update AFTER UPDATE ON diet_app_product BEGIN "
+                       "INSERT INTO diet_app_product_search(diet_app_product_search, rowid, name) "
+                       "VALUES ('delete', old.id, old.name); "
+                       "INSERT INTO diet_app_product_search(rowid, name) VALUES (new.id, new.name); END")
+        cursor.execute("INSERT INTO diet_app_product_search(diet_app_product_search) VALUES ('rebuild')")
+
+
+def drop_search_index(apps, schema_editor):
+    """Drops product search index and its triggers."""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for trigger in ['insert', 'delete', 'update']:
+            cursor.execute('DROP TRIGGER IF EXISTS diet_app_product_search_{}'.format(trigger))
+        cursor.execute('DROP TABLE IF EXISTS diet_app_product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_app', '0009_auto_20171224_1409'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.0 on 2026-10-18 12:00
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def duplicates(model, fields):
+    """Yields lists of objects of model sharing the same values of fields, the oldest first."""
+    keys = model.objects.values(*fields).annotate(count=Count('id')).filter(count__gt=1)
+    for key in keys:
+        yield list(model.objects.filter(**{field: key[field] for field in fields}).order_by('id'))
+
+
+def remove_duplicates(apps, schema_editor):
+    """Merges diaries, meal types and meals that would break new unique constraints into the oldest one."""
+    Diary = apps.get_model('diet_app', 'Diary')
+    MealType = apps.get_model('diet_app', 'MealType')
+    Meal = apps.get_model('diet_app', 'Meal')
+    Ingredient = apps.get_model('diet_app', 'Ingredient')
+    Activity = apps.get_model('diet_app', 'Activity')
+
+    for diary, *others in duplicates(Diary, ['user', 'date']):
+        MealType.objects.filter(diary__in=others).update(diary=diary)
+        Activity.objects.filter(diary__in=others).update(diary=diary)
+        Diary.objects.filter(id__in=[other.id for other in others]).delete()
+
+    for meal_type, *others in duplicates(MealType, ['diary', 'name']):
+        Meal.objects.filter(meal_type__in=others).update(meal_type=meal_type)
+        MealType.objects.filter(id__in=[other.id for other in others]).delete()
+
+    for meal, *others in duplicates(Meal, ['meal_type']):
+        Ingredient.objects.filter(meal__in=others).update(meal=meal)
+        Meal.objects.filter(id__in=[other.id for other in others]).delete()
+        for field in ['kcal', 'carbs', 'proteins', 'fat']:
+            setattr(meal, 'total_' + field, sum(ingredient.amount * getattr(ingredient.product, field) / 100
+                                                for ingredient in Ingredient.objects.filter(meal=meal)))
+        meal.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_app', '0010_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
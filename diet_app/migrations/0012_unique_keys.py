@@ -0,0 +1,31 @@
+# Generated by Django 2.0 on 2026-10-18 12:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_app', '0011_remove_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='meal',
+            name='meal_type',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='diet_app.MealType'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='diary',
+            unique_together={('user', 'date')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='mealtype',
+            unique_together={('diary', 'name')},
+        ),
+        migrations.AddIndex(
+            model_name='weight',
+            index=models.Index(fields=['user', 'date'], name='diet_app_weight_user_date'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.0 on 2026-10-18 11:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_summaries(apps, schema_editor):
+    """Creates summaries of existing diaries from their meal totals and activities."""
+    Diary = apps.get_model('diet_app', 'Diary')
+    Meal = apps.get_model('diet_app', 'Meal')
+    Activity = apps.get_model('diet_app', 'Activity')
+    DailySummary = apps.get_model('diet_app', 'DailySummary')
+
+    summaries = {diary['id']: DailySummary(diary_id=diary['id'], user_id=diary['user_id'], date=diary['date'])
+                 for diary in Diary.objects.values('id', 'user_id', 'date')}
+    for meal in Meal.objects.values('meal_type__diary_id', 'total_kcal', 'total_carbs', 'total_proteins', 'total_fat'):
+        summary = summaries[meal['meal_type__diary_id']]
+        for field in ['kcal', 'carbs', 'proteins', 'fat']:
+            setattr(summary, field, getattr(summary, field) + (meal['total_' + field] or 0))
+
+    for activity in Activity.objects.values('diary_id', 'time', 'discipline__calories_burn'):
+        time = activity['time']
+        summaries[activity['diary_id']].burned_kcal += activity['discipline__calories_burn'] * (
+            time.hour + time.minute / 60 + time.second / 3600)
+
+    DailySummary.objects.bulk_create(summaries.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_app', '0013_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('kcal', models.FloatField(default=0)),
+                ('carbs', models.FloatField(default=0)),
+                ('proteins', models.FloatField(default=0)),
+                ('fat', models.FloatField(default=0)),
+                ('burned_kcal', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('diary', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='diet_app.Diary')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='diet_app.Profile')),
+            ],
+            options={
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.RunPython(create_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.0 on 2026-10-18 14:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def profile_user_field():
+    return models.OneToOneField(db_column='user_ptr_id', on_delete=django.db.models.deletion.CASCADE,
+                                primary_key=True, related_name='profile', serialize=False,
+                                to=settings.AUTH_USER_MODEL)
+
+
+def profile_parent_link():
+    return models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True,
+                                primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)
+
+
+class FlattenProfile(migrations.operations.base.Operation):
+    """Turns Profile from a child of User into a model with one-to-one primary key to User.
+
+    The primary key column keeps its name user_ptr_id, so the table, its rows and foreign keys pointing to
+    profiles stay as they are and only the migration state changes.
+    """
+    reversible = True
+
+    def state_forwards(self, app_label, state):
+        self.replace(app_label, state, 'user_ptr', 'user', profile_user_field(), (models.Model,))
+
+    def state_backwards(self, app_label, state):
+        self.replace(app_label, state, 'user', 'user_ptr', profile_parent_link(), ('auth.user',))
+
+    def replace(self, app_label, state, old_name, new_name, field, bases):
+        model_state = state.models[app_label, 'profile']
+        model_state.bases = bases
+        model_state.fields = [(new_name, field) if name == old_name else (name, old_field)
+                              for name, old_field in model_state.fields]
+        state.reload_model(app_label, 'profile', delay=True)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        pass
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        pass
+
+    def describe(self):
+        return 'Flatten Profile into a model with one-to-one primary key to User'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('diet_app', '0015_sync'),
+    ]
+
+    operations = [
+        FlattenProfile(),
+        migrations.AlterModelOptions(
+            name='profile',
+            options={},
+        ),
+        migrations.AlterModelManagers(
+            name='profile',
+            managers=[],
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 2.0 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+from diet_app.search import normalize_name
+
+
+def search_index_sql(column):
+    """Returns statements creating FTS5 trigram index over given column of products, with sync triggers."""
+    return [
+        "CREATE VIRTUAL TABLE diet_app_product_search USING fts5("
+        "{0}, content='diet_app_product', content_rowid='id', tokenize='trigram')".format(column),
+        "CREATE TRIGGER diet_app_product_search_insert AFTER INSERT ON diet_app_product BEGIN "
+        "INSERT INTO diet_app_product_search(rowid, {0}) VALUES (new.id, new.{0}); END".format(column),
+        "CREATE TRIGGER diet_app_product_search_delete AFTER DELETE ON diet_app_product BEGIN "
+        "INSERT INTO diet_app_product_search(diet_app_product_search, rowid, {0}) "
+        "VALUES ('delete', old.id, old.{0}); END".format(column),
+        "CREATE TRIGGER diet_app_product_search_update AFTER UPDATE ON diet_app_product BEGIN "
+        "INSERT INTO diet_app_product_search(diet_app_product_search, rowid, {0}) "
+        "VALUES ('delete', old.id, old.{0}); "
+        "INSERT INTO diet_app_product_search(rowid, {0}) VALUES (new.id, new.{0}); END".format(column),
+        "INSERT INTO diet_app_product_search(diet_app_product_search) VALUES ('rebuild')",
+    ]
+
+
+def supports_search_index(connection):
+    """Checks whether the database can have FTS5 trigram index, like 0010_product_search_index does."""
+    if connection.vendor != 'sqlite' or connection.Database.sqlite_version_info < (3, 34, 0):
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def drop_search_index(apps, schema_editor):
+    """Drops product search index, rebuilding the product table would drop its triggers anyway."""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for trigger in ['insert', 'delete', 'update']:
+            cursor.execute('DROP TRIGGER IF EXISTS diet_app_product_search_{}'.format(trigger))
+        cursor.execute('DROP TABLE IF EXISTS diet_app_product_search')
+
+
+def create_search_index(column):
+    def create(apps, schema_editor):
+        """Creates product search index over given column."""
+        if not supports_search_index(schema_editor.connection):
+            return
+
+        with schema_editor.connection.cursor() as cursor:
+            for sql in search_index_sql(column):
+                cursor.execute(sql)
+    return create
+
+
+def fill_search_names(apps, schema_editor):
+    """Sets normalized names of existing products and disciplines."""
+    for model_name in ['Product', 'Discipline']:
+        model = apps.get_model('diet_app', model_name)
+        for pk, name in model.objects.values_list('pk', 'name').iterator():
+            model.objects.filter(pk=pk).update(search_name=normalize_name(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_app', '0016_flatten_profile'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_index, create_search_index('name')),
+        migrations.AddField(
+            model_name='product',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=60),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='discipline',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=60),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index('search_name'), drop_search_index),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 2.0 on 2026-10-18 16:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from diet_app.ranking import usage_ranks
+
+
+def fill_product_usages(apps, schema_editor):
+    """Ranks products of existing ingredients, taking the time of their last change as the time of use."""
+    Ingredient = apps.get_model('diet_app', 'Ingredient')
+    ProductUsage = apps.get_model('diet_app', 'ProductUsage')
+    uses = Ingredient.objects.filter(meal__isnull=False).values_list('meal__meal_type__diary__user_id', 'product_id',
+                                                                      'updated_at')
+    ProductUsage.objects.bulk_create([ProductUsage(user_id=user_id, product_id=product_id, uses=count,
+                                                   last_used=last_used, rank=rank)
+                                      for (user_id, product_id), (count, last_used, rank) in
+                                      usage_ranks(uses.iterator()).items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_app', '0017_search_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uses', models.IntegerField()),
+                ('last_used', models.DateTimeField()),
+                ('rank', models.FloatField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='diet_app.Product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='diet_app.Profile')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='productusage',
+            unique_together={('user', 'product')},
+        ),
+        migrations.AddIndex(
+            model_name='productusage',
+            index=models.Index(fields=['user', '-rank'], name='diet_app_usage_user_rank'),
+        ),
+        migrations.RunPython(fill_product_usages, migrations.RunPython.noop),
+    ]
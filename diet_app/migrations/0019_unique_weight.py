@@ -0,0 +1,36 @@
+# Generated by Django 2.0 on 2026-10-18 17:10
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def remove_duplicate_weights(apps, schema_editor):
+    """Keeps only the latest given weight of a user in one day, deleted ones get tombstones for sync."""
+    Weight = apps.get_model('diet_app', 'Weight')
+    Tombstone = apps.get_model('diet_app', 'Tombstone')
+
+    keys = Weight.objects.values('user', 'date').annotate(count=Count('id')).filter(count__gt=1)
+    for key in keys:
+        latest, *others = Weight.objects.filter(user=key['user'], date=key['date']).order_by('-updated_at', '-id')
+        Tombstone.objects.bulk_create([Tombstone(user_id=other.user_id, model='weight', object_id=other.id)
+                                       for other in others])
+        Weight.objects.filter(id__in=[other.id for other in others]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('diet_app', '0018_product_usage'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_weights, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='weight',
+            name='diet_app_weight_user_date',
+        ),
+        migrations.AlterUniqueTogether(
+            name='weight',
+            unique_together={('user', 'date')},
+        ),
+    ]
@@ -1,9 +1,36 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce, ExtractHour, ExtractMinute, ExtractSecond, Length
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+from diet_app.ranking import add_use, product_ranking_options, score, usage_ranks
+from diet_app.search import PRODUCT_SEARCH_TABLE, has_product_search_index, match_expression, normalize_name
 
-class Profile(User):
-    """Class represents a user of the app."""
+
+class ProfileQuerySet(models.QuerySet):
+    def with_user(self, *fields):
+        """Joins users, loading only given fields of the user besides the profile."""
+        return self.select_related('user').only(*[field.name for field in self.model._meta.concrete_fields],
+                                                *['user__' + field for field in fields])
+
+
+class ProfileManager(models.Manager.from_queryset(ProfileQuerySet)):
+    def create_user(self, username, email=None, password=None, **fields):
+        """Creates user with hashed password and their profile with given fields."""
+        with transaction.atomic(using=self.db, savepoint=False):
+            user = User.objects.db_manager(self.db).create_user(username, email, password)
+            return self.create(user=user, **fields)
+
+
+class Profile(models.Model):
+    """Class represents a user of the app.
+
+    Primary key is the id of the user, so profiles are looked up without joining users. The column keeps the
+    name it had when profiles inherited from users.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, db_column='user_ptr_id',
+                                related_name='profile')
+    """The user."""
     height = models.IntegerField(null=True, blank=True)
     """The height of the user."""
     gender = models.CharField(max_length=1, blank=True)
@@ -16,21 +43,114 @@ class Profile(User):
     """Daily user fats cap."""
     daily_proteins = models.FloatField(null=True, blank=True)
     """Daily user proteins cap."""
-    User._meta.get_field('email')._unique = True
+    updated_at = models.DateTimeField(auto_now=True)
+    """When the profile was changed last time."""
+
+    objects = ProfileManager()
+
+    @property
+    def id(self):
+        """Id of the user."""
+        return self.user_id
+
+    def __str__(self):
+        """String representation of an object"""
+        return self.user.username
+
+
+User._meta.get_field('email')._unique = True
+
+
+class WeightManager(models.Manager):
+    def record(self, values):
+        """Saves weights from given values by (user id, date), replacing values the users gave for these dates
+        before. Returns saved weights by (user id, date).
+
+        Runs a query for existing weights, one update of all changed values, one insert of new weights and one
+        query for the saved weights.
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            missing = self.replace(values)
+            if not missing:
+                return self.current(values)
+            try:
+                with transaction.atomic(using=self.db):
+                    self.bulk_create([Weight(user_id=user_id, date=date, value=value)
+                                      for (user_id, date), value in missing.items()])
+
+            except IntegrityError:
+                # Another request created some of the weights after they were read, they can be replaced now.
+                missing = self.replace(missing)
+                self.bulk_create([Weight(user_id=user_id, date=date, value=value)
+                                  for (user_id, date), value in missing.items()])
+            return self.current(values)
+
+    def replace(self, values):
+        """Sets changed values of existing weights in a single update, returns the values without weight."""
+        current = self.current(values)
+        changed = {weight.pk: values[key] for key, weight in current.items() if weight.value != values[key]}
+        if changed:
+            self.filter(pk__in=changed).update(
+                value=models.Case(*[models.When(pk=pk, then=models.Value(value)) for pk, value in changed.items()],
+                                  output_field=models.FloatField()),
+                updated_at=timezone.now())
+        return {key: value for key, value in values.items() if key not in current}
+
+    def current(self, keys):
+        """Returns existing weights of given (user id, date) pairs by pair, locking them."""
+        rows = self.select_for_update().filter(user_id__in={user_id for user_id, _ in keys},
+                                               date__in={date for _, date in keys})
+        return {(weight.user_id, weight.date): weight for weight in rows if (weight.user_id, weight.date) in keys}
 
 
 class Weight(models.Model):
-    """Class represents weights of the user"""
+    """Class represents weight of the user in one day"""
     user = models.ForeignKey(Profile, on_delete=models.CASCADE)
     """ID of the user"""
     value = models.FloatField()
     """User weight"""
     date = models.DateField()
     """Date when weight was given"""
+    updated_at = models.DateTimeField(auto_now=True)
+    """When the weight was changed last time"""
+    objects = WeightManager()
+
+    class Meta:
+        unique_together = ('user', 'date')
 
     def __str__(self):
         """String representation of an object"""
-        return '{}. Weight of {} from {}'.format(self.id, self.user.username, self.date)
+        return '{}. Weight of {} from {}'.format(self.id, self.user, self.date)
+
+
+class DiaryQuerySet(models.QuerySet):
+    def touch(self):
+        """Marks diaries as changed and refreshes their daily summaries.
+
+        Has to be called whenever their meals or activities change, after the change is saved.
+        """
+        updated = self.update(updated_at=timezone.now())
+        self.summarize()
+        return updated
+
+    def summarize(self):
+        """Creates missing daily summaries of diaries and recalculates all of them."""
+        with transaction.atomic(using=self.db, savepoint=False):
+            missing = self.missing_summaries()
+            if missing:
+                try:
+                    with transaction.atomic(using=self.db):
+                        DailySummary.objects.using(self.db).bulk_create(missing)
+                except IntegrityError:
+                    # Another request created some of the summaries after they were read, only the rest are created.
+                    DailySummary.objects.using(self.db).bulk_create(self.missing_summaries())
+            return DailySummary.objects.filter(diary__in=self).refresh()
+
+    def missing_summaries(self):
+        """Returns unsaved empty daily summaries of diaries which don't have one."""
+        missing = self.filter(dailysummary__isnull=True).values_list('id', 'user_id', 'date')
+        return [DailySummary(diary_id=diary_id, user_id=user_id, date=date)
+                for diary_id, user_id, date in missing]
 
 
 class Diary(models.Model):
@@ -39,6 +159,12 @@ class Diary(models.Model):
     """ID of the user"""
     date = models.DateField()
     """Date of the diary"""
+    updated_at = models.DateTimeField(auto_now=True)
+    """When the diary, its meals or activities were changed last time"""
+    objects = DiaryQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('user', 'date')
 
     def __str__(self):
         """String representation of an object"""
@@ -51,16 +177,34 @@ class MealType(models.Model):
     """ID of the diary"""
     name = models.CharField(max_length=30)
     """Name of meal (eg. breakfast, lunch, dinner)"""
+    updated_at = models.DateTimeField(auto_now=True)
+    """When the meal type was changed last time"""
+
+    class Meta:
+        unique_together = ('diary', 'name')
 
     def __str__(self):
         """String representation of an object"""
         return '{}. {}'.format(self.id, self.name)
 
 
+class MealQuerySet(models.QuerySet):
+    def update_totals(self):
+        """Recalculates meals nutrient totals from their ingredients in a single query."""
+        totals = {}
+        for field in ['kcal', 'carbs', 'proteins', 'fat']:
+            ingredients = Ingredient.objects.filter(meal=models.OuterRef('pk')).values('meal')
+            total = ingredients.annotate(total=models.Sum(models.F('amount') * models.F('product__' + field) / 100))
+            totals['total_' + field] = Coalesce(models.Subquery(total.values('total'), output_field=models.FloatField()),
+                                                 0.0)
+        return self.update(updated_at=timezone.now(), **totals)
+
+
 class Meal(models.Model):
     """Class represents information about meal"""
-    meal_type = models.ForeignKey(MealType, on_delete=models.CASCADE)
+    meal_type = models.OneToOneField(MealType, on_delete=models.CASCADE)
     """ID of the meal type"""
+    objects = MealQuerySet.as_manager()
     total_kcal = models.FloatField(null=True, blank=True)
     """Meal calories"""
     total_carbs = models.FloatField(null=True, blank=True)
@@ -69,16 +213,59 @@ class Meal(models.Model):
     """Meal proteins"""
     total_fat = models.FloatField(null=True, blank=True)
     """Meal fats"""
+    updated_at = models.DateTimeField(auto_now=True)
+    """When the meal was changed last time"""
 
     def __str__(self):
         """String representation of an object"""
         return '{}. {}'.format(self.id, self.meal_type.name)
 
 
+class SearchNameQuerySet(models.QuerySet):
+    """Queryset of models with search_name field keeping normalized name, filled also by bulk operations."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.search_name = normalize_name(obj.name)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if 'name' in kwargs:
+            kwargs['search_name'] = normalize_name(kwargs['name'])
+        return super().update(**kwargs)
+
+    def matching(self, name):
+        """Returns objects with names containing given text, ignoring case, accents and punctuation."""
+        return self.filter(search_name__contains=normalize_name(name))
+
+
+class ProductQuerySet(SearchNameQuerySet):
+    def search(self, name):
+        """Returns products with names containing given text, prefix matches and shorter names first.
+
+        Case, accents and punctuation are ignored.
+        """
+        name = normalize_name(name)
+        if len(name) >= 3 and has_product_search_index(self.db):
+            products = self.extra(where=['{0}.id IN (SELECT rowid FROM {1} WHERE {1} MATCH %s)'.format(
+                Product._meta.db_table, PRODUCT_SEARCH_TABLE)], params=[match_expression(name)])
+        else:
+            products = self.filter(search_name__contains=name)
+
+        rank = models.Case(models.When(search_name__startswith=name, then=0),
+                           models.When(search_name__contains=' ' + name, then=1),
+                           default=2, output_field=models.IntegerField())
+        return products.annotate(rank=rank, name_length=Length('name')).order_by('rank', 'name_length', 'id')
+
+
 class Product(models.Model):
     """Class represent information about product"""
     name = models.CharField(max_length=30)
     """Name of the product"""
+    search_name = models.CharField(max_length=60, db_index=True, editable=False)
+    """Name normalized by normalize_name, for searching"""
+    objects = ProductQuerySet.as_manager()
     kcal = models.FloatField()
     """Calories of product in 100g"""
     carbs = models.FloatField()
@@ -88,6 +275,11 @@ class Product(models.Model):
     fat = models.FloatField()
     """Fats of product"""
 
+    def save(self, *args, **kwargs):
+        """Saves product, updating its normalized name"""
+        self.search_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """String representation of an object"""
         return '{}. {}'.format(self.id, self.name)
@@ -100,19 +292,126 @@ class Ingredient(models.Model):
     meal = models.ForeignKey(Meal, null=True, on_delete=models.CASCADE)
     """ID of the meal"""
     amount = models.FloatField()
-    """How much user ate of given product"""
+    """How much user ate of given product in grams"""
+    updated_at = models.DateTimeField(auto_now=True)
+    """When the ingredient was changed last time"""
 
     def __str__(self):
         """String representation of an object"""
         return '{}. {}'.format(self.id, self.product.name)
 
 
+class ProductUsageManager(models.Manager):
+    def record(self, ingredients, when=None):
+        """Counts products of created ingredients as used at given time (now by default) by owners of their meals.
+
+        Runs a query for owners, one for current ranks, one update of all changed ranks and one insert of new ones.
+        """
+        when = when or timezone.now()
+        owners = dict(Meal.objects.using(self.db).filter(id__in={ingredient.meal_id for ingredient in ingredients})
+                      .values_list('id', 'meal_type__diary__user_id'))
+        ranks = usage_ranks([(owners[ingredient.meal_id], ingredient.product_id, when)
+                             for ingredient in ingredients if ingredient.meal_id in owners])
+        if not ranks:
+            return
+
+        with transaction.atomic(using=self.db, savepoint=False):
+            missing = self.add_uses(ranks, when)
+            if not missing:
+                return
+            try:
+                with transaction.atomic(using=self.db):
+                    self.bulk_create([ProductUsage(user_id=user_id, product_id=product_id, uses=count,
+                                                   last_used=last_used, rank=rank)
+                                      for (user_id, product_id), (count, last_used, rank) in missing.items()])
+
+            except IntegrityError:
+                # Another request created some of the rows after they were read, they can be updated now.
+                missing = self.add_uses(missing, when)
+                self.bulk_create([ProductUsage(user_id=user_id, product_id=product_id, uses=count,
+                                               last_used=last_used, rank=rank)
+                                  for (user_id, product_id), (count, last_used, rank) in missing.items()])
+
+    def add_uses(self, ranks, when):
+        """Adds uses from usage_ranks() result to existing rows in a single update, returns the ones without row."""
+        half_life = product_ranking_options()['HALF_LIFE']
+        current = self.current(ranks)
+        uses, new_ranks = [], []
+        for key, (pk, rank) in current.items():
+            count = ranks[key][0]
+            for _ in range(count):
+                rank = add_use(rank, when, half_life)
+            uses.append(models.When(pk=pk, then=models.Value(count)))
+            new_ranks.append(models.When(pk=pk, then=models.Value(rank)))
+        if current:
+            self.filter(pk__in=[pk for pk, _ in current.values()]).update(
+                uses=models.F('uses') + models.Case(*uses, output_field=models.IntegerField()),
+                rank=models.Case(*new_ranks, output_field=models.FloatField()),
+                last_used=when)
+        return {key: value for key, value in ranks.items() if key not in current}
+
+    def current(self, keys):
+        """Returns ids and ranks of existing rows of given (user id, product id) pairs by pair, locking them."""
+        rows = self.select_for_update().filter(user_id__in={user_id for user_id, _ in keys},
+                                               product_id__in={product_id for _, product_id in keys})
+        return {(user_id, product_id): (pk, rank)
+                for pk, user_id, product_id, rank in rows.values_list('pk', 'user_id', 'product_id', 'rank')
+                if (user_id, product_id) in keys}
+
+    def rebuild(self):
+        """Recalculates ranks of all products from ingredient history, taking the time of the last change of an
+        ingredient as the time of its use."""
+        uses = Ingredient.objects.using(self.db).filter(meal__isnull=False).values_list(
+            'meal__meal_type__diary__user_id', 'product_id', 'updated_at')
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            self.bulk_create([ProductUsage(user_id=user_id, product_id=product_id, uses=count, last_used=last_used,
+                                           rank=rank)
+                              for (user_id, product_id), (count, last_used, rank) in
+                              usage_ranks(uses.iterator()).items()], batch_size=500)
+
+
+class ProductUsage(models.Model):
+    """Class represents how often and how recently user ate a product, maintained as ingredients are created"""
+    user = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    """ID of the user"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    """ID of the product"""
+    uses = models.IntegerField()
+    """How many times user added the product to meals"""
+    last_used = models.DateTimeField()
+    """When user added the product last time"""
+    rank = models.FloatField()
+    """Logarithm of decayed number of uses, see diet_app.ranking.add_use"""
+    objects = ProductUsageManager()
+
+    class Meta:
+        unique_together = ('user', 'product')
+        indexes = [models.Index(fields=['user', '-rank'], name='diet_app_usage_user_rank')]
+
+    def score(self, now=None):
+        """Number of uses, each one counting half per half-life since it happened."""
+        return score(self.rank, now or timezone.now())
+
+    def __str__(self):
+        """String representation of an object"""
+        return '{}. Product {} used by {}'.format(self.id, self.product_id, self.user_id)
+
+
 class Discipline(models.Model):
     """Class represents how much discipline burn calories an hour"""
     name = models.CharField(max_length=30)
     """Name of discipline"""
+    search_name = models.CharField(max_length=60, db_index=True, editable=False)
+    """Name normalized by normalize_name, for searching"""
     calories_burn = models.FloatField()
     """Calories burnt per hour by discipline"""
+    objects = SearchNameQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        """Saves discipline, updating its normalized name"""
+        self.search_name = normalize_name(self.name)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         """String representation of an object"""
@@ -122,6 +421,19 @@ class Discipline(models.Model):
         return {'id': self.id, 'name': self.name}
 
 
+class ActivityQuerySet(models.QuerySet):
+    @staticmethod
+    def burned_kcal():
+        """Returns expression of calories burnt during activity."""
+        seconds = ExtractHour('time') * 3600 + ExtractMinute('time') * 60 + ExtractSecond('time')
+        return models.ExpressionWrapper(models.F('discipline__calories_burn') * seconds / 3600.0,
+                                        output_field=models.FloatField())
+
+    def with_burned_kcal(self):
+        """Annotates activities with calories burnt during them."""
+        return self.annotate(burned_kcal=self.burned_kcal())
+
+
 class Activity(models.Model):
     """Class represent how long, and what discipline user was doing"""
     diary = models.ForeignKey(Diary, on_delete=models.CASCADE)
@@ -130,7 +442,107 @@ class Activity(models.Model):
     """ID of the discipline"""
     time = models.TimeField()
     """How long user was training"""
+    updated_at = models.DateTimeField(auto_now=True)
+    """When the activity was changed last time"""
+    objects = ActivityQuerySet.as_manager()
 
     def __str__(self):
         """String representation of an object"""
         return '{}. {} from {}'.format(self.id, self.discipline.name, self.diary.id)
+
+
+class DailySummaryQuerySet(models.QuerySet):
+    def refresh(self):
+        """Recalculates summaries from meal totals and activities of their diaries in a single query."""
+        totals = {}
+        for field in ['kcal', 'carbs', 'proteins', 'fat']:
+            meals = Meal.objects.filter(meal_type__diary=models.OuterRef('diary')).values('meal_type__diary')
+            total = meals.annotate(total=models.Sum('total_' + field))
+            totals[field] = Coalesce(models.Subquery(total.values('total'), output_field=models.FloatField()), 0.0)
+
+        activities = Activity.objects.filter(diary=models.OuterRef('diary')).values('diary')
+        total = activities.annotate(total=models.Sum(ActivityQuerySet.burned_kcal()))
+        totals['burned_kcal'] = Coalesce(models.Subquery(total.values('total'), output_field=models.FloatField()),
+                                         0.0)
+        return self.update(updated_at=timezone.now(), **totals)
+
+
+class DailySummary(models.Model):
+    """Class represents nutrients eaten and calories burnt by the user in one day, calculated from the diary"""
+    user = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    """ID of the user"""
+    date = models.DateField()
+    """Date of the diary"""
+    diary = models.OneToOneField(Diary, on_delete=models.CASCADE)
+    """ID of the summarized diary"""
+    kcal = models.FloatField(default=0)
+    """Calories of all meals"""
+    carbs = models.FloatField(default=0)
+    """Carbs of all meals"""
+    proteins = models.FloatField(default=0)
+    """Proteins of all meals"""
+    fat = models.FloatField(default=0)
+    """Fats of all meals"""
+    burned_kcal = models.FloatField(default=0)
+    """Calories burnt during all activities"""
+    updated_at = models.DateTimeField(auto_now=True)
+    """When the summary was recalculated last time"""
+    objects = DailySummaryQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('user', 'date')
+
+    def __str__(self):
+        """String representation of an object"""
+        return '{}. Summary of {} from {}'.format(self.id, self.user_id, self.date)
+
+
+class TombstoneManager(models.Manager):
+    def bury(self, objects):
+        """Creates tombstones of objects of given queryset and of the objects deleted together with them.
+
+        Has to be called before deleting them, in the same transaction. Runs one query per synced model that
+        the deletion cascades to, with owners joined, and one insert.
+        """
+        tombstones = []
+        pending = [objects]
+        while pending:
+            objects = pending.pop()
+            lookup, children = SYNCED_MODELS[objects.model]
+            tombstones.extend(Tombstone(user_id=user_id, model=objects.model._meta.model_name, object_id=pk)
+                              for pk, user_id in objects.values_list('pk', lookup) if user_id is not None)
+            pending.extend(child.objects.filter(**{foreign_key + '__in': objects.values('pk')})
+                           for child, foreign_key in children)
+        return self.bulk_create(tombstones)
+
+
+class Tombstone(models.Model):
+    """Class represents a deleted diary, meal type, meal, ingredient, activity or weight, kept for sync"""
+    user = models.ForeignKey(Profile, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    """ID of the user who owned the deleted object"""
+    model = models.CharField(max_length=30)
+    """Name of the model of the deleted object"""
+    object_id = models.IntegerField()
+    """ID of the deleted object"""
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    """When the object was deleted"""
+    objects = TombstoneManager()
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'deleted_at'], name='diet_app_tombstone_user_time')]
+
+    def __str__(self):
+        """String representation of an object"""
+        return '{}. Deleted {} {}'.format(self.id, self.model, self.object_id)
+
+
+SYNCED_MODELS = {
+    Diary: ('user_id', [(MealType, 'diary'), (Activity, 'diary')]),
+    Weight: ('user_id', []),
+    MealType: ('diary__user_id', [(Meal, 'meal_type')]),
+    Activity: ('diary__user_id', []),
+    Meal: ('meal_type__diary__user_id', [(Ingredient, 'meal')]),
+    Ingredient: ('meal__meal_type__diary__user_id', []),
+}
+"""Models returned by /api/sync/: lookup of the id of the user owning their object and models deleted together
+with it by foreign key."""
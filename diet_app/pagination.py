@@ -0,0 +1,90 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+MAX_PAGE_SIZE = 1000
+"""Maximum number of items client can request on one page."""
+
+
+def encode_cursor(values):
+    """Returns opaque cursor for given ordering key values."""
+    return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns ordering key values from given cursor."""
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+
+class CursorPaginationSerializer(serializers.Serializer):
+    """Base serializer for list endpoints paginated with limit and cursor parameters.
+
+    Items are returned in ``ordering`` (ascending, must end with an unique field) and each page continues
+    right after the ordering key stored in the cursor, so database work does not depend on page number.
+    """
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=MAX_PAGE_SIZE)
+    cursor = serializers.CharField(required=False)
+    ordering = ('id',)
+    """Fields that define items order."""
+    page_size = 100
+    """Number of items returned if client does not give limit."""
+    next_cursor = None
+    """Cursor of the next page, set when there are more items."""
+
+    def validate_cursor(self, value):
+        try:
+            values = decode_cursor(value)
+
+        except ValueError:
+            raise serializers.ValidationError('Invalid cursor.')
+
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise serializers.ValidationError('Invalid cursor.')
+        return values
+
+    def paginate(self, queryset, instance):
+        """Returns items of the page described by limit and cursor in instance."""
+        limit = instance.get('limit', self.page_size)
+        cursor = instance.get('cursor')
+        if cursor is not None:
+            try:
+                queryset = queryset.filter(self.after(cursor))
+
+            except (TypeError, ValueError, ValidationError):
+                # Values of a well formed cursor can still have wrong types, which shows only when they are
+                # converted to the types of the ordering fields.
+                raise serializers.ValidationError({'cursor': ['Invalid cursor.']})
+
+        items = list(queryset.order_by(*self.ordering)[:limit + 1])
+        if len(items) > limit:
+            items = items[:limit]
+            self.next_cursor = encode_cursor([getattr(items[-1], field) for field in self.ordering])
+        return items
+
+    def after(self, values):
+        """Returns condition selecting items placed after given ordering key values."""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            previous = {self.ordering[j]: values[j] for j in range(i)}
+            condition |= Q(**previous, **{field + '__gt': values[i]})
+        return condition
+
+    @property
+    def data(self):
+        return super(serializers.Serializer, self).data
+
+
+def paginated_response(request, serializer):
+    """Returns response with serializer data and link to the next page if there is one."""
+    data = serializer.data
+    headers = {}
+    if serializer.next_cursor is not None:
+        url = replace_query_param(request.build_absolute_uri(), 'cursor', serializer.next_cursor)
+        headers['Link'] = '<{}>; rel="next"'.format(url)
+    return Response(data, headers=headers)
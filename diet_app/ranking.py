@@ -0,0 +1,62 @@
+import datetime
+import math
+
+from django.conf import settings
+from django.utils import timezone
+
+DEFAULT_PRODUCT_RANKING = {
+    'HALF_LIFE': 7,
+}
+"""Default product ranking settings, overridden by PRODUCT_RANKING setting.
+
+HALF_LIFE is the number of days after which a use of a product counts half. Ranks stored with one half-life are
+not comparable with ranks computed with another, so ProductUsage.objects.rebuild() has to be run after changing it.
+"""
+
+EPOCH = datetime.datetime(2017, 1, 1, tzinfo=timezone.utc)
+"""Time from which ranks are measured."""
+
+
+def product_ranking_options():
+    return dict(DEFAULT_PRODUCT_RANKING, **getattr(settings, 'PRODUCT_RANKING', {}))
+
+
+def half_lives(when, half_life=None):
+    """Returns the number of half-lives between EPOCH and given time."""
+    if half_life is None:
+        half_life = product_ranking_options()['HALF_LIFE']
+    return (when - EPOCH).total_seconds() / (half_life * 24 * 60 * 60)
+
+
+def add_use(rank, when, half_life=None):
+    """Returns rank of a product used once more at given time, rank is None for a product not used before.
+
+    Score of a product is the sum of 2 ** -(age of use in half-lives) over its uses, which decays with time
+    but keeps the order of products between their uses. Rank is the binary logarithm of the score multiplied
+    by 2 ** (half-lives since EPOCH), i.e. of the sum of 2 ** (half-lives between EPOCH and use), so it
+    doesn't change while time passes, ranks of products used at different times can be compared directly and
+    stay small enough for floats.
+    """
+    used = half_lives(when, half_life)
+    if rank is None:
+        return used
+    high, low = max(rank, used), min(rank, used)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def score(rank, now, half_life=None):
+    """Returns decayed score of a product with given rank at given time: the number of its uses, each one
+    counting half per half-life since it happened."""
+    return 2 ** (rank - half_lives(now, half_life))
+
+
+def usage_ranks(uses, half_life=None):
+    """Returns number of uses, time of the last use and rank of products by (user id, product id) for given
+    (user id, product id, time) triples, in any order."""
+    if half_life is None:
+        half_life = product_ranking_options()['HALF_LIFE']
+    ranks = {}
+    for user_id, product_id, when in uses:
+        count, last_used, rank = ranks.get((user_id, product_id), (0, when, None))
+        ranks[user_id, product_id] = (count + 1, max(last_used, when), add_use(rank, when, half_life))
+    return ranks
@@ -0,0 +1,105 @@
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DEFAULT_JSON = {
+    'BACKEND': 'auto',
+}
+"""Default JSON settings, overridden by JSON setting."""
+
+encoder = JSONEncoder()
+"""REST framework encoder, used for values the backends don't support (decimals, lazy strings, querysets)."""
+
+
+def json_options():
+    return dict(DEFAULT_JSON, **getattr(settings, 'JSON', {}))
+
+
+def default(value):
+    """Converts value not supported by the backend. Dates and times are written like orjson writes them."""
+    if isinstance(value, datetime.datetime):
+        text = value.isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return encoder.default(value)
+
+
+def reject_constant(constant):
+    raise ValueError('Out of range float value "{}" is not valid JSON.'.format(constant))
+
+
+def json_dumps(data):
+    return json.dumps(data, default=default, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+
+
+def json_loads(content):
+    return json.loads(content, parse_constant=reject_constant)
+
+
+def orjson_dumps(data):
+    return orjson.dumps(data, default=default, option=orjson.OPT_UTC_Z)
+
+
+BACKENDS = {
+    'json': (json_dumps, json_loads),
+}
+"""Available JSON backends by name, as pairs of functions encoding data to bytes and decoding bytes."""
+
+if orjson is not None:
+    BACKENDS['orjson'] = (orjson_dumps, orjson.loads)
+
+
+def backend():
+    """Returns encoding and decoding functions of the backend chosen by JSON['BACKEND'].
+
+    'auto' uses orjson when it is installed and the standard library json module otherwise.
+    """
+    name = json_options()['BACKEND']
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in BACKENDS else 'json'
+    try:
+        return BACKENDS[name]
+
+    except KeyError:
+        raise ImproperlyConfigured('JSON backend "{}" is not available, use one of: auto, {}.'.format(
+            name, ', '.join(sorted(BACKENDS))))
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """Renders compact JSON with the configured backend. Indented output, requested with Accept header parameter,
+    is rendered by REST framework."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        content = backend()[0](data)
+        # Like REST framework, escape line separators that are valid in JSON but not in JavaScript.
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+
+class FastJSONParser(parsers.JSONParser):
+    """Parses JSON request body with the configured backend."""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return backend()[1](stream.read())
+
+        except ValueError as exc:
+            raise ParseError('JSON parse error - {}'.format(exc))
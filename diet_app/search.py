@@ -0,0 +1,35 @@
+import re
+import unicodedata
+
+from django.db import connections
+
+PRODUCT_SEARCH_TABLE = 'diet_app_product_search'
+"""SQLite FTS5 trigram index over normalized product names, kept in sync with triggers."""
+
+_WORD = re.compile(r'\w+')
+
+_search_index_tables = {}
+
+
+def has_product_search_index(using):
+    """Checks whether the product search index exists in given database."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+
+    key = (using, connection.settings_dict['NAME'])
+    if key not in _search_index_tables:
+        _search_index_tables[key] = PRODUCT_SEARCH_TABLE in connection.introspection.table_names()
+    return _search_index_tables[key]
+
+
+def match_expression(text):
+    """Returns FTS5 query matching given text as a phrase."""
+    return '"{}"'.format(text.replace('"', '""'))
+
+
+def normalize_name(name):
+    """Returns name case folded, without accents (including Polish ł, which Unicode doesn't decompose) and with
+    words separated by single spaces, for case and accent insensitive matching."""
+    decomposed = unicodedata.normalize('NFKD', name.casefold()).replace('ł', 'l')
+    return ' '.join(_WORD.findall(''.join(char for char in decomposed if not unicodedata.combining(char))))
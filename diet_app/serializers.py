@@ -1,9 +1,48 @@
+import datetime
+from collections import OrderedDict
+
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Prefetch, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.serializers import ListSerializer
 
+from diet_app.authentication import issue_token
+from diet_app.autocomplete import products_index
+from diet_app.cache import disciplines_cache, products_cache
+from diet_app.goals import NUTRIENTS, evaluate
 from diet_app.models import *
+from diet_app.pagination import CursorPaginationSerializer
+from diet_app.timeseries import largest_triangle_three_buckets, moving_average
+from diet_app.utils import *
+
+
+class BulkCreateListSerializer(ListSerializer):
+    def create(self, validated_data):
+        with transaction.atomic():
+            instances = bulk_create(self.child.model, [self.child.model(**attrs) for attrs in validated_data])
+            self.child.bulk_created(instances)
+        return instances
+
+    def to_representation(self, data):
+        key = '{}_id'.format(self.child.model._meta.model_name)
+        return [{key: instance.id} for instance in data]
+
+
+class BulkCreateSerializer(serializers.Serializer):
+    """Base serializer of objects that can also be created in batches."""
+    model = None
+    """Model of created objects."""
+
+    class Meta:
+        list_serializer_class = BulkCreateListSerializer
+
+    def bulk_created(self, instances):
+        """Called after batch of instances was inserted in the same transaction."""
+        pass
 
 
 class DiarySerializer(serializers.Serializer):
@@ -18,25 +57,145 @@ class DiarySerializer(serializers.Serializer):
         except ObjectDoesNotExist:
             return {}
 
+
+class DiaryCreateSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    date = serializers.DateField()
+
+    def to_representation(self, instance):
+        return {'diary_id': instance.id}
+
     def create(self, validated_data):
         return Diary.objects.get_or_create(**validated_data)[0]
 
 
+class DiarySnapshotSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+
+    def to_representation(self, instance):
+        try:
+            diary = Diary.objects.select_related('user').get(**instance)
+
+        except ObjectDoesNotExist:
+            return {}
+
+        meal_types = prefetch_meals(MealType.objects.filter(diary=diary))
+        activities = Activity.objects.filter(diary=diary).select_related('discipline').with_burned_kcal().order_by('id')
+        totals = {'kcal': 0, 'carbs': 0, 'proteins': 0, 'fat': 0, 'burned_kcal': 0}
+        meal_types_list = []
+        for meal_type in meal_types:
+            data = meal_type_representation(meal_type, macros=True)
+            for total in ['kcal', 'carbs', 'proteins', 'fat']:
+                totals[total] += data['total_' + total] or 0
+            meal_types_list.append(data)
+
+        activities_list = []
+        for activity in activities:
+            totals['burned_kcal'] += activity.burned_kcal
+            activities_list.append(activity_representation(activity))
+
+        return {'diary_id': diary.id,
+                'date': diary.date,
+                'meal_types': meal_types_list,
+                'activities': activities_list,
+                'totals': totals,
+                'caps': {'kcal': diary.user.daily_kcal,
+                         'carbs': diary.user.daily_carbs,
+                         'proteins': diary.user.daily_proteins,
+                         'fat': diary.user.daily_fat}}
+
+
+class DailySummariesSerializer(CursorPaginationSerializer):
+    user_id = serializers.IntegerField()
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    ordering = ('date',)
+
+    def validate(self, attrs):
+        if 'date_from' in attrs and 'date_to' in attrs and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_to': 'Must not be earlier than date_from.'})
+        return attrs
+
+    def to_representation(self, instance):
+        summaries = DailySummary.objects.filter(user_id=instance.get('user_id'))
+        if 'date_from' in instance:
+            summaries = summaries.filter(date__gte=instance.get('date_from'))
+        if 'date_to' in instance:
+            summaries = summaries.filter(date__lte=instance.get('date_to'))
+
+        return [{'date': summary.date,
+                 'kcal': summary.kcal,
+                 'carbs': summary.carbs,
+                 'proteins': summary.proteins,
+                 'fat': summary.fat,
+                 'burned_kcal': summary.burned_kcal} for summary in self.paginate(summaries, instance)
+                ]
+
+
+class GoalsSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    max_days = 366
+
+    def validate(self, attrs):
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'date_to': 'Must not be earlier than date_from.'})
+        if (attrs['date_to'] - attrs['date_from']).days >= self.max_days:
+            raise serializers.ValidationError({'date_to': 'Range must not be longer than {} days.'.format(
+                self.max_days)})
+        return attrs
+
+    def to_representation(self, instance):
+        caps = Profile.objects.filter(pk=instance.get('user_id')).values_list(
+            'daily_kcal', 'daily_carbs', 'daily_proteins', 'daily_fat').first()
+        if caps is None:
+            return {}
+
+        date_from = instance.get('date_from')
+        dates = [date_from + datetime.timedelta(days=day)
+                 for day in range((instance.get('date_to') - date_from).days + 1)]
+        logged = [False] * len(dates)
+        intake = [[0.0] * len(NUTRIENTS) for _ in dates]
+        days = [{'date': date, 'logged': False, 'kcal': 0.0, 'carbs': 0.0, 'proteins': 0.0, 'fat': 0.0,
+                 'burned_kcal': 0.0} for date in dates]
+        summaries = DailySummary.objects.filter(user_id=instance.get('user_id'), date__gte=date_from,
+                                                date__lte=instance.get('date_to'))
+        for summary in summaries.values('date', 'kcal', 'carbs', 'proteins', 'fat', 'burned_kcal'):
+            day = (summary['date'] - date_from).days
+            logged[day] = summary['logged'] = True
+            # Calories burnt during activities are added to the calories cap.
+            intake[day] = [summary['kcal'] - summary['burned_kcal'], summary['carbs'], summary['proteins'],
+                           summary['fat']]
+            days[day] = summary
+
+        percents, adherence, streaks, deficits = evaluate(caps, logged, intake)
+        for day, percent in zip(days, percents):
+            day['percents'] = dict(zip(NUTRIENTS, percent))
+        return {'caps': dict(zip(NUTRIENTS, caps)),
+                'days': days,
+                'adherence': dict(zip(NUTRIENTS, adherence)),
+                'streaks': dict(zip(NUTRIENTS, streaks)),
+                'deficits': dict(zip(NUTRIENTS, deficits))}
+
+
 class ActivityGetSerializer(serializers.Serializer):
     id = serializers.IntegerField()
 
     def to_representation(self, instance):
         try:
             activity = Activity.objects.get(**instance)
-            return {'name': activity.discipline.name,
-                    'calories_burn': activity.discipline.calories_burn,
+            discipline = disciplines_cache.get(activity.discipline_id)
+            return {'name': discipline['name'],
+                    'calories_burn': discipline['calories_burn'],
                     'time': activity.time}
 
         except ObjectDoesNotExist:
             return {}
 
 
-class ActivityCreateSerializer(serializers.Serializer):
+class ActivityCreateSerializer(BulkCreateSerializer):
+    model = Activity
     diary_id = serializers.IntegerField()
     discipline_id = serializers.IntegerField()
     time = serializers.TimeField()
@@ -44,8 +203,14 @@ class ActivityCreateSerializer(serializers.Serializer):
     def to_representation(self, instance):
         return {}
 
+    def bulk_created(self, instances):
+        Diary.objects.filter(id__in={instance.diary_id for instance in instances}).touch()
+
     def create(self, validated_data):
-        return Activity.objects.get_or_create(**validated_data)[0]
+        with transaction.atomic():
+            activity = Activity.objects.get_or_create(**validated_data)[0]
+            Diary.objects.filter(id=validated_data.get('diary_id')).touch()
+        return activity
 
 
 class ActivityDeleteSerializer(serializers.Serializer):
@@ -55,51 +220,51 @@ class ActivityDeleteSerializer(serializers.Serializer):
         return {}
 
     def delete(self, validated_data):
-        Activity.objects.filter(**validated_data).delete()
+        with transaction.atomic():
+            diaries = Diary.objects.filter(activity__id=validated_data.get('id'))
+            diary_ids = list(diaries.values_list('id', flat=True))
+            activities = Activity.objects.filter(**validated_data)
+            Tombstone.objects.bury(activities)
+            activities.delete()
+            Diary.objects.filter(id__in=diary_ids).touch()
 
 
-class ActivitiesListSerializer(serializers.Serializer):
+class ActivitiesListSerializer(CursorPaginationSerializer):
     diary_id = serializers.IntegerField()
 
-    def to_representation(self, instance):
-        activities = Activity.objects.filter(**instance)
-        return [{'name': activity.discipline.name,
-                 'calories_burn': activity.discipline.calories_burn,
-                 'time': activity.time} for activity in activities
-                ]
+    def total_burned_kcal(self):
+        """Returns calories burnt during all activities of the diary, not only the ones on the page."""
+        activities = Activity.objects.filter(diary_id=self.validated_data.get('diary_id'))
+        return activities.aggregate(total=Coalesce(Sum(ActivityQuerySet.burned_kcal()), 0.0))['total']
 
-    @property
-    def data(self):
-        return super(serializers.Serializer, self).data
+    def to_representation(self, instance):
+        activities = Activity.objects.filter(diary_id=instance.get('diary_id')).select_related('discipline')
+        return [activity_representation(activity)
+                for activity in self.paginate(activities.with_burned_kcal(), instance)]
 
 
 class DisciplineSerializer(serializers.Serializer):
     id = serializers.IntegerField()
 
     def to_representation(self, instance):
-        try:
-            discipline = Discipline.objects.get(**instance)
-            return {'name': discipline.name,
-                    'calories_burn': discipline.calories_burn}
-
-        except ObjectDoesNotExist:
+        discipline = disciplines_cache.get(instance.get('id'))
+        if discipline is None:
             return {}
 
+        return {'name': discipline['name'],
+                'calories_burn': discipline['calories_burn']}
+
 
-class DisciplinesSerializer(serializers.Serializer):
+class DisciplinesSerializer(CursorPaginationSerializer):
     name = serializers.CharField(max_length=30)
 
     def to_representation(self, instance):
-        disciplines = Discipline.objects.filter(name__contains='{}'.format(instance.get('name')))
+        disciplines = self.paginate(Discipline.objects.matching(instance.get('name')), instance)
         return [{'id': discipline.id,
                  'name': discipline.name,
                  'calories_burn': discipline.calories_burn} for discipline in disciplines
                 ]
 
-    @property
-    def data(self):
-        return super(serializers.Serializer, self).data
-
 
 class ProductCreateSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=30)
@@ -109,8 +274,7 @@ class ProductCreateSerializer(serializers.Serializer):
     fat = serializers.FloatField()
 
     def to_representation(self, instance):
-        product = Product.objects.get(**instance)
-        return {'product_id': product.id}
+        return {'product_id': instance.id}
 
     def create(self, validated_data):
         return Product.objects.get_or_create(**validated_data)[0]
@@ -120,43 +284,88 @@ class ProductGetSerializer(serializers.Serializer):
     id = serializers.IntegerField()
 
     def to_representation(self, instance):
-        try:
-            product = Product.objects.get(**instance)
-            return {'name': product.name,
-                    'kcal': product.kcal,
-                    'carbs': product.carbs,
-                    'proteins': product.proteins,
-                    'fat': product.fat}
-
-        except ObjectDoesNotExist:
+        product = products_cache.get(instance.get('id'))
+        if product is None:
             return {}
 
+        return {'name': product['name'],
+                'kcal': product['kcal'],
+                'carbs': product['carbs'],
+                'proteins': product['proteins'],
+                'fat': product['fat']}
 
-class ProductsGetSerializer(serializers.Serializer):
+
+class ProductsGetSerializer(CursorPaginationSerializer):
     name = serializers.CharField()
+    ordering = ('rank', 'name_length', 'id')
+    page_size = 50
 
     def to_representation(self, instance):
-        products = Product.objects.filter(name__contains='{}'.format(instance.get('name')))
+        products = self.paginate(Product.objects.search(instance.get('name')).only('id', 'name'), instance)
         return [{'product_id': product.id,
                  'name': product.name} for product in products
                 ]
 
+
+class ProductSuggestSerializer(serializers.Serializer):
+    prefix = serializers.CharField(max_length=30)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+    def to_representation(self, instance):
+        return [{'product_id': pk, 'name': name}
+                for pk, name in products_index.search(instance.get('prefix'), instance.get('limit'))]
+
+    @property
+    def data(self):
+        return super(serializers.Serializer, self).data
+
+
+class RecentProductsSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=10)
+
+    def to_representation(self, instance):
+        now = timezone.now()
+        usages = ProductUsage.objects.filter(user_id=instance.get('user_id')).select_related('product')
+        return [{'product_id': usage.product_id,
+                 'name': usage.product.name,
+                 'kcal': usage.product.kcal,
+                 'carbs': usage.product.carbs,
+                 'proteins': usage.product.proteins,
+                 'fat': usage.product.fat,
+                 'uses': usage.uses,
+                 'last_used': usage.last_used,
+                 'score': usage.score(now)} for usage in usages.order_by('-rank', 'id')[:instance.get('limit')]
+                ]
+
     @property
     def data(self):
         return super(serializers.Serializer, self).data
 
 
-class IngredientCreateSerializer(serializers.Serializer):
+class IngredientCreateSerializer(BulkCreateSerializer):
+    model = Ingredient
     product_id = serializers.IntegerField()
     meal_id = serializers.IntegerField()
     amount = serializers.FloatField()
 
+    def bulk_created(self, instances):
+        meal_ids = {instance.meal_id for instance in instances}
+        Meal.objects.filter(id__in=meal_ids).update_totals()
+        Diary.objects.filter(mealtype__meal__id__in=meal_ids).touch()
+        ProductUsage.objects.record(instances)
+
     def to_representation(self, instance):
-        ingredient = Ingredient.objects.get(**instance)
-        return {'ingredient_id': ingredient.id}
+        return {'ingredient_id': instance.id}
 
     def create(self, validated_data):
-        return Ingredient.objects.get_or_create(**validated_data)[0]
+        with transaction.atomic():
+            ingredient, created = Ingredient.objects.get_or_create(**validated_data)
+            Meal.objects.filter(id=validated_data.get('meal_id')).update_totals()
+            Diary.objects.filter(mealtype__meal__id=validated_data.get('meal_id')).touch()
+            if created:
+                ProductUsage.objects.record([ingredient])
+        return ingredient
 
 
 class IngredientDeleteSerializer(serializers.Serializer):
@@ -166,7 +375,13 @@ class IngredientDeleteSerializer(serializers.Serializer):
         return {}
 
     def delete(self, validated_data):
-        Ingredient.objects.filter(**validated_data).delete()
+        with transaction.atomic():
+            ingredients = Ingredient.objects.filter(**validated_data)
+            meal_ids = list(ingredients.values_list('meal_id', flat=True))
+            Tombstone.objects.bury(ingredients)
+            ingredients.delete()
+            Meal.objects.filter(id__in=meal_ids).update_totals()
+            Diary.objects.filter(mealtype__meal__id__in=meal_ids).touch()
 
 
 class MealGetSerializer(serializers.Serializer):
@@ -174,18 +389,9 @@ class MealGetSerializer(serializers.Serializer):
 
     def to_representation(self, instance):
         try:
-            meal = Meal.objects.get(**instance)
-            ingredients = Ingredient.objects.filter(meal=meal)
-            ingredients_list = []
-            for ingredient in ingredients:
-                ingredients_list.append({'ingredient_id': ingredient.id,
-                                         'name': ingredient.product.name,
-                                         'amount': ingredient.amount})
-            return {'total_kcal': meal.total_kcal,
-                    'total_carbs': meal.total_carbs,
-                    'total_proteins': meal.total_proteins,
-                    'total_fat': meal.total_fat,
-                    'ingredients': ingredients_list}
+            ingredients = Ingredient.objects.select_related('product').order_by('id')
+            meal = Meal.objects.prefetch_related(Prefetch('ingredient_set', queryset=ingredients)).get(**instance)
+            return meal_representation(meal)
 
         except ObjectDoesNotExist:
             return {}
@@ -195,11 +401,14 @@ class MealCreateSerializer(serializers.Serializer):
     meal_type_id = serializers.IntegerField()
 
     def create(self, validated_data):
-        return Meal.objects.get_or_create(**validated_data)[0]
+        with transaction.atomic():
+            meal, created = Meal.objects.get_or_create(**validated_data)
+            if created:
+                Diary.objects.filter(mealtype__id=validated_data.get('meal_type_id')).touch()
+        return meal
 
     def to_representation(self, instance):
-        meal = Meal.objects.get(**instance)
-        return {'meal_id': meal.id}
+        return {'meal_id': instance.id}
 
 
 class MealUpdateSerializer(serializers.Serializer):
@@ -220,7 +429,9 @@ class MealUpdateSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
         meal_id = validated_data.get('id')
         validated_data.pop('id')
-        Meal.objects.filter(id=meal_id).update(**validated_data)
+        with transaction.atomic():
+            Meal.objects.filter(id=meal_id).update(updated_at=timezone.now(), **validated_data)
+            Diary.objects.filter(mealtype__meal__id=meal_id).touch()
 
 
 class MealDeleteSerializer(serializers.Serializer):
@@ -230,7 +441,13 @@ class MealDeleteSerializer(serializers.Serializer):
         return {}
 
     def delete(self, validated_data):
-        Meal.objects.filter(**validated_data).delete()
+        with transaction.atomic():
+            diaries = Diary.objects.filter(mealtype__meal__id=validated_data.get('id'))
+            diary_ids = list(diaries.values_list('id', flat=True))
+            meals = Meal.objects.filter(**validated_data)
+            Tombstone.objects.bury(meals)
+            meals.delete()
+            Diary.objects.filter(id__in=diary_ids).touch()
 
 
 class MealTypeGetSerializer(serializers.Serializer):
@@ -238,20 +455,13 @@ class MealTypeGetSerializer(serializers.Serializer):
 
     def to_representation(self, instance):
         try:
-            meal_type = MealType.objects.get(**instance)
-            meal = Meal.objects.get(meal_type=meal_type)
-            ingredients = Ingredient.objects.filter(meal=meal)
-            ingredients_list = []
-            for ingredient in ingredients:
-                ingredients_list.append({'ingredient_id': ingredient.id,
-                                         'name': ingredient.product.name,
-                                         'amount': ingredient.amount})
-            return {'name': meal_type.name,
-                    'total_kcal': meal.total_kcal,
-                    'total_carbs': meal.total_carbs,
-                    'total_proteins': meal.total_proteins,
-                    'total_fat': meal.total_fat,
-                    'ingredients': ingredients_list}
+            meal_type = prefetch_meals(MealType.objects.all()).get(**instance)
+            if not hasattr(meal_type, 'meal'):
+                return {}
+
+            data = meal_type_representation(meal_type)
+            data.pop('meal_type_id')
+            return data
 
         except ObjectDoesNotExist:
             return {}
@@ -262,11 +472,14 @@ class MealTypeCreateSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=30)
 
     def create(self, validated_data):
-        return MealType.objects.get_or_create(**validated_data)[0]
+        with transaction.atomic():
+            meal_type, created = MealType.objects.get_or_create(**validated_data)
+            if created:
+                Diary.objects.filter(id=validated_data.get('diary_id')).touch()
+        return meal_type
 
     def to_representation(self, instance):
-        meal_type = MealType.objects.get(**instance)
-        return {'meal_type_id': meal_type.id}
+        return {'meal_type_id': instance.id}
 
 
 class MealTypeDeleteSerializer(serializers.Serializer):
@@ -276,40 +489,29 @@ class MealTypeDeleteSerializer(serializers.Serializer):
         return {}
 
     def delete(self, validated_data):
-        MealType.objects.filter(**validated_data).delete()
+        with transaction.atomic():
+            diaries = Diary.objects.filter(mealtype__id=validated_data.get('id'))
+            diary_ids = list(diaries.values_list('id', flat=True))
+            meal_types = MealType.objects.filter(**validated_data)
+            Tombstone.objects.bury(meal_types)
+            meal_types.delete()
+            Diary.objects.filter(id__in=diary_ids).touch()
 
 
-class MealTypesSerializer(serializers.Serializer):
+class MealTypesSerializer(CursorPaginationSerializer):
     diary_id = serializers.IntegerField()
 
-    def to_representation(self, instance):
-        try:
-            diary = Diary.objects.get(id=instance.get('diary_id'))
-            meal_types = MealType.objects.filter(diary=diary)
-            data = []
-            for meal_type in meal_types:
-                meal = Meal.objects.get(meal_type=meal_type)
-                ingredients = Ingredient.objects.filter(meal=meal)
-                ingredients_list = []
-                for ingredient in ingredients:
-                    ingredients_list.append({'ingredient_id': ingredient.id,
-                                             'name': ingredient.product.name,
-                                             'amount': ingredient.amount})
-                data.append({'meal_type_id': meal_type.id,
-                             'name': meal_type.name,
-                             'total_kcal': meal.total_kcal,
-                             'total_carbs': meal.total_carbs,
-                             'total_proteins': meal.total_proteins,
-                             'total_fat': meal.total_fat,
-                             'ingredients': ingredients_list})
-            return data
+    def version(self):
+        return Diary.objects.filter(id=self.validated_data.get('diary_id')).values_list('updated_at', flat=True).first()
 
-        except ObjectDoesNotExist:
+    def to_representation(self, instance):
+        meal_types = self.paginate(prefetch_meals(MealType.objects.filter(diary_id=instance.get('diary_id'))),
+                                   instance)
+        data = [meal_type_representation(meal_type) for meal_type in meal_types]
+        if not data and not Diary.objects.filter(id=instance.get('diary_id')).exists():
             return {}
 
-    @property
-    def data(self):
-        return super(serializers.Serializer, self).data
+        return data
 
 
 class UserCreateSerializer(serializers.Serializer):
@@ -325,13 +527,10 @@ class UserCreateSerializer(serializers.Serializer):
             return {}
 
     def to_representation(self, instance):
-        instance.pop('password')
-        try:
-            profile = Profile.objects.get(**instance)
-            return {'user_id': profile.id}
+        if isinstance(instance, Profile):
+            return {'user_id': instance.id}
 
-        except ObjectDoesNotExist:
-            return {}
+        return {}
 
 
 class UserUpdateSerializer(serializers.Serializer):
@@ -345,7 +544,7 @@ class UserUpdateSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
         user_id = validated_data.get('id')
         validated_data.pop('id')
-        Profile.objects.filter(id=user_id).update(**validated_data)
+        Profile.objects.filter(pk=user_id).update(updated_at=timezone.now(), **validated_data)
 
     def to_representation(self, instance):
         return {}
@@ -353,10 +552,16 @@ class UserUpdateSerializer(serializers.Serializer):
 
 class UserDeleteSerializer(serializers.Serializer):
     id = serializers.IntegerField()
-    password = serializers.CharField(max_length=128)
+    password = serializers.CharField(max_length=128, required=False)
 
     def delete(self, validated_data):
-        user = Profile.objects.get(id=validated_data.get('id'))
+        request = self.context.get('request')
+        if request is not None and request.user.is_authenticated and request.user.id == validated_data.get('id'):
+            # Token was signed for this user, no need to hash the password.
+            User.objects.filter(id=validated_data.get('id')).delete()
+            return
+
+        user = User.objects.only('id', 'password').get(id=validated_data.get('id'))
 
         if user.check_password(validated_data.get('password')):
             user.delete()
@@ -368,29 +573,95 @@ class UserDeleteSerializer(serializers.Serializer):
 class ProfileGetSerializer(serializers.Serializer):
     id = serializers.IntegerField()
 
+    def version(self):
+        return Profile.objects.filter(pk=self.validated_data.get('id')).values_list('updated_at', flat=True).first()
+
     def to_representation(self, instance):
         try:
-            user = Profile.objects.get(**instance)
-            return {'username': user.username,
-                    'height': user.height,
-                    'gender': user.gender,
-                    'daily_carbs': user.daily_carbs,
-                    'daily_proteins': user.daily_proteins,
-                    'daily_fat': user.daily_fat}
+            profile = Profile.objects.with_user('username').get(pk=instance.get('id'))
+            return {'username': profile.user.username,
+                    'height': profile.height,
+                    'gender': profile.gender,
+                    'daily_carbs': profile.daily_carbs,
+                    'daily_proteins': profile.daily_proteins,
+                    'daily_fat': profile.daily_fat}
 
         except ObjectDoesNotExist:
             return {}
 
 
-class WeightListGetSerializer(serializers.Serializer):
+class WeightListGetSerializer(CursorPaginationSerializer):
     user_id = serializers.IntegerField()
+    ordering = ('date', 'id')
+
+    def version(self):
+        return Weight.objects.filter(user_id=self.validated_data.get('user_id')).aggregate(
+            updated_at=Max('updated_at'), count=Count('id'))
 
     def to_representation(self, instance):
-        weights = Weight.objects.filter(**instance)
+        weights = self.paginate(Weight.objects.filter(user_id=instance.get('user_id')), instance)
         return [{'value': weight.value,
                  'date': weight.date} for weight in weights
                 ]
 
+
+class WeightSeriesSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    ordering = serializers.ChoiceField(['date', '-date'], required=False)
+    bucket = serializers.ChoiceField(['day', 'week', 'month'], required=False)
+    window = serializers.IntegerField(required=False, min_value=2, max_value=365)
+    max_points = serializers.IntegerField(required=False, min_value=3)
+
+    def version(self):
+        return Weight.objects.filter(user_id=self.validated_data.get('user_id')).aggregate(
+            updated_at=Max('updated_at'), count=Count('id'))
+
+    def points(self, instance):
+        """Returns dates and values of weights in range, averaged in buckets if requested, ordered by date."""
+        weights = Weight.objects.filter(user_id=instance.get('user_id'))
+        if 'date_from' in instance:
+            weights = weights.filter(date__gte=instance.get('date_from'))
+        if 'date_to' in instance:
+            weights = weights.filter(date__lte=instance.get('date_to'))
+
+        bucket = instance.get('bucket')
+        if bucket is None:
+            return list(weights.order_by('date', 'id').values_list('date', 'value'))
+
+        if bucket == 'month':
+            periods = weights.annotate(period=TruncMonth('date')).values('period')
+        else:
+            periods = weights.annotate(period=F('date')).values('period')
+        periods = periods.annotate(total=Sum('value'), count=Count('id')).order_by('period')
+
+        buckets = OrderedDict()
+        for period in periods:
+            date = period['period']
+            if bucket == 'week':
+                date -= datetime.timedelta(days=date.weekday())
+            total, count = buckets.get(date, (0, 0))
+            buckets[date] = (total + period['total'], count + period['count'])
+        return [(date, total / count) for date, (total, count) in buckets.items()]
+
+    def to_representation(self, instance):
+        points = self.points(instance)
+        data = [{'date': date, 'value': value} for date, value in points]
+        if 'window' in instance:
+            averages = moving_average([value for date, value in points], instance.get('window'))
+            for item, average in zip(data, averages):
+                item['average'] = average
+
+        if 'max_points' in instance:
+            kept = largest_triangle_three_buckets([date.toordinal() for date, value in points],
+                                                  [value for date, value in points], instance.get('max_points'))
+            data = [data[i] for i in kept]
+
+        if instance.get('ordering') == '-date':
+            data.reverse()
+        return data
+
     @property
     def data(self):
         return super(serializers.Serializer, self).data
@@ -409,17 +680,29 @@ class WeightGetSerializer(serializers.Serializer):
             return {}
 
 
-class WeightCreateSerializer(serializers.Serializer):
+class WeightCreateListSerializer(BulkCreateListSerializer):
+    def create(self, validated_data):
+        # A user has one weight per day, so weights given again for the same day replace the earlier value.
+        values = OrderedDict(((attrs['user_id'], attrs['date']), attrs['value']) for attrs in validated_data)
+        weights = Weight.objects.record(values)
+        return [weights[attrs['user_id'], attrs['date']] for attrs in validated_data]
+
+
+class WeightCreateSerializer(BulkCreateSerializer):
+    model = Weight
     user_id = serializers.IntegerField()
     date = serializers.DateField()
     value = serializers.FloatField()
 
+    class Meta:
+        list_serializer_class = WeightCreateListSerializer
+
     def create(self, validated_data):
-        return Weight.objects.get_or_create(**validated_data)[0]
+        return Weight.objects.update_or_create(user_id=validated_data['user_id'], date=validated_data['date'],
+                                               defaults={'value': validated_data['value']})[0]
 
     def to_representation(self, instance):
-        weight = Weight.objects.get(**instance)
-        return {'weight_id': weight.id}
+        return {'weight_id': instance.id}
 
 
 class WeightDeleteSerializer(serializers.Serializer):
@@ -429,7 +712,128 @@ class WeightDeleteSerializer(serializers.Serializer):
         return {}
 
     def delete(self, validated_data):
-        Weight.objects.filter(**validated_data).delete()
+        with transaction.atomic():
+            weights = Weight.objects.filter(**validated_data)
+            Tombstone.objects.bury(weights)
+            weights.delete()
+
+
+DEFAULT_SYNC_MARGIN = 60
+"""Default number of seconds the longest transaction may take, overridden by SYNC_MARGIN setting."""
+
+
+class SyncSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField()
+    since = serializers.DateTimeField(required=False)
+
+    def to_representation(self, instance):
+        # Rows are stamped when written but become visible when committed, so a write stamped before this read
+        # could commit after it. Moving the watermark back by the margin returns such rows with the next sync.
+        watermark = timezone.now() - datetime.timedelta(seconds=getattr(settings, 'SYNC_MARGIN', DEFAULT_SYNC_MARGIN))
+        user_id = instance.get('user_id')
+        since = instance.get('since')
+
+        def changed(objects, *fields):
+            if since is not None:
+                objects = objects.filter(updated_at__gt=since)
+            return list(objects.order_by('id').values('id', *fields))
+
+        data = {'watermark': watermark,
+                'diaries': changed(Diary.objects.filter(user_id=user_id), 'date'),
+                'meal_types': changed(MealType.objects.filter(diary__user_id=user_id), 'diary_id', 'name'),
+                'meals': changed(Meal.objects.filter(meal_type__diary__user_id=user_id), 'meal_type_id',
+                                 'total_kcal', 'total_carbs', 'total_proteins', 'total_fat'),
+                'ingredients': changed(Ingredient.objects.filter(meal__meal_type__diary__user_id=user_id), 'meal_id',
+                                       'product_id', 'amount'),
+                'activities': changed(Activity.objects.filter(diary__user_id=user_id), 'diary_id', 'discipline_id',
+                                      'time'),
+                'weights': changed(Weight.objects.filter(user_id=user_id), 'date', 'value'),
+                'deleted': []}
+        if since is not None:
+            tombstones = Tombstone.objects.filter(user_id=user_id, deleted_at__gt=since).order_by('id')
+            data['deleted'] = [{'model': model, 'id': object_id}
+                               for model, object_id in tombstones.values_list('model', 'object_id')]
+        return data
+
+
+SYNC_OPERATIONS = {
+    ('diary', 'create'): DiaryCreateSerializer,
+    ('mealtype', 'create'): MealTypeCreateSerializer,
+    ('mealtype', 'delete'): MealTypeDeleteSerializer,
+    ('meal', 'create'): MealCreateSerializer,
+    ('meal', 'update'): MealUpdateSerializer,
+    ('meal', 'delete'): MealDeleteSerializer,
+    ('ingredient', 'create'): IngredientCreateSerializer,
+    ('ingredient', 'delete'): IngredientDeleteSerializer,
+    ('activity', 'create'): ActivityCreateSerializer,
+    ('activity', 'delete'): ActivityDeleteSerializer,
+    ('weight', 'create'): WeightCreateSerializer,
+    ('weight', 'delete'): WeightDeleteSerializer,
+}
+"""Serializers of writes that can be uploaded to /api/sync/, by model name and action."""
+
+
+class SyncOperationSerializer(serializers.Serializer):
+    model = serializers.ChoiceField(sorted({model for model, action in SYNC_OPERATIONS}))
+    action = serializers.ChoiceField(['create', 'update', 'delete'])
+    data = serializers.DictField()
+    ref = serializers.CharField(max_length=100, required=False)
+
+    def validate(self, attrs):
+        if (attrs['model'], attrs['action']) not in SYNC_OPERATIONS:
+            raise serializers.ValidationError({'action': 'Not supported for {}.'.format(attrs['model'])})
+        return attrs
+
+
+class SyncUploadSerializer(serializers.Serializer):
+    """Applies writes queued by offline client, in order and in one transaction.
+
+    Objects created earlier in the same batch are referred to with ``{"$ref": ref}`` values in data, where ref is
+    the ref of the creating operation.
+    """
+    operations = SyncOperationSerializer(many=True)
+
+    def resolve(self, data, refs, errors):
+        resolved = {}
+        for key, value in data.items():
+            if isinstance(value, dict) and '$ref' in value:
+                if value['$ref'] not in refs:
+                    errors[key] = ['Unknown ref "{}".'.format(value['$ref'])]
+                    continue
+                value = refs[value['$ref']]
+            resolved[key] = value
+        return resolved
+
+    def create(self, validated_data):
+        operations = validated_data.get('operations')
+        refs = {}
+        results = []
+        with transaction.atomic():
+            for index, operation in enumerate(operations):
+                errors = {}
+                data = self.resolve(operation['data'], refs, errors)
+                serializer = SYNC_OPERATIONS[operation['model'], operation['action']](data=data)
+                if not errors and not serializer.is_valid():
+                    errors = serializer.errors
+                if errors:
+                    raise serializers.ValidationError(
+                        {'operations': [errors if i == index else {} for i in range(len(operations))]})
+
+                if operation['action'] == 'create':
+                    instance = serializer.save()
+                    results.append({'id': instance.id})
+                    if 'ref' in operation:
+                        refs[operation['ref']] = instance.id
+                elif operation['action'] == 'update':
+                    serializer.update(None, serializer.validated_data)
+                    results.append({})
+                else:
+                    serializer.delete(serializer.validated_data)
+                    results.append({})
+        return {'results': results, 'refs': refs}
+
+    def to_representation(self, instance):
+        return instance
 
 
 class LoginSerializer(serializers.Serializer):
@@ -438,9 +842,9 @@ class LoginSerializer(serializers.Serializer):
 
     def to_representation(self, instance):
         try:
-            user = Profile.objects.get(username=instance.get('username'))
+            user = User.objects.only('id', 'password').get(username=instance.get('username'))
             if user.check_password(instance.get('password')):
-                return {'user_id': user.id}
+                return {'user_id': user.id, 'token': issue_token(user)}
             else:
                 return {}
 
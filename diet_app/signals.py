@@ -0,0 +1,39 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from diet_app.autocomplete import products_index
+from diet_app.cache import disciplines_cache, products_cache
+from diet_app.models import Discipline, Product, Profile, Tombstone
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    """Removes changed product from reference cache."""
+    products_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Adds saved product to autocomplete index once it is committed, so that rolled back ones aren't suggested."""
+    transaction.on_commit(partial(products_index.update, instance.pk, instance.name), using=kwargs['using'])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """Removes deleted product from autocomplete index once the deletion is committed."""
+    transaction.on_commit(partial(products_index.delete, instance.pk), using=kwargs['using'])
+
+
+@receiver([post_save, post_delete], sender=Discipline)
+def invalidate_discipline(sender, instance, **kwargs):
+    """Removes changed discipline from reference cache."""
+    disciplines_cache.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=Profile)
+def remove_tombstones(sender, instance, **kwargs):
+    """Removes tombstones of deleted user, including the ones of objects deleted together with the user."""
+    Tombstone.objects.filter(user_id=instance.pk).delete()
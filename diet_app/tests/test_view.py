@@ -1,9 +1,29 @@
-from django.db import IntegrityError, transaction
-from django.test import TestCase, RequestFactory, Client
+import datetime
+import decimal
+import gzip
+import zlib
+from unittest import mock, skipIf
+
+from django.core import signing
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase, RequestFactory, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
 from rest_framework.test import APIRequestFactory, APIClient
 
+from diet_app.authentication import TOKEN_SALT, SignedTokenAuthentication, issue_token, read_token
+from diet_app.autocomplete import autocomplete_options, products_index
+from diet_app.cache import products_cache
+from diet_app.compression import CompressionMiddleware
+from diet_app.goals import evaluate_numpy, evaluate_python, numpy
+from diet_app.metrics import registry
+from diet_app.pagination import encode_cursor
+from diet_app.renderers import BACKENDS, FastJSONRenderer
 from diet_app.models import *
+from diet_app.serializers import ProductsGetSerializer
 
 
 class DiaryViewTests(TestCase):
@@ -12,7 +32,7 @@ class DiaryViewTests(TestCase):
         self.factory = APIRequestFactory()
         self.client = APIClient()
         self.date = "2017-12-13"
-        self.user = Profile.objects.create(username='testytest', password='passsssss')
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
         self.diary = Diary.objects.create(user=self.user, date=self.date)
 
     def test_diary_get_correct_params(self):
@@ -75,6 +95,144 @@ class DiaryViewTests(TestCase):
         assert response.json() == {'date': ['Date has wrong format. Use one of these formats instead: YYYY[-MM[-DD]].']}
 
 
+class DiarySnapshotViewTests(TestCase):
+    def setUp(self):
+        """Setting up for test."""
+        self.factory = APIRequestFactory()
+        self.client = APIClient()
+        self.date = "2017-12-13"
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'),
+                                           daily_kcal=2000, daily_carbs=250, daily_proteins=100, daily_fat=70)
+        self.diary = Diary.objects.create(user=self.user, date=self.date)
+        self.meal_type = MealType.objects.create(diary=self.diary, name='Śniadanko')
+        self.meal = Meal.objects.create(meal_type=self.meal_type, total_kcal=500, total_carbs=10, total_proteins=10,
+                                        total_fat=10)
+        self.product = Product.objects.create(name='Kaszanka', kcal=500, carbs=10, proteins=10, fat=10)
+        self.ingredient = Ingredient.objects.create(meal=self.meal, product=self.product, amount=100)
+        self.discipline = Discipline.objects.create(name='Bieganie', calories_burn=400)
+        self.activity = Activity.objects.create(diary=self.diary, discipline=self.discipline, time='01:30:00')
+
+    def test_diary_snapshot_get_correct_params(self):
+        """Testing GET diary snapshot view with correct params"""
+        response = self.client.get(reverse('diary-snapshot', args=[self.diary.id]))
+        assert response.status_code == 200
+        assert response.json() == {
+            'diary_id': self.diary.id,
+            'date': self.date,
+            'meal_types': [{'meal_type_id': self.meal_type.id, 'name': 'Śniadanko', 'total_kcal': 500,
+                            'total_carbs': 10, 'total_proteins': 10, 'total_fat': 10,
+                            'ingredients': [{'ingredient_id': self.ingredient.id, 'name': 'Kaszanka', 'amount': 100,
+                                             'product_id': self.product.id, 'kcal': 500, 'carbs': 10,
+                                             'proteins': 10, 'fat': 10}]}],
+            'activities': [{'activity_id': self.activity.id, 'discipline_id': self.discipline.id, 'name': 'Bieganie',
+                            'calories_burn': 400, 'time': '01:30:00', 'burned_kcal': 600}],
+            'totals': {'kcal': 500, 'carbs': 10, 'proteins': 10, 'fat': 10, 'burned_kcal': 600},
+            'caps': {'kcal': 2000, 'carbs': 250, 'proteins': 100, 'fat': 70}
+        }
+
+    def test_diary_snapshot_get_query_count(self):
+        """Testing GET diary snapshot view runs constant number of queries"""
+        for name in ['Obiad', 'Kolacja']:
+            meal = Meal.objects.create(meal_type=MealType.objects.create(diary=self.diary, name=name))
+            Ingredient.objects.create(meal=meal, product=self.product, amount=50)
+            Activity.objects.create(diary=self.diary, discipline=self.discipline, time='00:30:00')
+
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('diary-snapshot', args=[self.diary.id]))
+        assert len(response.json()['meal_types']) == 3
+        assert len(response.json()['activities']) == 3
+
+    def test_diary_snapshot_get_not_existing_diary(self):
+        """Testing GET diary snapshot view with not existing diary"""
+        response = self.client.get(reverse('diary-snapshot', args=[1000]))
+        assert response.status_code == 400
+        assert response.json() == {}
+
+
+class DailySummariesViewTests(TestCase):
+    def setUp(self):
+        """Setting up for test."""
+        self.client = APIClient()
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
+        self.diary = Diary.objects.create(user=self.user, date='2017-12-13')
+        self.meal_type = MealType.objects.create(diary=self.diary, name='Śniadanko')
+        self.meal = Meal.objects.create(meal_type=self.meal_type)
+        self.product = Product.objects.create(name='Kaszanka', kcal=500, carbs=10, proteins=20, fat=30)
+        self.discipline = Discipline.objects.create(name='Bieganie', calories_burn=400)
+
+    def summaries(self, **params):
+        response = self.client.get(reverse('daily-summaries'), dict(user_id=self.user.id, **params))
+        assert response.status_code == 200
+        return response.json()
+
+    def test_daily_summaries_follow_writes(self):
+        """Testing GET daily summaries view reflects ingredients and activities written through the API"""
+        self.client.post(reverse('ingredient'), {'product_id': self.product.id, 'meal_id': self.meal.id,
+                                                 'amount': 200})
+        self.client.post(reverse('activity'), {'diary_id': self.diary.id, 'discipline_id': self.discipline.id,
+                                               'time': '01:30:00'})
+        assert self.summaries() == [{'date': '2017-12-13', 'kcal': 1000, 'carbs': 20, 'proteins': 40, 'fat': 60,
+                                     'burned_kcal': 600}]
+
+        self.client.delete(reverse('activity'), {'id': Activity.objects.get().id})
+        self.client.delete(reverse('meal'), {'id': self.meal.id})
+        assert self.summaries() == [{'date': '2017-12-13', 'kcal': 0, 'carbs': 0, 'proteins': 0, 'fat': 0,
+                                     'burned_kcal': 0}]
+
+    def test_daily_summaries_get_range(self):
+        """Testing GET daily summaries view returns days from given range in order"""
+        for date in ['2017-12-15', '2017-12-14', '2018-01-01']:
+            diary = Diary.objects.create(user=self.user, date=date)
+            Activity.objects.create(diary=diary, discipline=self.discipline, time='00:30:00')
+        Diary.objects.filter(user=self.user).summarize()
+
+        response = self.summaries(date_from='2017-12-14', date_to='2017-12-31')
+        assert [summary['date'] for summary in response] == ['2017-12-14', '2017-12-15']
+        assert response[0]['burned_kcal'] == 200
+
+    def test_daily_summaries_get_query_count(self):
+        """Testing GET daily summaries view runs one query regardless of number of days"""
+        for day in range(1, 29):
+            Diary.objects.create(user=self.user, date='2018-02-{:02d}'.format(day))
+        Diary.objects.filter(user=self.user).summarize()
+
+        with self.assertNumQueries(1):
+            response = self.summaries()
+        assert len(response) == 29
+
+    def test_daily_summaries_concurrent_first_write(self):
+        """Testing daily summaries are created once when a concurrent request created some of them first"""
+        missing_summaries = DiaryQuerySet.missing_summaries
+        calls = []
+
+        def stale(queryset):
+            # The first read misses the summary, as if the other request committed it right after.
+            calls.append(queryset)
+            if len(calls) == 1:
+                return [DailySummary(diary=diary, user_id=diary.user_id, date=diary.date) for diary in queryset]
+            return missing_summaries(queryset)
+
+        Diary.objects.filter(id=self.diary.id).summarize()
+        Diary.objects.create(user=self.user, date='2017-12-14')
+        with mock.patch.object(DiaryQuerySet, 'missing_summaries', stale):
+            Diary.objects.filter(user=self.user).summarize()
+        assert len(calls) == 2
+        assert [summary['date'] for summary in self.summaries()] == ['2017-12-13', '2017-12-14']
+
+    def test_daily_summaries_get_incorrect_range(self):
+        """Testing GET daily summaries view with date_from after date_to"""
+        response = self.client.get(reverse('daily-summaries'), {'user_id': self.user.id, 'date_from': '2018-01-02',
+                                                                'date_to': '2018-01-01'})
+        assert response.status_code == 400
+        assert response.json() == {'date_to': ['Must not be earlier than date_from.']}
+
+    def test_daily_summaries_get_missing_params(self):
+        """Testing GET daily summaries view with missing params"""
+        response = self.client.get(reverse('daily-summaries'))
+        assert response.status_code == 400
+        assert response.json() == {'user_id': ['This field is required.']}
+
+
 class DisciplineViewTests(TestCase):
     def setUp(self):
         """Setting up for test."""
@@ -139,6 +297,18 @@ class DisciplinesViewTests(TestCase):
         assert response.status_code == 400
         assert response.json() == {'name': ['This field may not be blank.']}
 
+    def test_disciplines_get_normalized_name(self):
+        """Testing GET disciplines view ignores case and diacritics"""
+        discipline3 = Discipline.objects.create(name='Jazda na łyżwach', calories_burn=350)
+        response = self.client.get(reverse('disciplines'), {'name': 'LYZW'})
+        assert response.status_code == 200
+        assert response.json() == [{'id': discipline3.id,
+                                    'name': discipline3.name,
+                                    'calories_burn': discipline3.calories_burn}]
+
+        response = self.client.get(reverse('disciplines'), {'name': 'bIEG'})
+        assert [discipline['id'] for discipline in response.json()] == [self.discipline1.id]
+
     def test_disciplines_get_missing_params(self):
         """Testing GET disciplines view with missing params"""
         response = self.client.get(reverse('disciplines'), {})
@@ -146,6 +316,79 @@ class DisciplinesViewTests(TestCase):
         assert response.json() == {'name': ['This field is required.']}
 
 
+class GoalsViewTests(TestCase):
+    def setUp(self):
+        """Setting up for test."""
+        self.client = APIClient()
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'),
+                                           daily_kcal=2000, daily_carbs=250, daily_proteins=100)
+        for date, kcal, burned_kcal, carbs, proteins in [('2018-01-01', 1800, 0, 200, 120),
+                                                         ('2018-01-02', 2300, 500, 300, 80),
+                                                         ('2018-01-04', 1500, 0, 100, 90),
+                                                         ('2018-01-05', 2100, 0, 250, 100)]:
+            diary = Diary.objects.create(user=self.user, date=date)
+            DailySummary.objects.create(user=self.user, date=date, diary=diary, kcal=kcal, burned_kcal=burned_kcal,
+                                        carbs=carbs, proteins=proteins, fat=50)
+
+    def goals(self, **params):
+        params = dict({'user_id': self.user.id, 'date_from': '2018-01-01', 'date_to': '2018-01-05'}, **params)
+        response = self.client.get(reverse('goals'), params)
+        assert response.status_code == 200
+        return response.json()
+
+    def test_goals_get_days(self):
+        """Testing GET goals view returns intake and percents of caps for every day of the range"""
+        data = self.goals()
+        assert data['caps'] == {'kcal': 2000, 'carbs': 250, 'proteins': 100, 'fat': None}
+        assert [day['date'] for day in data['days']] == ['2018-01-01', '2018-01-02', '2018-01-03', '2018-01-04',
+                                                         '2018-01-05']
+        assert data['days'][1]['logged'] and not data['days'][2]['logged']
+        assert data['days'][1]['kcal'] == 2300 and data['days'][1]['burned_kcal'] == 500
+        assert data['days'][1]['percents'] == {'kcal': 90, 'carbs': 120, 'proteins': 80, 'fat': None}
+        assert data['days'][2]['percents'] == {'kcal': 0, 'carbs': 0, 'proteins': 0, 'fat': None}
+
+    def test_goals_get_summary(self):
+        """Testing GET goals view returns adherence, streaks and deficits of logged days"""
+        data = self.goals()
+        assert data['adherence'] == {'kcal': 75, 'carbs': 75, 'proteins': 75, 'fat': None}
+        assert data['streaks'] == {'kcal': {'current': 0, 'longest': 2}, 'carbs': {'current': 2, 'longest': 2},
+                                   'proteins': {'current': 2, 'longest': 2}, 'fat': None}
+        assert data['deficits'] == {'kcal': 800, 'carbs': 150, 'proteins': 10, 'fat': None}
+
+    def test_goals_get_query_count(self):
+        """Testing GET goals view fetches profile and summaries once"""
+        with self.assertNumQueries(2):
+            self.goals(date_to='2018-12-31')
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_goals_backends(self):
+        """Testing NumPy and pure Python evaluation give the same results"""
+        caps = [2000, 0, None, 70]
+        logged = [True, False, True, True, True, False]
+        intake = [[1800, 10, 50, 80], [0, 0, 0, 0], [2200, 0, 60, 60], [1900, 5, 70, 70], [100, 0, 0, 0],
+                  [0, 0, 0, 0]]
+        assert evaluate_numpy(caps, logged, intake) == evaluate_python(caps, logged, intake)
+        assert evaluate_numpy(caps, [], []) == evaluate_python(caps, [], [])
+
+    def test_goals_get_incorrect_params(self):
+        """Testing GET goals view with incorrect params"""
+        response = self.client.get(reverse('goals'), {'user_id': self.user.id, 'date_from': '2018-01-01',
+                                                      'date_to': '2019-01-02'})
+        assert response.status_code == 400
+        assert response.json() == {'date_to': ['Range must not be longer than 366 days.']}
+
+        response = self.client.get(reverse('goals'), {'user_id': 0, 'date_from': '2018-01-01',
+                                                      'date_to': '2018-01-02'})
+        assert response.status_code == 400
+        assert response.json() == {}
+
+    def test_goals_get_missing_params(self):
+        """Testing GET goals view with missing params"""
+        response = self.client.get(reverse('goals'), {'user_id': self.user.id})
+        assert response.status_code == 400
+        assert response.json() == {'date_from': ['This field is required.'], 'date_to': ['This field is required.']}
+
+
 class ActivityViewTests(TestCase):
     def setUp(self):
         """Setting up for test"""
@@ -153,7 +396,7 @@ class ActivityViewTests(TestCase):
         self.client = APIClient()
         self.date1 = "2017-12-13"
         self.date2 = "2017-12-14"
-        self.user = Profile.objects.create(username='testytest', password='passsssss')
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
         self.diary1 = Diary.objects.create(user=self.user, date=self.date1)
         self.diary2 = Diary.objects.create(user=self.user, date=self.date2)
         self.discipline1 = Discipline.objects.create(name='Dancing with unicorns', calories_burn=500)
@@ -199,6 +442,17 @@ class ActivityViewTests(TestCase):
         assert response.json() == {}
         assert activities_before + 1 == activities_after
 
+    def test_activity_post_batch(self):
+        """Testing POST activity view with list of activities"""
+        count = Activity.objects.all().count()
+        data = [{'diary_id': self.diary2.id, 'discipline_id': self.discipline1.id, 'time': '00:10:00'},
+                {'diary_id': self.diary2.id, 'discipline_id': self.discipline2.id, 'time': '00:20:00'}]
+        response = self.client.post(reverse('activity'), data, format='json')
+        activities = Activity.objects.filter(id__gt=self.activity3.id).order_by('id')
+        assert response.status_code == 200
+        assert response.json() == [{'activity_id': activity.id} for activity in activities]
+        assert count + 2 == Activity.objects.all().count()
+
     def test_activity_post_incorrect_params(self):
         """Testing POST activity view with incorrect params"""
         response = self.client.post(
@@ -257,6 +511,51 @@ class ActivityViewTests(TestCase):
         assert activities_before == activities_after
 
 
+class ActivitiesViewTests(TestCase):
+    def setUp(self):
+        """Setting up for test"""
+        self.client = APIClient()
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
+        self.diary = Diary.objects.create(user=self.user, date='2017-12-13')
+        self.discipline1 = Discipline.objects.create(name='Dancing with unicorns', calories_burn=500)
+        self.discipline2 = Discipline.objects.create(name='Running with unicorns', calories_burn=600)
+        self.activity1 = Activity.objects.create(diary=self.diary, discipline=self.discipline1, time='00:30:00')
+        self.activity2 = Activity.objects.create(diary=self.diary, discipline=self.discipline2, time='01:15:30')
+
+    def test_activities_get_correct_params(self):
+        """Testing GET activities view returns burnt calories of activities and the whole diary"""
+        response = self.client.get(reverse('activities'), {'diary_id': self.diary.id})
+        assert response.status_code == 200
+        assert response.json() == [{'activity_id': self.activity1.id, 'discipline_id': self.discipline1.id,
+                                    'name': 'Dancing with unicorns', 'calories_burn': 500, 'time': '00:30:00',
+                                    'burned_kcal': 250},
+                                   {'activity_id': self.activity2.id, 'discipline_id': self.discipline2.id,
+                                    'name': 'Running with unicorns', 'calories_burn': 600, 'time': '01:15:30',
+                                    'burned_kcal': 755}]
+        assert float(response['X-Total-Burned-Kcal']) == 1005
+
+    def test_activities_get_total_of_all_pages(self):
+        """Testing GET activities view total includes activities from other pages"""
+        response = self.client.get(reverse('activities'), {'diary_id': self.diary.id, 'limit': 1})
+        assert len(response.json()) == 1
+        assert float(response['X-Total-Burned-Kcal']) == 1005
+
+    def test_activities_get_query_count(self):
+        """Testing GET activities view runs one query for the list and one for the total"""
+        for _ in range(5):
+            Activity.objects.create(diary=self.diary, discipline=self.discipline1, time='00:10:00')
+
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('activities'), {'diary_id': self.diary.id})
+        assert len(response.json()) == 7
+
+    def test_activities_get_missing_params(self):
+        """Testing GET activities view with missing params"""
+        response = self.client.get(reverse('activities'), {})
+        assert response.status_code == 400
+        assert response.json() == {'diary_id': ['This field is required.']}
+
+
 class ProductViewTests(TestCase):
     def setUp(self):
         """Setting up for test"""
@@ -305,6 +604,13 @@ class ProductViewTests(TestCase):
         assert response.status_code == 200
         assert response.json() == {'product_id': new_product.id}
 
+    def test_product_post_query_count(self):
+        """Testing POST product view runs only lookup and insert"""
+        data = {'name': self.name, 'kcal': self.kcal, 'carbs': self.carbs, 'proteins': self.proteins, 'fat': self.fat}
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('product'), data)
+        assert response.json() == {'product_id': Product.objects.get(name=self.name).id}
+
     def test_product_post_incorrect_params(self):
         """Testing POST product view with incorrect params"""
         response = self.client.post(
@@ -328,6 +634,63 @@ class ProductViewTests(TestCase):
                                    'fat': ['This field is required.']}
 
 
+class ReferenceCacheTests(TransactionTestCase):
+    def setUp(self):
+        """Setting up for test"""
+        self.client = APIClient()
+        # Tables are flushed between tests without signals, so ids of new rows can be the ones still cached.
+        products_cache.clear()
+        self.product1 = Product.objects.create(name='Kaszanka', kcal=500, carbs=10, proteins=10, fat=10)
+        self.product2 = Product.objects.create(name='Śledziki', kcal=400, carbs=0, proteins=20, fat=15)
+
+    def test_product_get_cached(self):
+        """Testing GET product view reads product from cache until it changes"""
+        self.client.get(reverse('product'), {'id': self.product1.id})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('product'), {'id': self.product1.id})
+        assert response.json()['name'] == self.product1.name
+
+        self.product1.name = 'Kaszanka wiejska'
+        self.product1.save()
+        response = self.client.get(reverse('product'), {'id': self.product1.id})
+        assert response.json()['name'] == 'Kaszanka wiejska'
+
+        product_id = self.product1.id
+        self.product1.delete()
+        response = self.client.get(reverse('product'), {'id': product_id})
+        assert response.json() == {}
+
+    @override_settings(REFERENCE_CACHE={'CACHE': 'default'})
+    def test_product_get_cached_shared_backend(self):
+        """Testing GET product view with shared cache backend"""
+        self.client.get(reverse('product'), {'id': self.product2.id})
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('product'), {'id': self.product2.id})
+        assert response.json()['name'] == self.product2.name
+
+        product_id = self.product2.id
+        self.product2.delete()
+        response = self.client.get(reverse('product'), {'id': product_id})
+        assert response.json() == {}
+
+    def test_product_get_rolled_back_change(self):
+        """Testing GET product view doesn't cache product changed in transaction that is rolled back"""
+        self.client.get(reverse('product'), {'id': self.product1.id})
+        try:
+            with transaction.atomic():
+                self.product1.name = 'Kaszanka wiejska'
+                self.product1.save()
+                assert products_cache.get(self.product1.id)['name'] == 'Kaszanka wiejska'
+                raise IntegrityError
+
+        except IntegrityError:
+            pass
+        response = self.client.get(reverse('product'), {'id': self.product1.id})
+        assert response.json()['name'] == 'Kaszanka'
+        with self.assertNumQueries(0):
+            assert self.client.get(reverse('product'), {'id': self.product1.id}).json()['name'] == 'Kaszanka'
+
+
 class ProductsViewTests(TestCase):
     def setUp(self):
         """Setting up for test"""
@@ -365,6 +728,66 @@ class ProductsViewTests(TestCase):
             }
         ]
 
+    def test_products_get_search_index(self):
+        """Testing GET products view matches names case-insensitively, prefix matches first"""
+        product3 = Product.objects.create(name='Kasza gryczana', kcal=340, carbs=70, proteins=12, fat=3)
+        product4 = Product.objects.create(name='Zupa z kaszą', kcal=60, carbs=8, proteins=2, fat=2)
+        response = self.client.get(reverse('products'), {'name': 'KASZ'})
+        assert response.status_code == 200
+        assert response.json() == [
+            {'product_id': self.product1.id, 'name': self.product1.name},
+            {'product_id': product3.id, 'name': product3.name},
+            {'product_id': product4.id, 'name': product4.name}
+        ]
+
+        Product.objects.filter(id=product3.id).update(name='Ryż')
+        product4.delete()
+        response = self.client.get(reverse('products'), {'name': 'kasz'})
+        assert response.json() == [{'product_id': self.product1.id, 'name': self.product1.name}]
+
+    def test_products_get_normalized_name(self):
+        """Testing GET products view ignores diacritics and punctuation"""
+        product3 = Product.objects.create(name='Ser żółty, plastry', kcal=350, carbs=1, proteins=25, fat=27)
+        response = self.client.get(reverse('products'), {'name': 'sledz'})
+        assert response.json() == [{'product_id': self.product2.id, 'name': self.product2.name}]
+
+        response = self.client.get(reverse('products'), {'name': 'ŻÓŁTY  plastry'})
+        assert response.json() == [{'product_id': product3.id, 'name': product3.name}]
+
+    def test_products_search_name(self):
+        """Testing search names are kept in sync by save, update and bulk_create"""
+        assert self.product2.search_name == 'sledziki'
+        Product.objects.bulk_create([Product(name='Łosoś wędzony', kcal=160, carbs=0, proteins=22, fat=8)])
+        assert Product.objects.get(name='Łosoś wędzony').search_name == 'losos wedzony'
+        Product.objects.filter(pk=self.product1.pk).update(name='Kaszanka z cebulką')
+        assert Product.objects.get(pk=self.product1.pk).search_name == 'kaszanka z cebulka'
+
+    def test_products_get_limit(self):
+        """Testing GET products view returns bounded number of products"""
+        Product.objects.bulk_create([Product(name='Jogurt {}'.format(i), kcal=60, carbs=5, proteins=4, fat=3)
+                                     for i in range(ProductsGetSerializer.page_size + 10)])
+        response = self.client.get(reverse('products'), {'name': 'jogurt'})
+        assert len(response.json()) == ProductsGetSerializer.page_size
+
+    def test_products_get_pages(self):
+        """Testing GET products view pages follow search ranking"""
+        product3 = Product.objects.create(name='Kasza gryczana', kcal=340, carbs=70, proteins=12, fat=3)
+        product4 = Product.objects.create(name='Zupa z kaszą', kcal=60, carbs=8, proteins=2, fat=2)
+        response = self.client.get(reverse('products'), {'name': 'kasz', 'limit': 2})
+        assert response.json() == [{'product_id': self.product1.id, 'name': self.product1.name},
+                                   {'product_id': product3.id, 'name': product3.name}]
+
+        response = self.client.get(response['Link'][1:response['Link'].index('>')])
+        assert response.json() == [{'product_id': product4.id, 'name': product4.name}]
+        assert 'Link' not in response
+
+    def test_products_get_tampered_cursor(self):
+        """Testing GET products view with well formed cursor holding values of wrong types"""
+        for values in [['x', 'x', 'x'], [0, {}, 1], [None, 1, 2]]:
+            response = self.client.get(reverse('products'), {'name': 'k', 'cursor': encode_cursor(values)})
+            assert response.status_code == 400
+            assert response.json() == {'cursor': ['Invalid cursor.']}
+
     def test_products_get_missing_params(self):
         """Testing GET products view with missing params"""
         response = self.client.get(reverse('products'), {})
@@ -372,13 +795,213 @@ class ProductsViewTests(TestCase):
         assert response.json() == {'name': ['This field is required.']}
 
 
+class ProductSuggestViewTests(TransactionTestCase):
+    def setUp(self):
+        """Setting up for test"""
+        self.client = APIClient()
+        products_index.clear()
+        self.products = {name: Product.objects.create(name=name, kcal=100, carbs=10, proteins=10, fat=5).id
+                         for name in ['Chleb', 'Chleb żytni', 'Grillowany chleb', 'Śledziki', 'Ser', 'Łosoś']}
+
+    def suggest(self, prefix, **params):
+        response = self.client.get(reverse('products-suggest'), dict(prefix=prefix, **params))
+        assert response.status_code == 200
+        return [product['name'] for product in response.json()]
+
+    def test_products_suggest_get(self):
+        """Testing GET products suggest view returns names starting with prefix before names with such word"""
+        assert self.suggest('chl') == ['Chleb', 'Chleb żytni', 'Grillowany chleb']
+        assert self.suggest('chleb z') == ['Chleb żytni']
+        assert self.suggest('sledz') == ['Śledziki']
+        assert self.suggest('LOS') == ['Łosoś']
+        assert self.suggest('chl', limit=2) == ['Chleb', 'Chleb żytni']
+        assert self.suggest('xyz') == []
+
+    def test_products_suggest_follows_writes(self):
+        """Testing GET products suggest view reflects created, renamed and deleted products without queries"""
+        self.suggest('ch')
+        self.client.post(reverse('product'), {'name': 'Chałwa', 'kcal': 500, 'carbs': 50, 'proteins': 10, 'fat': 30})
+        Product.objects.filter(id=self.products['Chleb']).delete()
+        product = Product.objects.get(id=self.products['Ser'])
+        product.name = 'Chrzan'
+        product.save()
+        with self.assertNumQueries(0):
+            assert self.suggest('ch') == ['Chałwa', 'Chleb żytni', 'Chrzan', 'Grillowany chleb']
+
+    def test_products_suggest_rolled_back_write(self):
+        """Testing GET products suggest view doesn't return products of rolled back transaction"""
+        self.suggest('ch')
+        try:
+            with transaction.atomic():
+                Product.objects.create(name='Chałwa', kcal=500, carbs=50, proteins=10, fat=30)
+                Product.objects.filter(id=self.products['Chleb']).delete()
+                raise IntegrityError
+
+        except IntegrityError:
+            pass
+        assert self.suggest('ch') == ['Chleb', 'Chleb żytni', 'Grillowany chleb']
+
+    def test_products_suggest_stale_index(self):
+        """Testing GET products suggest view serves old index while it is rebuilt in background"""
+        self.suggest('ch')
+        products_index.built_at -= autocomplete_options()['MAX_AGE'] + 1
+        with mock.patch('diet_app.autocomplete.threading.Thread') as thread, self.assertNumQueries(0):
+            assert self.suggest('chl') == ['Chleb', 'Chleb żytni', 'Grillowany chleb']
+            assert self.suggest('chl') == ['Chleb', 'Chleb żytni', 'Grillowany chleb']
+        thread.assert_called_once_with(target=products_index.rebuild, daemon=True)
+
+    def test_products_suggest_write_during_rebuild(self):
+        """Testing rebuilt index keeps products changed while it was reading them"""
+        self.suggest('ch')
+        rows = list(products_index.rows())
+
+        def changing_rows():
+            yield rows[0]
+            # Committed by other requests after the rows were read.
+            Product.objects.filter(id=self.products['Ser']).delete()
+            Product.objects.create(name='Chrzan', kcal=40, carbs=8, proteins=2, fat=1)
+            yield from rows[1:]
+
+        with mock.patch.object(products_index, 'rows', changing_rows):
+            products_index.rebuild()
+        assert self.suggest('ch') == ['Chleb', 'Chleb żytni', 'Chrzan', 'Grillowany chleb']
+        assert self.suggest('ser') == []
+
+    def test_products_suggest_incorrect_params(self):
+        """Testing GET products suggest view with incorrect params"""
+        response = self.client.get(reverse('products-suggest'), {'prefix': 'ch', 'limit': 100})
+        assert response.status_code == 400
+        assert response.json() == {'limit': ['Ensure this value is less than or equal to 50.']}
+
+    def test_products_suggest_missing_params(self):
+        """Testing GET products suggest view with missing params"""
+        response = self.client.get(reverse('products-suggest'))
+        assert response.status_code == 400
+        assert response.json() == {'prefix': ['This field is required.']}
+
+
+class RecentProductsViewTests(TestCase):
+    def setUp(self):
+        """Setting up for test"""
+        self.client = APIClient()
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
+        self.other = Profile.objects.create(user=User.objects.create(username='other', password='passsssss',
+                                                                     email='other@example.com'))
+        self.meal = Meal.objects.create(meal_type=MealType.objects.create(
+            diary=Diary.objects.create(user=self.user, date='2017-12-13'), name='Śniadanko'))
+        self.other_meal = Meal.objects.create(meal_type=MealType.objects.create(
+            diary=Diary.objects.create(user=self.other, date='2017-12-13'), name='Śniadanko'))
+        self.products = {name: Product.objects.create(name=name, kcal=100, carbs=10, proteins=10, fat=5)
+                         for name in ['Chleb', 'Masło', 'Ser', 'Jajko']}
+
+    def add(self, name, amount=100, meal=None):
+        self.client.post(reverse('ingredient'), {'product_id': self.products[name].id,
+                                                 'meal_id': (meal or self.meal).id, 'amount': amount})
+
+    def recent(self, **params):
+        response = self.client.get(reverse('products-recent'), dict({'user_id': self.user.id}, **params))
+        assert response.status_code == 200
+        return [product['name'] for product in response.json()]
+
+    def test_products_recent_get(self):
+        """Testing GET recent products view ranks products added to meals by number of uses"""
+        for amount in [50, 100, 150]:
+            self.add('Chleb', amount)
+        self.add('Ser')
+        self.add('Ser', 30)
+        self.add('Masło')
+        self.add('Jajko', meal=self.other_meal)
+        response = self.client.get(reverse('products-recent'), {'user_id': self.user.id})
+        product = response.json()[0]
+        assert product['product_id'] == self.products['Chleb'].id
+        assert (product['kcal'], product['uses']) == (100, 3)
+        assert 2.9 < product['score'] <= 3
+        assert self.recent() == ['Chleb', 'Ser', 'Masło']
+        assert self.recent(limit=2) == ['Chleb', 'Ser']
+        assert self.recent(user_id=self.other.id) == ['Jajko']
+
+    def test_products_recent_decay(self):
+        """Testing GET recent products view ranks recent uses above older frequent ones"""
+        now = timezone.now()
+        for days in [30, 29, 28]:
+            ProductUsage.objects.record([Ingredient(meal=self.meal, product=self.products['Chleb'], amount=100)],
+                                        when=now - datetime.timedelta(days=days))
+        ProductUsage.objects.record([Ingredient(meal=self.meal, product=self.products['Ser'], amount=100)],
+                                    when=now - datetime.timedelta(days=1))
+        assert self.recent() == ['Ser', 'Chleb']
+        self.add('Chleb')
+        assert self.recent() == ['Chleb', 'Ser']
+
+    def test_products_recent_not_counting_existing_ingredient(self):
+        """Testing POST ingredient view doesn't count the same ingredient posted again"""
+        self.add('Chleb')
+        self.add('Chleb')
+        assert ProductUsage.objects.get(user=self.user).uses == 1
+
+    def test_products_recent_concurrent_first_use(self):
+        """Testing POST ingredient view counts product whose ranking row was created by a concurrent request"""
+        current = ProductUsageManager.current
+        calls = []
+
+        def stale(manager, keys):
+            # The first read misses the row, as if the other request committed it right after.
+            calls.append(keys)
+            return {} if len(calls) == 1 else current(manager, keys)
+
+        ProductUsage.objects.record([Ingredient(meal=self.meal, product=self.products['Chleb'], amount=100)])
+        with mock.patch.object(ProductUsageManager, 'current', stale):
+            self.add('Chleb')
+            self.add('Ser')
+        assert dict(ProductUsage.objects.values_list('product__name', 'uses')) == {'Chleb': 2, 'Ser': 1}
+
+    def test_products_recent_batch_update(self):
+        """Testing POST ingredient view updates ranking of products used before in a single query"""
+        self.add('Chleb')
+        self.add('Ser')
+        ingredients = [Ingredient(meal=self.meal, product=self.products[name], amount=100)
+                       for name in ['Chleb', 'Ser', 'Chleb']]
+        with CaptureQueriesContext(connection) as queries:
+            ProductUsage.objects.record(ingredients)
+        assert [query['sql'].split()[0] for query in queries] == ['SELECT', 'SELECT', 'UPDATE']
+        assert dict(ProductUsage.objects.values_list('product__name', 'uses')) == {'Chleb': 3, 'Ser': 2}
+        assert self.recent() == ['Chleb', 'Ser']
+
+    def test_products_recent_rebuild(self):
+        """Testing rebuilt ranking equals the one maintained by ingredient view"""
+        for name in ['Chleb', 'Ser', 'Chleb', 'Masło']:
+            self.add(name, amount=len(Ingredient.objects.all()) + 1)
+        self.add('Jajko', meal=self.other_meal)
+        ranking = list(ProductUsage.objects.order_by('user', '-rank').values_list('user', 'product', 'uses'))
+        ProductUsage.objects.rebuild()
+        assert list(ProductUsage.objects.order_by('user', '-rank').values_list('user', 'product', 'uses')) == \
+            ranking
+
+    def test_products_recent_query_count(self):
+        """Testing GET recent products view runs a single query"""
+        self.add('Chleb')
+        with self.assertNumQueries(1):
+            self.recent()
+
+    def test_products_recent_incorrect_params(self):
+        """Testing GET recent products view with incorrect params"""
+        response = self.client.get(reverse('products-recent'), {'user_id': self.user.id, 'limit': 0})
+        assert response.status_code == 400
+        assert response.json() == {'limit': ['Ensure this value is greater than or equal to 1.']}
+
+    def test_products_recent_missing_params(self):
+        """Testing GET recent products view with missing params"""
+        response = self.client.get(reverse('products-recent'))
+        assert response.status_code == 400
+        assert response.json() == {'user_id': ['This field is required.']}
+
+
 class IngredientViewTests(TestCase):
     def setUp(self):
         """Setting up for test"""
         self.factory = APIRequestFactory()
         self.client = APIClient()
         self.date = "2017-12-13"
-        self.user = Profile.objects.create(username='testytest', password='passsssss')
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
         self.diary = Diary.objects.create(user=self.user, date=self.date)
         self.meal_type = MealType.objects.create(diary=self.diary, name='Śniadanko')
         self.meal = Meal.objects.create(meal_type=self.meal_type)
@@ -397,6 +1020,55 @@ class IngredientViewTests(TestCase):
         assert count == Ingredient.objects.all().count() - 1
         assert response.json() == {'ingredient_id': new_ingredient.id}
 
+    def test_ingredient_post_query_count(self):
+        """Testing POST ingredient view runs only lookup, insert, meal totals, diary and product ranking update"""
+        with self.assertNumQueries(18):
+            self.client.post(reverse('ingredient'), {'product_id': self.product2.id,
+                                                     'meal_id': self.meal.id,
+                                                     'amount': 3})
+
+    def test_ingredient_post_updates_meal_totals(self):
+        """Testing POST ingredient view recalculates meal totals"""
+        self.client.post(reverse('ingredient'), {'product_id': self.product2.id,
+                                                 'meal_id': self.meal.id,
+                                                 'amount': 150})
+        meal = Meal.objects.get(id=self.meal.id)
+        assert meal.total_kcal == 2.2 * 500 / 100 + 150 * 400 / 100
+        assert meal.total_carbs == 2.2 * 10 / 100
+        assert meal.total_proteins == 2.2 * 10 / 100 + 150 * 20 / 100
+        assert meal.total_fat == 2.2 * 10 / 100 + 150 * 15 / 100
+
+    def test_ingredient_delete_updates_meal_totals(self):
+        """Testing DELETE ingredient view recalculates meal totals"""
+        self.client.delete(reverse('ingredient'), {'id': self.ingredient.id})
+        meal = Meal.objects.get(id=self.meal.id)
+        assert meal.total_kcal == 0
+        assert meal.total_carbs == 0
+        assert meal.total_proteins == 0
+        assert meal.total_fat == 0
+
+    def test_ingredient_post_batch(self):
+        """Testing POST ingredient view with list of ingredients"""
+        data = [{'product_id': self.product1.id, 'meal_id': self.meal.id, 'amount': 100},
+                {'product_id': self.product2.id, 'meal_id': self.meal.id, 'amount': 50}]
+        with self.assertNumQueries(16):
+            response = self.client.post(reverse('ingredient'), data, format='json')
+        ingredients = Ingredient.objects.filter(id__gt=self.ingredient.id).order_by('id')
+        assert response.status_code == 200
+        assert response.json() == [{'ingredient_id': ingredient.id} for ingredient in ingredients]
+        assert [ingredient.amount for ingredient in ingredients] == [100, 50]
+        assert Meal.objects.get(id=self.meal.id).total_kcal == 2.2 * 500 / 100 + 500 + 200
+
+    def test_ingredient_post_batch_incorrect_params(self):
+        """Testing POST ingredient view with list containing incorrect ingredient"""
+        count = Ingredient.objects.all().count()
+        data = [{'product_id': self.product1.id, 'meal_id': self.meal.id, 'amount': 100},
+                {'product_id': self.product2.id, 'meal_id': self.meal.id, 'amount': 'kanapka'}]
+        response = self.client.post(reverse('ingredient'), data, format='json')
+        assert response.status_code == 400
+        assert response.json() == [{}, {'amount': ['A valid number is required.']}]
+        assert count == Ingredient.objects.all().count()
+
     def test_ingredient_post_incorrect_params(self):
         """Testing POST ingredient view with incorrect params"""
         response = self.client.post(reverse('ingredient'), {'product_id': self.product1.id,
@@ -443,7 +1115,7 @@ class MealViewTests(TestCase):
         self.factory = APIRequestFactory()
         self.client = APIClient()
         self.date = "2017-12-13"
-        self.user = Profile.objects.create(username='testytest', password='passsssss')
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
         self.diary = Diary.objects.create(user=self.user, date=self.date)
         self.meal_type1 = MealType.objects.create(diary=self.diary, name='Śniadanko')
         self.meal_type2 = MealType.objects.create(diary=self.diary, name='Lunch')
@@ -487,6 +1159,20 @@ class MealViewTests(TestCase):
         assert count + 1 == Meal.objects.all().count()
         assert response.json() == {'meal_id': new_meal.id}
 
+    def test_meal_post_existing_meal(self):
+        """Testing POST meal view for meal type that already has a meal"""
+        count = Meal.objects.all().count()
+        response = self.client.post(reverse('meal'), {'meal_type_id': self.meal_type1.id})
+        assert response.status_code == 200
+        assert response.json() == {'meal_id': self.meal.id}
+        assert count == Meal.objects.all().count()
+
+    def test_meal_post_query_count(self):
+        """Testing POST meal view runs only lookup, insert and diary update"""
+        with self.assertNumQueries(12):
+            response = self.client.post(reverse('meal'), {'meal_type_id': self.meal_type2.id})
+        assert response.json() == {'meal_id': Meal.objects.get(meal_type=self.meal_type2).id}
+
     def test_meal_post_incorrect_params(self):
         """Testing POST meal view with incorrect params"""
         count = Meal.objects.all().count()
@@ -573,7 +1259,7 @@ class MealTypeViewTests(TestCase):
         self.client = APIClient()
         self.date = "2017-12-13"
         self.name = 'Przystawka'
-        self.user = Profile.objects.create(username='testytest', password='passsssss')
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
         self.diary = Diary.objects.create(user=self.user, date=self.date)
         self.meal_type1 = MealType.objects.create(diary=self.diary, name='Śniadanko')
         self.meal_type2 = MealType.objects.create(diary=self.diary, name='Lunch')
@@ -618,6 +1304,12 @@ class MealTypeViewTests(TestCase):
         assert response.json() == {'meal_type_id': meal_type.id}
         assert count + 1 == MealType.objects.all().count()
 
+    def test_meal_type_post_query_count(self):
+        """Testing POST meal type view runs only lookup, insert and diary update"""
+        with self.assertNumQueries(12):
+            response = self.client.post(reverse('meal-type'), {'diary_id': self.diary.id, 'name': 'Kolacja'})
+        assert response.json() == {'meal_type_id': MealType.objects.get(name='Kolacja').id}
+
     def test_meal_type_post_incorrect_params(self):
         """Testing POST meal-type view with incorrect params"""
         count = MealType.objects.all().count()
@@ -667,7 +1359,7 @@ class MealTypesViewTests(TestCase):
         self.client = APIClient()
         self.date = "2017-12-13"
         self.name = 'Przystawka'
-        self.user = Profile.objects.create(username='testytest', password='passsssss')
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
         self.diary = Diary.objects.create(user=self.user, date=self.date)
         self.meal_type1 = MealType.objects.create(diary=self.diary, name='Śniadanko')
         self.meal_type2 = MealType.objects.create(diary=self.diary, name='Lunch')
@@ -693,6 +1385,41 @@ class MealTypesViewTests(TestCase):
                 'total_fat': None, 'ingredients': [{'ingredient_id': 3, 'name': 'Śledziki', 'amount': 0.3}]}
         ]
 
+    def test_meal_types_get_query_count(self):
+        """Testing GET meal-types view runs constant number of queries"""
+        with self.assertNumQueries(3):
+            self.client.get(reverse('meal-types'), {'diary_id': self.diary.id})
+
+        for name in ['Obiad', 'Podwieczorek', 'Kolacja']:
+            meal = Meal.objects.create(meal_type=MealType.objects.create(diary=self.diary, name=name))
+            Ingredient.objects.create(meal=meal, product=self.product1, amount=1)
+            Ingredient.objects.create(meal=meal, product=self.product2, amount=2)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('meal-types'), {'diary_id': self.diary.id})
+        assert len(response.json()) == 5
+
+    def test_meal_types_get_not_modified(self):
+        """Testing GET meal-types view with If-None-Match header"""
+        response = self.client.get(reverse('meal-types'), {'diary_id': self.diary.id})
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('meal-types'), {'diary_id': self.diary.id}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+
+        self.client.post(reverse('ingredient'), {'product_id': self.product1.id, 'meal_id': self.meal2.id, 'amount': 5})
+        response = self.client.get(reverse('meal-types'), {'diary_id': self.diary.id}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+        assert len(response.json()[1]['ingredients']) == 2
+
+    def test_meal_types_get_not_existing_diary(self):
+        """Testing GET meal-types view with not existing diary"""
+        response = self.client.get(reverse('meal-types'), {'diary_id': 1000})
+        assert response.status_code == 200
+        assert response.json() == {}
+
     def test_meal_types_get_incorrect_params(self):
         """Testing GET meal-types view with incorrect params"""
         response = self.client.get(reverse('meal-types'), {'diary_id': 'abc'})
@@ -730,11 +1457,19 @@ class UserViewTests(TestCase):
         response = self.client.post(reverse('user'), {'username': self.username2,
                                                       'password': self.password2,
                                                       'email': self.email2})
-        user = Profile.objects.get(id=2)
+        user = Profile.objects.get(pk=2)
         assert response.status_code == 200
         assert response.json() == {'user_id': user.id}
         assert count + 1 == Profile.objects.all().count()
 
+    def test_user_post_query_count(self):
+        """Testing POST user view runs only inserts"""
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('user'), {'username': self.username2,
+                                                          'password': self.password2,
+                                                          'email': self.email2})
+        assert response.json() == {'user_id': Profile.objects.get(user__username=self.username2).id}
+
     def test_user_post_incorrect_params(self):
         """Testing POST user view with incorrect params"""
         count = Profile.objects.all().count()
@@ -756,41 +1491,48 @@ class UserViewTests(TestCase):
 
     def test_user_put_correct_params(self):
         """Testing PUT user view with correct params"""
-        old_user = Profile.objects.get(id=self.user.id)
+        old_user = Profile.objects.get(pk=self.user.id)
         response = self.client.put(reverse('user'), {'id': self.user.id,
                                                      'height': self.height,
                                                      'gender': self.gender,
                                                      'daily_carbs': self.daily_carbs,
                                                      'daily_fat': self.daily_fat,
                                                      'daily_proteins': self.daily_proteins})
-        updated_user = Profile.objects.get(id=self.user.id)
+        updated_user = Profile.objects.get(pk=self.user.id)
         assert response.status_code == 200
         assert response.json() == {}
         assert old_user.daily_proteins != updated_user.daily_proteins
 
+    def test_user_put_query_count(self):
+        """Testing PUT user view updates only profile table"""
+        with CaptureQueriesContext(connection) as context:
+            self.client.put(reverse('user'), {'id': self.user.id, 'height': self.height})
+        assert [query['sql'].split()[:2] for query in context.captured_queries] == [['UPDATE',
+                                                                                     '"diet_app_profile"']]
+
     def test_user_put_incorrect_params(self):
         """Testing PUT user view with incorrect params"""
-        old_user = Profile.objects.get(id=self.user.id)
+        old_user = Profile.objects.get(pk=self.user.id)
         response = self.client.put(reverse('user'), {'id': 'kanapka',
                                                      'height': self.height,
                                                      'gender': self.gender,
                                                      'daily_carbs': self.daily_carbs,
                                                      'daily_fat': self.daily_fat,
                                                      'daily_proteins': self.daily_proteins})
-        updated_user = Profile.objects.get(id=self.user.id)
+        updated_user = Profile.objects.get(pk=self.user.id)
         assert response.status_code == 400
         assert response.json() == {'id': ['A valid integer is required.']}
         assert old_user.daily_proteins == updated_user.daily_proteins
 
     def test_user_put_missing_params(self):
         """Testing PUT user view with missing params"""
-        old_user = Profile.objects.get(id=self.user.id)
+        old_user = Profile.objects.get(pk=self.user.id)
         response = self.client.put(reverse('user'), {'height': self.height,
                                                      'gender': self.gender,
                                                      'daily_carbs': self.daily_carbs,
                                                      'daily_fat': self.daily_fat,
                                                      'daily_proteins': self.daily_proteins})
-        updated_user = Profile.objects.get(id=self.user.id)
+        updated_user = Profile.objects.get(pk=self.user.id)
         assert response.status_code == 400
         assert response.json() == {'id': ['This field is required.']}
         assert old_user.daily_proteins == updated_user.daily_proteins
@@ -804,6 +1546,26 @@ class UserViewTests(TestCase):
         assert response.json() == {}
         assert count == Profile.objects.all().count() + 1
 
+    def test_user_delete_with_token(self):
+        """Testing DELETE user view with token of the user instead of password"""
+        count = Profile.objects.all().count()
+        response = self.client.delete(reverse('user'), {'id': self.user.id},
+                                      HTTP_AUTHORIZATION='Token ' + issue_token(self.user.user))
+        assert response.status_code == 200
+        assert response.json() == {}
+        assert count == Profile.objects.all().count() + 1
+        assert not User.objects.filter(id=self.user.id).exists()
+
+    def test_user_delete_with_token_of_other_user(self):
+        """Testing DELETE user view with token of other user and without password"""
+        other = Profile.objects.create_user(username=self.username2, password=self.password2, email=self.email2)
+        count = Profile.objects.all().count()
+        response = self.client.delete(reverse('user'), {'id': self.user.id},
+                                      HTTP_AUTHORIZATION='Token ' + issue_token(other.user))
+        assert response.status_code == 200
+        assert response.json() == {}
+        assert count == Profile.objects.all().count()
+
     def test_user_delete_incorrect_params(self):
         """Testing DELETE user view with incorrect params"""
         count = Profile.objects.all().count()
@@ -833,7 +1595,7 @@ class ProfileViewTests(TestCase):
         self.user = Profile.objects.create_user(username=self.username1,
                                                 password=self.password1,
                                                 email=self.email1)
-        Profile.objects.filter(id=self.user.id).update(height=180,
+        Profile.objects.filter(pk=self.user.id).update(height=180,
                                                        gender='M',
                                                        daily_carbs=20,
                                                        daily_fat=20,
@@ -850,6 +1612,28 @@ class ProfileViewTests(TestCase):
                                    'daily_proteins': 20.0,
                                    'daily_fat': 20.0}
 
+    def test_profile_post_not_modified(self):
+        """Testing POST profile view with If-None-Match header"""
+        response = self.client.post(reverse('profile'), {'id': self.user.id})
+        etag = response['ETag']
+        response = self.client.post(reverse('profile'), {'id': self.user.id}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+        self.client.put(reverse('user'), {'id': self.user.id, 'height': 181})
+        response = self.client.post(reverse('profile'), {'id': self.user.id}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.json()['height'] == 181
+
+    def test_profile_post_queries(self):
+        """Testing POST profile view joins only username of the user"""
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('profile'), {'id': self.user.id})
+        version, profile = [query['sql'] for query in context.captured_queries]
+        assert 'JOIN' not in version
+        assert profile.count('JOIN') == 1
+        assert '"auth_user"."username"' in profile
+        assert '"auth_user"."email"' not in profile
+
     def test_profile_post_incorrect_params(self):
         """Testing POST profile view with incorrect params"""
         response = self.client.post(reverse('profile'), {'id': 'kanapka'})
@@ -903,13 +1687,71 @@ class WeightViewTests(TestCase):
         """Testing POST weight view with correct params"""
         count = Weight.objects.all().count()
         response = self.client.post(reverse('weight'), {'user_id': self.user.id,
-                                                        'date': "2017-12-14",
+                                                        'date': "2017-12-15",
                                                         'value': 80})
         weight = Weight.objects.get(id=3)
         assert response.status_code == 200
         assert response.json() == {'weight_id': weight.id}
         assert count + 1 == Weight.objects.all().count()
 
+    def test_weight_post_same_date(self):
+        """Testing POST weight view replaces value of the weight the user gave for the same date"""
+        response = self.client.post(reverse('weight'), {'user_id': self.user.id, 'date': self.date2, 'value': 80})
+        assert response.status_code == 200
+        assert response.json() == {'weight_id': self.weight2.id}
+        assert Weight.objects.get(id=self.weight2.id).value == 80
+        assert Weight.objects.count() == 2
+        assert self.client.get(reverse('weight'), {'user_id': self.user.id,
+                                                   'date': self.date2}).json() == {'weight_id': self.weight2.id}
+
+    def test_weight_post_batch(self):
+        """Testing POST weight view with list of weights"""
+        data = [{'user_id': self.user.id, 'date': '2017-12-15', 'value': 121},
+                {'user_id': self.user.id, 'date': '2017-12-16', 'value': 120}]
+        response = self.client.post(reverse('weight'), data, format='json')
+        weights = Weight.objects.filter(date__gt=self.date2).order_by('id')
+        assert response.status_code == 200
+        assert response.json() == [{'weight_id': weight.id} for weight in weights]
+        assert [weight.value for weight in weights] == [121, 120]
+
+    def test_weight_post_batch_same_date(self):
+        """Testing POST weight view with list of weights replaces values given for the same date before"""
+        data = [{'user_id': self.user.id, 'date': self.date, 'value': 121},
+                {'user_id': self.user.id, 'date': '2017-12-15', 'value': 120},
+                {'user_id': self.user.id, 'date': '2017-12-15', 'value': 119}]
+        response = self.client.post(reverse('weight'), data, format='json')
+        new = Weight.objects.get(date='2017-12-15')
+        assert response.status_code == 200
+        assert response.json() == [{'weight_id': self.weight.id}, {'weight_id': new.id}, {'weight_id': new.id}]
+        assert dict(Weight.objects.values_list('date', 'value')) == {datetime.date(2017, 12, 13): 121,
+                                                                     datetime.date(2017, 12, 14): 122,
+                                                                     datetime.date(2017, 12, 15): 119}
+
+    def test_weight_post_batch_concurrent_first_write(self):
+        """Testing POST weight view with list of weights replaces weight created by a concurrent request"""
+        current = WeightManager.current
+        calls = []
+
+        def stale(manager, keys):
+            # The first read misses the weight, as if the other request committed it right after.
+            calls.append(keys)
+            return {} if len(calls) == 1 else current(manager, keys)
+
+        data = [{'user_id': self.user.id, 'date': self.date, 'value': 121},
+                {'user_id': self.user.id, 'date': '2017-12-15', 'value': 120}]
+        with mock.patch.object(WeightManager, 'current', stale):
+            response = self.client.post(reverse('weight'), data, format='json')
+        assert response.status_code == 200
+        assert response.json()[0] == {'weight_id': self.weight.id}
+        assert Weight.objects.get(id=self.weight.id).value == 121
+        assert Weight.objects.count() == 3
+
+    def test_weight_post_query_count(self):
+        """Testing POST weight view runs only lookup and insert"""
+        with self.assertNumQueries(6):
+            response = self.client.post(reverse('weight'), {'user_id': self.user.id, 'date': '2017-12-20', 'value': 80})
+        assert response.json() == {'weight_id': Weight.objects.get(date='2017-12-20').id}
+
     def test_weight_post_incorrect_params(self):
         """Testing POST weight view with incorrect params"""
         count = Weight.objects.all().count()
@@ -964,6 +1806,50 @@ class WeightViewTests(TestCase):
              'date': self.weight2.date}
         ]
 
+    def test_weights_get_pages(self):
+        """Testing GET weights view returns pages ordered by date"""
+        weight3 = Weight.objects.create(user=self.user, date='2017-12-01', value=125)
+        response = self.client.get(reverse('weights'), {'user_id': self.user.id, 'limit': 2})
+        assert response.status_code == 200
+        assert response.json() == [{'value': weight3.value, 'date': weight3.date},
+                                   {'value': self.weight.value, 'date': self.weight.date}]
+
+        next_page = response['Link'][1:response['Link'].index('>')]
+        response = self.client.get(next_page)
+        assert response.status_code == 200
+        assert response.json() == [{'value': self.weight2.value, 'date': self.weight2.date}]
+        assert 'Link' not in response
+
+    def test_weights_get_not_modified(self):
+        """Testing GET weights view with If-None-Match header"""
+        response = self.client.get(reverse('weights'), {'user_id': self.user.id})
+        etag = response['ETag']
+        response = self.client.get(reverse('weights'), {'user_id': self.user.id}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+        response = self.client.get(reverse('weights'), {'user_id': self.user.id, 'limit': 1}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+        self.client.delete(reverse('weight'), {'id': self.weight.id})
+        response = self.client.get(reverse('weights'), {'user_id': self.user.id}, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response.json() == [{'value': self.weight2.value, 'date': self.weight2.date}]
+
+    def test_weights_get_incorrect_cursor(self):
+        """Testing GET weights view with incorrect cursor"""
+        response = self.client.get(reverse('weights'), {'user_id': self.user.id, 'cursor': 'kanapka'})
+        assert response.status_code == 400
+        assert response.json() == {'cursor': ['Invalid cursor.']}
+
+        response = self.client.get(reverse('weights'), {'user_id': self.user.id,
+                                                        'cursor': encode_cursor(['2018-13-01', 1])})
+        assert response.status_code == 400
+        assert response.json() == {'cursor': ['Invalid cursor.']}
+
+        response = self.client.get(reverse('weights'), {'user_id': self.user.id, 'limit': 0})
+        assert response.status_code == 400
+        assert response.json() == {'limit': ['Ensure this value is greater than or equal to 1.']}
+
     def test_weights_get_incorrect_params(self):
         """Testing GET weights view with incorrect params"""
         response = self.client.get(reverse('weights'), {'user_id': 'abc'})
@@ -977,6 +1863,232 @@ class WeightViewTests(TestCase):
         assert response.json() == {'user_id': ['This field is required.']}
 
 
+class WeightSeriesViewTests(TestCase):
+    def setUp(self):
+        """Setting up for test."""
+        self.client = APIClient()
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
+        # Mondays 2018-01-01 and 2018-01-08.
+        for date, value in [('2018-01-01', 80), ('2018-01-03', 81), ('2018-01-04', 83), ('2018-01-08', 79),
+                            ('2018-02-01', 78), ('2018-02-10', 76)]:
+            Weight.objects.create(user=self.user, date=date, value=value)
+
+    def series(self, **params):
+        response = self.client.get(reverse('weight-series'), dict(user_id=self.user.id, **params))
+        assert response.status_code == 200
+        return [(point['date'], point['value']) for point in response.json()]
+
+    def test_weight_series_get_range(self):
+        """Testing GET weight series view returns weights from range ordered by date"""
+        assert self.series(date_from='2018-01-03', date_to='2018-01-31') == [('2018-01-03', 81), ('2018-01-04', 83),
+                                                                            ('2018-01-08', 79)]
+        assert self.series(date_from='2018-01-08', ordering='-date') == [('2018-02-10', 76), ('2018-02-01', 78),
+                                                                        ('2018-01-08', 79)]
+
+    def test_weight_series_get_buckets(self):
+        """Testing GET weight series view averages weights in days, weeks and months"""
+        assert self.series(bucket='day', date_to='2018-01-31') == [('2018-01-01', 80), ('2018-01-03', 81),
+                                                                  ('2018-01-04', 83), ('2018-01-08', 79)]
+        assert self.series(bucket='week', date_to='2018-01-31') == [('2018-01-01', 244 / 3), ('2018-01-08', 79)]
+        assert self.series(bucket='month') == [('2018-01-01', 80.75), ('2018-02-01', 77)]
+
+    def test_weight_series_get_moving_average(self):
+        """Testing GET weight series view adds moving average of given window"""
+        response = self.client.get(reverse('weight-series'), {'user_id': self.user.id, 'bucket': 'day',
+                                                              'window': 2})
+        assert [point['average'] for point in response.json()] == [80, 80.5, 82, 81, 78.5, 77]
+
+    def test_weight_series_get_max_points(self):
+        """Testing GET weight series view reduces number of points keeping the first and the last one"""
+        series = self.series(max_points=3)
+        assert len(series) == 3
+        assert series[0] == ('2018-01-01', 80)
+        assert series[-1] == ('2018-02-10', 76)
+
+    def test_weight_series_get_query_count(self):
+        """Testing GET weight series view runs one query besides ETag version"""
+        with self.assertNumQueries(2):
+            self.series(bucket='week', window=3, max_points=10)
+
+    def test_weight_series_get_incorrect_params(self):
+        """Testing GET weight series view with incorrect params"""
+        response = self.client.get(reverse('weight-series'), {'user_id': self.user.id, 'bucket': 'year'})
+        assert response.status_code == 400
+        assert response.json() == {'bucket': ['"year" is not a valid choice.']}
+
+
+class SyncViewTests(TestCase):
+    def setUp(self):
+        """Setting up for test."""
+        self.client = APIClient()
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
+        self.other = Profile.objects.create(user=User.objects.create(username='other', password='passsssss'))
+        self.product = Product.objects.create(name='Apple', kcal=50, carbs=12, proteins=0.3, fat=0.2)
+        self.discipline = Discipline.objects.create(name='Running', calories_burn=600)
+        self.diary = Diary.objects.create(user=self.user, date='2018-01-01')
+        self.meal_type = MealType.objects.create(diary=self.diary, name='Breakfast')
+        self.meal = Meal.objects.create(meal_type=self.meal_type)
+        self.ingredient = Ingredient.objects.create(meal=self.meal, product=self.product, amount=100)
+        self.activity = Activity.objects.create(diary=self.diary, discipline=self.discipline, time='00:30:00')
+        self.weight = Weight.objects.create(user=self.user, date='2018-01-01', value=80)
+        Diary.objects.create(user=self.other, date='2018-01-01')
+
+    def sync(self, **params):
+        response = self.client.get(reverse('sync'), dict(user_id=self.user.id, **params))
+        assert response.status_code == 200
+        return response.json()
+
+    def upload(self, *operations):
+        return self.client.post(reverse('sync'), {'operations': list(operations)}, format='json')
+
+    def test_sync_get_all(self):
+        """Testing GET sync view without watermark returns all objects of the user"""
+        data = self.sync()
+        assert data['diaries'] == [{'id': self.diary.id, 'date': '2018-01-01'}]
+        assert data['meal_types'] == [{'id': self.meal_type.id, 'diary_id': self.diary.id, 'name': 'Breakfast'}]
+        assert [meal['id'] for meal in data['meals']] == [self.meal.id]
+        assert data['ingredients'] == [{'id': self.ingredient.id, 'meal_id': self.meal.id,
+                                        'product_id': self.product.id, 'amount': 100}]
+        assert data['activities'] == [{'id': self.activity.id, 'diary_id': self.diary.id,
+                                       'discipline_id': self.discipline.id, 'time': '00:30:00'}]
+        assert data['weights'] == [{'id': self.weight.id, 'date': '2018-01-01', 'value': 80}]
+        assert data['deleted'] == []
+
+    @override_settings(SYNC_MARGIN=0)
+    def test_sync_get_changes(self):
+        """Testing GET sync view with watermark returns only objects changed since then"""
+        watermark = self.sync()['watermark']
+        assert self.sync(since=watermark)['meals'] == []
+
+        self.client.put(reverse('meal'), {'id': self.meal.id, 'total_kcal': 300}, format='json')
+        data = self.sync(since=watermark)
+        assert [meal['id'] for meal in data['meals']] == [self.meal.id]
+        assert data['meals'][0]['total_kcal'] == 300
+        assert data['diaries'] == [{'id': self.diary.id, 'date': '2018-01-01'}]
+        assert data['meal_types'] == data['ingredients'] == data['activities'] == data['weights'] == []
+
+    @override_settings(SYNC_MARGIN=0)
+    def test_sync_get_deleted(self):
+        """Testing GET sync view returns objects deleted since watermark, including cascaded ones"""
+        watermark = self.sync()['watermark']
+        self.client.delete(reverse('weight'), {'id': self.weight.id}, format='json')
+        self.client.delete(reverse('meal-type'), {'id': self.meal_type.id}, format='json')
+        data = self.sync(since=watermark)
+        assert sorted((item['model'], item['id']) for item in data['deleted']) == sorted([
+            ('weight', self.weight.id), ('mealtype', self.meal_type.id), ('meal', self.meal.id),
+            ('ingredient', self.ingredient.id)])
+        assert self.sync(since=self.sync()['watermark'])['deleted'] == []
+
+    def test_sync_get_late_commit(self):
+        """Testing GET sync view returns objects written before the previous sync but committed after it"""
+        data = self.sync()
+        watermark = data['watermark']
+        assert [diary['id'] for diary in self.sync(since=watermark)['diaries']] == [self.diary.id]
+
+        # Stamped while the previous sync was reading, but not visible to it yet.
+        stamped = timezone.now() - datetime.timedelta(seconds=1)
+        diary = Diary.objects.create(user=self.user, date='2018-01-02')
+        Diary.objects.filter(id=diary.id).update(updated_at=stamped)
+        self.client.delete(reverse('weight'), {'id': self.weight.id}, format='json')
+        Tombstone.objects.update(deleted_at=stamped)
+        assert diary.id not in [item['id'] for item in data['diaries']]
+
+        data = self.sync(since=watermark)
+        assert diary.id in [item['id'] for item in data['diaries']]
+        assert data['deleted'] == [{'model': 'weight', 'id': self.weight.id}]
+
+    def test_sync_delete_query_count(self):
+        """Testing DELETE meal type view writes tombstones of cascaded objects in bulk, whatever their number"""
+        Ingredient.objects.bulk_create([Ingredient(meal=self.meal, product=self.product, amount=amount)
+                                        for amount in range(60)])
+        with self.assertNumQueries(18):
+            response = self.client.delete(reverse('meal-type'), {'id': self.meal_type.id}, format='json')
+        assert response.status_code == 200
+        assert Tombstone.objects.filter(model='ingredient').count() == 61
+        assert Tombstone.objects.filter(user=self.user).count() == 63
+
+    def test_sync_get_query_count(self):
+        """Testing GET sync view runs one query per model"""
+        with self.assertNumQueries(7):
+            self.sync(since='2018-01-01T00:00:00Z')
+
+    def test_sync_get_missing_params(self):
+        """Testing GET sync view with missing params"""
+        response = self.client.get(reverse('sync'))
+        assert response.status_code == 400
+        assert response.json() == {'user_id': ['This field is required.']}
+
+    def test_sync_post_correct_params(self):
+        """Testing POST sync view applies operations referring to objects created in the batch"""
+        response = self.upload(
+            {'model': 'diary', 'action': 'create', 'ref': 'diary',
+             'data': {'user_id': self.user.id, 'date': '2018-01-02'}},
+            {'model': 'mealtype', 'action': 'create', 'ref': 'lunch',
+             'data': {'diary_id': {'$ref': 'diary'}, 'name': 'Lunch'}},
+            {'model': 'meal', 'action': 'create', 'ref': 'meal', 'data': {'meal_type_id': {'$ref': 'lunch'}}},
+            {'model': 'ingredient', 'action': 'create',
+             'data': {'meal_id': {'$ref': 'meal'}, 'product_id': self.product.id, 'amount': 200}},
+            {'model': 'weight', 'action': 'delete', 'data': {'id': self.weight.id}})
+        assert response.status_code == 200
+        data = response.json()
+        diary = Diary.objects.get(user=self.user, date='2018-01-02')
+        meal = Meal.objects.get(meal_type__diary=diary)
+        assert data['refs'] == {'diary': diary.id, 'lunch': meal.meal_type_id, 'meal': meal.id}
+        assert data['results'][:3] == [{'id': diary.id}, {'id': meal.meal_type_id}, {'id': meal.id}]
+        assert data['results'][4] == {}
+        assert meal.total_kcal == 100
+        assert not Weight.objects.filter(id=self.weight.id).exists()
+
+    def test_sync_post_incorrect_params(self):
+        """Testing POST sync view with incorrect operation rolls back the whole batch"""
+        response = self.upload(
+            {'model': 'weight', 'action': 'delete', 'data': {'id': self.weight.id}},
+            {'model': 'mealtype', 'action': 'create', 'data': {'diary_id': {'$ref': 'diary'}, 'name': 'Lunch'}})
+        assert response.status_code == 400
+        assert response.json() == {'operations': [{}, {'diary_id': ['Unknown ref "diary".']}]}
+        assert Weight.objects.filter(id=self.weight.id).exists()
+
+        response = self.upload({'model': 'weight', 'action': 'update', 'data': {'id': self.weight.id}})
+        assert response.status_code == 400
+        assert response.json() == {'operations': [{'action': ['Not supported for weight.']}]}
+
+
+class JSONRendererTests(TestCase):
+    def setUp(self):
+        """Setting up for test."""
+        self.client = APIClient()
+        self.user = Profile.objects.create(user=User.objects.create(username='testytest', password='passsssss'))
+        Weight.objects.create(user=self.user, date='2018-01-01', value=80.5)
+
+    def test_backends_render_same_json(self):
+        """Testing JSON backends render dates, times and decimals the same way"""
+        data = {'date': datetime.date(2018, 1, 2), 'time': datetime.time(0, 30),
+                'created': datetime.datetime(2018, 1, 2, 10, 0, 0, 500, tzinfo=timezone.utc),
+                'amount': decimal.Decimal('1.5'), 'name': 'Jabłko'}
+        rendered = set()
+        for backend in BACKENDS:
+            with override_settings(JSON={'BACKEND': backend}):
+                rendered.add(FastJSONRenderer().render(data))
+        assert rendered == {'{"date":"2018-01-02","time":"00:30:00","created":"2018-01-02T10:00:00.000500Z",'
+                            '"amount":1.5,"name":"Jabłko"}'.encode()}
+
+    def test_backends_respond_same_json(self):
+        """Testing views respond with the same JSON with every backend"""
+        responses = set()
+        for backend in BACKENDS:
+            with override_settings(JSON={'BACKEND': backend}):
+                responses.add(self.client.get(reverse('weights'), {'user_id': self.user.id}).content)
+        assert len(responses) == 1
+
+    def test_parse_incorrect_json(self):
+        """Testing POST with malformed JSON body"""
+        for backend in BACKENDS:
+            with override_settings(JSON={'BACKEND': backend}):
+                response = self.client.post(reverse('weight'), '{"user_id": ', content_type='application/json')
+                assert response.status_code == 400
+                assert response.json()['detail'].startswith('JSON parse error')
+
+
 class LoginViewTests(TestCase):
     def setUp(self):
         """Setting up for test."""
@@ -991,21 +2103,193 @@ class LoginViewTests(TestCase):
 
     def test_login_post_correct_params(self):
         """Testing POST login view with correct params"""
-        response = self.client.post(reverse('login'), {'username': self.user.username,
+        response = self.client.post(reverse('login'), {'username': self.username,
                                                        'password': self.password})
         assert response.status_code == 200
-        assert response.json() == {'user_id': self.user.id}
+        assert response.json()['user_id'] == self.user.id
+        assert read_token(response.json()['token'])[0] == self.user.id
+
+    def test_login_post_queries(self):
+        """Testing POST login view loads only password of the user without joining profile"""
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('login'), {'username': self.username, 'password': self.password})
+        [query] = [query['sql'] for query in context.captured_queries]
+        assert 'JOIN' not in query
+        assert '"auth_user"."email"' not in query
+
+    def test_login_post_wrong_password(self):
+        """Testing POST login view with wrong password"""
+        response = self.client.post(reverse('login'), {'username': self.username,
+                                                       'password': 'wrong'})
+        assert response.status_code == 200
+        assert response.json() == {}
+
+    def test_login_token_authenticates_requests(self):
+        """Testing token returned by POST login view authenticates requests with a single query"""
+        token = self.client.post(reverse('login'), {'username': self.username,
+                                                    'password': self.password}).json()['token']
+        request = self.factory.get(reverse('diary'), HTTP_AUTHORIZATION='Token ' + token)
+        with self.assertNumQueries(1):
+            user, auth = SignedTokenAuthentication().authenticate(Request(request))
+        assert user.id == self.user.id
+        assert auth == token
+
+    def test_login_invalid_token(self):
+        """Testing request with invalid token is rejected"""
+        token = issue_token(self.user.user)
+        response = self.client.get(reverse('diary'), {'user_id': self.user.id, 'date': '2017-01-01'},
+                                   HTTP_AUTHORIZATION='Token ' + token[:-1] + ('a' if token[-1] != 'a' else 'b'))
+        assert response.status_code == 401
+        assert response.json() == {'detail': 'Invalid or expired token.'}
+
+    def test_login_revoked_token(self):
+        """Testing token is rejected after password change or deletion of the user"""
+        token = issue_token(self.user.user)
+        self.user.user.set_password('changed')
+        self.user.user.save()
+        response = self.client.get(reverse('diary'), {'user_id': self.user.id, 'date': '2017-01-01'},
+                                   HTTP_AUTHORIZATION='Token ' + token)
+        assert response.status_code == 401
+        assert response.json() == {'detail': 'Invalid or expired token.'}
+
+        token = issue_token(self.user.user)
+        User.objects.filter(id=self.user.id).delete()
+        response = self.client.get(reverse('diary'), {'user_id': self.user.id, 'date': '2017-01-01'},
+                                   HTTP_AUTHORIZATION='Token ' + token)
+        assert response.status_code == 401
+
+    def test_login_token_without_password(self):
+        """Testing token signed without password fragment is rejected"""
+        token = signing.dumps({'user_id': self.user.id}, salt=TOKEN_SALT)
+        response = self.client.get(reverse('diary'), {'user_id': self.user.id, 'date': '2017-01-01'},
+                                   HTTP_AUTHORIZATION='Token ' + token)
+        assert response.status_code == 401
+
+    @override_settings(TOKEN_MAX_AGE=-1)
+    def test_login_expired_token(self):
+        """Testing request with expired token is rejected"""
+        response = self.client.get(reverse('diary'), {'user_id': self.user.id, 'date': '2017-01-01'},
+                                   HTTP_AUTHORIZATION='Token ' + issue_token(self.user.user))
+        assert response.status_code == 401
 
     def test_login_post_incorrect_params(self):
         """Testing POST login view with incorrect params"""
-        response = self.client.post(reverse('login'), {'username': self.user.username,
+        response = self.client.post(reverse('login'), {'username': self.username,
                                                        'password': ''})
         assert response.status_code == 400
         assert response.json() == {'password': ['This field may not be blank.']}
 
     def test_login_post_missing_params(self):
         """Testing POST login view with missing params"""
-        response = self.client.post(reverse('login'), {'username': self.user.username})
+        response = self.client.post(reverse('login'), {'username': self.username})
         assert response.status_code == 400
         assert response.json() == {'password': ['This field is required.']}
 
+
+@override_settings(METRICS={'ENABLED': True})
+class MetricsViewTests(TestCase):
+    def setUp(self):
+        """Setting up for test."""
+        self.client = APIClient()
+        self.user = Profile.objects.create_user(username='jkowalski', password='kowi123', email='kowi@kowi.com')
+        self.diary = Diary.objects.create(user=self.user, date='2017-01-01')
+        self.admin = User.objects.create(username='admin', email='admin@example.com', is_staff=True)
+        registry.clear()
+
+    def test_server_timing_header(self):
+        """Testing responses contain Server-Timing header with number of queries and response size"""
+        response = self.client.get(reverse('diary'), {'user_id': self.user.id, 'date': '2017-01-01'})
+        assert response.status_code == 200
+        assert response['Server-Timing'].startswith('db;dur=')
+        assert 'desc="1 queries"' in response['Server-Timing']
+        assert response['Server-Timing'].endswith('size;desc="{} bytes"'.format(len(response.content)))
+
+    def test_metrics_get(self):
+        """Testing GET metrics view returns per-route histograms"""
+        self.client.get(reverse('diary'), {'user_id': self.user.id, 'date': '2017-01-01'})
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('metrics'))
+        assert response.status_code == 200
+        assert response['Content-Type'].startswith('text/plain')
+        body = response.content.decode()
+        assert '# TYPE diet_app_db_queries histogram' in body
+        assert 'diet_app_db_queries_bucket{route="diary",method="GET",le="0"} 0' in body
+        assert 'diet_app_db_queries_bucket{route="diary",method="GET",le="1"} 1' in body
+        assert 'diet_app_db_queries_count{route="diary",method="GET"} 1' in body
+        assert 'diet_app_request_duration_seconds_bucket{route="diary",method="GET",le="+Inf"} 1' in body
+
+    def test_metrics_get_not_admin(self):
+        """Testing GET metrics view rejects anonymous users and users who aren't staff"""
+        response = self.client.get(reverse('metrics'))
+        assert response.status_code == 401
+        assert 'diet_app' not in response.content.decode()
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + issue_token(self.user.user))
+        assert self.client.get(reverse('metrics')).status_code == 403
+
+        self.client.credentials()
+        self.client.force_authenticate(self.user.user)
+        assert self.client.get(reverse('metrics')).status_code == 403
+
+    @override_settings(METRICS={'ENABLED': False})
+    def test_metrics_disabled(self):
+        """Testing GET metrics view and Server-Timing header are not available when metrics are disabled"""
+        response = self.client.get(reverse('diary'), {'user_id': self.user.id, 'date': '2017-01-01'})
+        assert 'Server-Timing' not in response
+        self.client.force_authenticate(self.admin)
+        assert self.client.get(reverse('metrics')).status_code == 404
+
+
+class CompressionMiddlewareTests(TestCase):
+    def setUp(self):
+        """Setting up for test."""
+        self.client = APIClient()
+        for i in range(50):
+            Product.objects.create(name='Apple {}'.format(i), kcal=50, carbs=12, proteins=0.3, fat=0.2)
+
+    def products(self, **headers):
+        return self.client.get(reverse('products'), {'name': 'Apple', 'limit': 50}, **headers)
+
+    def test_compressed_response(self):
+        """Testing responses are compressed with content coding accepted by the client"""
+        identity = self.products()
+        response = self.products(HTTP_ACCEPT_ENCODING='gzip;q=1.0, identity; q=0.5')
+        assert response['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response['Vary']
+        assert int(response['Content-Length']) == len(response.content) < len(identity.content)
+        assert gzip.decompress(response.content) == identity.content
+
+    def test_compressed_response_etag(self):
+        """Testing strong ETag of compressed response becomes weak"""
+        def get_response(request):
+            response = HttpResponse(b'[]' * 1000)
+            response['ETag'] = '"abc"'
+            return response
+
+        response = CompressionMiddleware(get_response)(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        assert response['Content-Encoding'] == 'gzip'
+        assert response['ETag'] == 'W/"abc"'
+
+    def test_not_accepted_encoding(self):
+        """Testing responses are not compressed when client doesn't accept any supported coding"""
+        for header in ['identity', 'gzip;q=0', 'compress']:
+            response = self.products(HTTP_ACCEPT_ENCODING=header)
+            assert not response.has_header('Content-Encoding')
+            assert 'Accept-Encoding' in response['Vary']
+
+    def test_small_response(self):
+        """Testing responses smaller than MIN_SIZE are not compressed"""
+        response = self.client.get(reverse('products'), {'name': 'Apple', 'limit': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        assert not response.has_header('Content-Encoding')
+
+    def test_streaming_response(self):
+        """Testing streaming responses are compressed chunk by chunk"""
+        chunks = [b'{"id": %d}' % i for i in range(100)]
+        middleware = CompressionMiddleware(lambda request: StreamingHttpResponse(iter(chunks)))
+        response = middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        assert response['Content-Encoding'] == 'gzip'
+        compressed = list(response.streaming_content)
+        assert len(compressed) == len(chunks) + 1
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        assert decompressor.decompress(compressed[0]) == chunks[0]
+        assert gzip.decompress(b''.join(compressed)) == b''.join(chunks)
@@ -0,0 +1,44 @@
+def moving_average(values, window):
+    """Returns trailing averages of the last window values (fewer at the beginning) for every value."""
+    averages = []
+    total = 0
+    for i, value in enumerate(values):
+        total += value
+        if i >= window:
+            total -= values[i - window]
+        averages.append(total / min(i + 1, window))
+    return averages
+
+
+def largest_triangle_three_buckets(xs, ys, threshold):
+    """Returns indices of at most threshold points that keep the shape of the series (LTTB algorithm).
+
+    Points have to be sorted by x. The first and the last point are always kept, from each of the buckets between
+    them the point forming the largest triangle with the previously kept point and the average of the next bucket
+    is chosen.
+    """
+    count = len(xs)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    every = (count - 2) / (threshold - 2)
+    kept = [0]
+    previous = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        average_x = sum(xs[end:next_end]) / (next_end - end)
+        average_y = sum(ys[end:next_end]) / (next_end - end)
+
+        best, best_area = start, -1
+        for j in range(start, end):
+            area = abs((xs[previous] - average_x) * (ys[j] - ys[previous]) -
+                       (xs[previous] - xs[j]) * (average_y - ys[previous]))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        previous = best
+
+    kept.append(count - 1)
+    return kept
@@ -9,10 +9,15 @@ from diet_app import views
 
 urlpatterns = [
     path('diary/', views.DiaryView.as_view(), name='diary'),
+    path('diary/<int:diary_id>/snapshot/', views.DiarySnapshotView.as_view(), name='diary-snapshot'),
+    path('daily-summaries/', views.DailySummariesView.as_view(), name='daily-summaries'),
+    path('goals/', views.GoalsView.as_view(), name='goals'),
     path('activity/', views.ActivityView.as_view(), name='activity'),
     path('activities/', views.ActivitiesView.as_view(), name='activities'),
     path('product/', views.ProductView.as_view(), name='product'),
     path('products/', views.ProductsView.as_view(), name='products'),
+    path('products/suggest/', views.ProductSuggestView.as_view(), name='products-suggest'),
+    path('products/recent/', views.RecentProductsView.as_view(), name='products-recent'),
     path('ingredient/', views.IngredientView.as_view(), name='ingredient'),
     path('discipline/', views.DisciplineView.as_view(), name='discipline'),
     path('disciplines/', views.DisciplinesView.as_view(), name='disciplines'),
@@ -22,7 +27,10 @@ urlpatterns = [
     path('user/', views.UserView.as_view(), name='user'),
     path('profile/', views.ProfileView.as_view(), name='profile'),
     path('weights/', views.WeightsView.as_view(), name='weights'),
+    path('weights/series/', views.WeightSeriesView.as_view(), name='weight-series'),
     path('weight/', views.WeightView.as_view(), name='weight'),
+    path('sync/', views.SyncView.as_view(), name='sync'),
     path('login/', views.LoginView.as_view(), name='login'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 
 ]
@@ -0,0 +1,80 @@
+from django.db import connections, transaction
+from django.db.models import Prefetch
+
+from diet_app.models import *
+
+
+def prefetch_meals(meal_types):
+    """Returns meal types queryset that loads meals, ingredients and products in a constant number of queries."""
+    ingredients = Ingredient.objects.select_related('product').order_by('id')
+    return meal_types.order_by('id').select_related('meal').prefetch_related(
+        Prefetch('meal__ingredient_set', queryset=ingredients))
+
+
+def ingredient_representation(ingredient, macros=False):
+    """Returns ingredient with already loaded product, optionally with product nutrients in 100g."""
+    data = {'ingredient_id': ingredient.id,
+            'name': ingredient.product.name,
+            'amount': ingredient.amount}
+    if macros:
+        data.update({'product_id': ingredient.product.id,
+                     'kcal': ingredient.product.kcal,
+                     'carbs': ingredient.product.carbs,
+                     'proteins': ingredient.product.proteins,
+                     'fat': ingredient.product.fat})
+    return data
+
+
+def meal_representation(meal, macros=False):
+    """Returns meal totals and ingredients of already loaded meal."""
+    if meal is None:
+        return {'total_kcal': None,
+                'total_carbs': None,
+                'total_proteins': None,
+                'total_fat': None,
+                'ingredients': []}
+
+    return {'total_kcal': meal.total_kcal,
+            'total_carbs': meal.total_carbs,
+            'total_proteins': meal.total_proteins,
+            'total_fat': meal.total_fat,
+            'ingredients': [ingredient_representation(ingredient, macros)
+                            for ingredient in meal.ingredient_set.all()]}
+
+
+def activity_representation(activity):
+    """Returns activity with already loaded discipline and annotated burned_kcal."""
+    return {'activity_id': activity.id,
+            'discipline_id': activity.discipline.id,
+            'name': activity.discipline.name,
+            'calories_burn': activity.discipline.calories_burn,
+            'time': activity.time,
+            'burned_kcal': activity.burned_kcal}
+
+
+def meal_type_representation(meal_type, macros=False):
+    """Returns meal type with its meal assembled from prefetched data."""
+    data = {'meal_type_id': meal_type.id, 'name': meal_type.name}
+    data.update(meal_representation(getattr(meal_type, 'meal', None), macros))
+    return data
+
+
+def bulk_create(model, objects):
+    """Inserts objects in one transaction and returns them with ids set, in the same order."""
+    using = model.objects.db
+    connection = connections[using]
+    with transaction.atomic(using=using, savepoint=False):
+        if connection.features.can_return_ids_from_bulk_insert:
+            return model.objects.bulk_create(objects)
+
+        if connection.vendor != 'sqlite':
+            for obj in objects:
+                obj.save(force_insert=True, using=using)
+            return objects
+
+        # SQLite holds the write lock until commit, so the newest rows are the ones just inserted.
+        model.objects.bulk_create(objects)
+        ids = model.objects.order_by('-id').values_list('id', flat=True)[:len(objects)]
+        for obj, pk in zip(objects, reversed(list(ids))):
+            obj.pk = pk
+        return objects
@@ -1,12 +1,16 @@
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, ValidationError
 from django.db import IntegrityError
-from django.http import JsonResponse, Http404
+from django.http import HttpResponse, JsonResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import viewsets
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ViewSet
 
+from diet_app.conditional import conditional_response
+from diet_app.metrics import metrics_options, registry
+from diet_app.pagination import paginated_response
 from diet_app.serializers import *
 
 from diet_app.models import *
@@ -21,12 +25,37 @@ class DiaryView(APIView):
         return Response(data, status)
 
     def post(self, request):
-        serializer = DiarySerializer(data=request.data)
+        serializer = DiaryCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.create(serializer.validated_data)
+        serializer.save()
         return Response(serializer.data)
 
 
+class DiarySnapshotView(APIView):
+    def get(self, request, diary_id):
+        serializer = DiarySnapshotSerializer(data={'id': diary_id})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.data
+        status = 200 if data else 400
+        return Response(data, status)
+
+
+class DailySummariesView(APIView):
+    def get(self, request):
+        serializer = DailySummariesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return paginated_response(request, serializer)
+
+
+class GoalsView(APIView):
+    def get(self, request):
+        serializer = GoalsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.data
+        status = 200 if data else 400
+        return Response(data, status)
+
+
 class ActivityView(APIView):
     def get(self, request):
         serializer = ActivityGetSerializer(data=request.query_params)
@@ -36,9 +65,15 @@ class ActivityView(APIView):
         return Response(data, status)
 
     def post(self, request):
+        if isinstance(request.data, list):
+            serializer = ActivityCreateSerializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(serializer.data)
+
         serializer = ActivityCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.create(serializer.validated_data)
+        serializer.save()
         return Response(serializer.data)
 
     def delete(self, request):
@@ -52,7 +87,9 @@ class ActivitiesView(APIView):
     def get(self, request):
         serializer = ActivitiesListSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
-        return Response(serializer.data)
+        response = paginated_response(request, serializer)
+        response['X-Total-Burned-Kcal'] = serializer.total_burned_kcal()
+        return response
 
 
 class DisciplineView(APIView):
@@ -66,7 +103,7 @@ class DisciplinesView(APIView):
     def get(self, request):
         serializer = DisciplinesSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
-        return Response(serializer.data)
+        return paginated_response(request, serializer)
 
 
 class ProductView(APIView):
@@ -78,7 +115,7 @@ class ProductView(APIView):
     def post(self, request):
         serializer = ProductCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.create(serializer.validated_data)
+        serializer.save()
         return Response(serializer.data)
 
 
@@ -86,14 +123,34 @@ class ProductsView(APIView):
     def get(self, request):
         serializer = ProductsGetSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
+        return paginated_response(request, serializer)
+
+
+class ProductSuggestView(APIView):
+    def get(self, request):
+        serializer = ProductSuggestSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.data)
+
+
+class RecentProductsView(APIView):
+    def get(self, request):
+        serializer = RecentProductsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
         return Response(serializer.data)
 
 
 class IngredientView(APIView):
     def post(self, request):
+        if isinstance(request.data, list):
+            serializer = IngredientCreateSerializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(serializer.data)
+
         serializer = IngredientCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.create(serializer.validated_data)
+        serializer.save()
         return Response(serializer.data)
 
     def delete(self, request):
@@ -112,7 +169,7 @@ class MealView(APIView):
     def post(self, request):
         serializer = MealCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.create(serializer.validated_data)
+        serializer.save()
         return Response(serializer.data)
 
     def put(self, request):
@@ -137,7 +194,7 @@ class MealTypeView(APIView):
     def post(self, request):
         serializer = MealTypeCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.create(serializer.validated_data)
+        serializer.save()
         return Response(serializer.data)
 
     def delete(self, request):
@@ -151,14 +208,14 @@ class MealTypesView(APIView):
     def get(self, request):
         serializer = MealTypesSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
-        return Response(serializer.data)
+        return conditional_response(request, serializer, lambda: paginated_response(request, serializer))
 
 
 class UserView(APIView):
     def post(self, request):
         serializer = UserCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.create(serializer.validated_data)
+        serializer.save()
         return Response(serializer.data)
 
     def put(self, request):
@@ -168,7 +225,7 @@ class UserView(APIView):
         return Response(serializer.data)
 
     def delete(self, request):
-        serializer = UserDeleteSerializer(data=request.data)
+        serializer = UserDeleteSerializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         serializer.delete(serializer.validated_data)
         return Response(serializer.data)
@@ -178,14 +235,21 @@ class ProfileView(APIView):
     def post(self, request):
         serializer = ProfileGetSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        return Response(serializer.data)
+        return conditional_response(request, serializer, lambda: Response(serializer.data))
 
 
 class WeightsView(APIView):
     def get(self, request):
         serializer = WeightListGetSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
-        return Response(serializer.data)
+        return conditional_response(request, serializer, lambda: paginated_response(request, serializer))
+
+
+class WeightSeriesView(APIView):
+    def get(self, request):
+        serializer = WeightSeriesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return conditional_response(request, serializer, lambda: Response(serializer.data))
 
 
 class WeightView(APIView):
@@ -195,9 +259,15 @@ class WeightView(APIView):
         return Response(serializer.data)
 
     def post(self, request):
+        if isinstance(request.data, list):
+            serializer = WeightCreateSerializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+            return Response(serializer.data)
+
         serializer = WeightCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.create(serializer.validated_data)
+        serializer.save()
         return Response(serializer.data)
 
     def delete(self, request):
@@ -207,8 +277,30 @@ class WeightView(APIView):
         return Response(serializer.data)
 
 
+class SyncView(APIView):
+    def get(self, request):
+        serializer = SyncSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.data)
+
+    def post(self, request):
+        serializer = SyncUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
+
 class LoginView(APIView):
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        if not metrics_options()['ENABLED']:
+            raise Http404
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
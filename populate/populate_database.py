@@ -1,51 +1,277 @@
+"""Populates database with users, products and disciplines.
+
+Rows are read from JSON array or JSON lines files one by one and inserted in batches, each in one transaction.
+Rows already in the database are matched by natural key (username, product name, discipline name), so running
+the script again does not create duplicates: users are skipped and products and disciplines are updated.
+Plain text passwords are hashed in a pool of processes, already hashed passwords are stored as they are.
+
+Usage: python3 populate/populate_database.py [--users populate/users.json] [--synthetic-users 100000] ...
+"""
+import argparse
+import itertools
+import json
 import os
-from django.db import IntegrityError
+import random
+import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aplikacje_mobilne_2017.settings')
 import django
 django.setup()
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import IntegrityError, transaction
 from diet_app.models import *
-import json
+from diet_app.utils import bulk_create
+
+BATCH_SIZE = 1000
+"""Number of rows inserted in one transaction."""
+
+PROFILE_FIELDS = ['height', 'gender', 'daily_kcal', 'daily_carbs', 'daily_proteins', 'daily_fat']
+"""Optional profile fields that can be given in users rows."""
+
+_SEPARATORS = re.compile(r'[\s,\[\]]*')
+
+
+def iter_json(path, chunk_size=1 << 16):
+    """Yields objects from JSON array or JSON lines file, reading it in chunks."""
+    decoder = json.JSONDecoder()
+    with open(path) as file:
+        buffer = ''
+        position = 0
+        eof = False
+        while True:
+            position = _SEPARATORS.match(buffer, position).end()
+            if position < len(buffer):
+                try:
+                    row, position = decoder.raw_decode(buffer, position)
+                    yield row
+                    continue
+
+                except ValueError:
+                    if eof:
+                        raise
+
+            if eof:
+                return
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+
+def batches(rows, size=BATCH_SIZE):
+    """Yields lists of at most size rows."""
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Progress:
+    """Prints number of processed rows and speed to stderr."""
+
+    def __init__(self, name, quiet=False):
+        self.name = name
+        self.quiet = quiet
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.start = time.perf_counter()
+
+    def update(self, rows, created, updated=0):
+        self.rows += rows
+        self.created += created
+        self.updated += updated
+        if not self.quiet:
+            elapsed = time.perf_counter() - self.start
+            print('\r{}: {} rows, {} created, {} updated ({:.0f} rows/s)'.format(
+                self.name, self.rows, self.created, self.updated, self.rows / elapsed if elapsed else 0),
+                end='', file=sys.stderr, flush=True)
+
+    def finish(self):
+        if not self.quiet:
+            print(file=sys.stderr)
+        return self.created, self.updated
+
+
+def upsert(model, key, fields, rows, batch_size=BATCH_SIZE, progress=None):
+    """Creates rows missing in database and updates existing ones (found by key field) whose values differ.
+
+    Returns numbers of created and updated rows.
+    """
+    progress = progress or Progress(model._meta.verbose_name_plural, quiet=True)
+    for batch in batches(rows, batch_size):
+        # The last row with given key wins, like when rows are inserted one by one.
+        values = {row[key]: {field: row[field] for field in fields} for row in batch}
+        with transaction.atomic():
+            existing = {}
+            for obj in model.objects.filter(**{key + '__in': list(values)}):
+                existing.setdefault(getattr(obj, key), obj)
+
+            updated = 0
+            for name, obj in existing.items():
+                if any(getattr(obj, field) != value for field, value in values[name].items()):
+                    updated += model.objects.filter(**{key: name}).update(**values[name])
+
+            created = [model(**{key: name}, **values[name]) for name in values if name not in existing]
+            model.objects.bulk_create(created)
+        progress.update(len(batch), len(created), updated)
+    return progress.finish()
 
 
-def populate():
-    data = json.load(open('populate/users.json'))
-    for x in data:
-        add_user(x['username'], x['password'], x['email'])
+def import_products(rows, batch_size=BATCH_SIZE, progress=None):
+    """Creates or updates products with given names, returns numbers of created and updated products."""
+    return upsert(Product, 'name', ['kcal', 'carbs', 'proteins', 'fat'], rows, batch_size, progress)
 
-    data = json.load(open('populate/products.json'))
-    for x in data:
-        add_product(x['name'], x['kcal'], x['carbs'], x['proteins'], x['fat'])
 
-    data = json.load(open('populate/disciplines.json'))
-    for x in data:
-        add_discipline(x['name'], x['calories_burn'])
+def import_disciplines(rows, batch_size=BATCH_SIZE, progress=None):
+    """Creates or updates disciplines with given names, returns numbers of created and updated disciplines."""
+    return upsert(Discipline, 'name', ['calories_burn'], rows, batch_size, progress)
 
 
-def add_user(username, password, email):
+def is_hashed(password):
+    """Checks if password is already hashed by one of PASSWORD_HASHERS."""
     try:
-        user = Profile.objects.create_user(username=username, password=password, email=email)
-        user.save()
-        return user
+        identify_hasher(password)
+        return True
+
+    except ValueError:
+        return False
+
+
+def hash_passwords(passwords, executor=None, workers=1):
+    """Returns hashed passwords, hashing plain text ones in executor processes if given."""
+    plain = [i for i, password in enumerate(passwords) if not is_hashed(password)]
+    if executor is None:
+        hashed = map(make_password, [passwords[i] for i in plain])
+    else:
+        hashed = executor.map(make_password, [passwords[i] for i in plain],
+                              chunksize=max(1, len(plain) // (workers * 4)))
+    passwords = list(passwords)
+    for i, password in zip(plain, hashed):
+        passwords[i] = password
+    return passwords
+
+
+def create_profiles(users, profiles):
+    """Inserts new users and their profiles in a few queries, returns the profiles."""
+    users = bulk_create(User, users)
+    for profile, user in zip(profiles, users):
+        profile.user = user
+    return Profile.objects.bulk_create(profiles)
+
+
+def import_users(rows, batch_size=BATCH_SIZE, workers=None, progress=None):
+    """Creates users that do not exist yet (by username or email), returns number of created users.
+
+    Rows have username, password (plain text or hashed) and email, and optionally PROFILE_FIELDS.
+    """
+    progress = progress or Progress('users', quiet=True)
+    workers = os.cpu_count() if workers is None else workers
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for batch in batches(rows, batch_size):
+            usernames = {row['username'] for row in batch}
+            emails = {row['email'] for row in batch}
+            taken = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+            taken |= set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+
+            new = []
+            for row in batch:
+                if row['username'] not in taken and row['email'] not in taken:
+                    taken.update([row['username'], row['email']])
+                    new.append(row)
+
+            passwords = hash_passwords([row['password'] for row in new], executor, workers)
+            users = [User(username=row['username'], email=row['email'], password=password)
+                     for row, password in zip(new, passwords)]
+            profiles = [Profile(**{field: row[field] for field in PROFILE_FIELDS if field in row}) for row in new]
+            try:
+                with transaction.atomic():
+                    create_profiles(users, profiles)
+
+            except IntegrityError:
+                # Users added concurrently, fall back to one by one inserts skipping existing ones.
+                profiles = [profile for user, profile in zip(users, profiles) if add_profile(user, profile)]
+            progress.update(len(batch), len(profiles))
+
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return progress.finish()[0]
+
+
+def add_profile(user, profile):
+    """Inserts single user with profile, returns the profile or None if user already exists."""
+    try:
+        with transaction.atomic():
+            user.pk = None
+            user.save()
+            profile.user = user
+            profile.save(force_insert=True)
+            return profile
 
     except IntegrityError:
-        pass
+        return None
 
 
-def add_product(name, kcal, carbs, proteins, fat):
-    product = Product.objects.get_or_create(name=name, kcal=kcal, carbs=carbs, proteins=proteins, fat=fat)[0]
-    product.save()
-    return product
+def synthetic_users(count, password='zaq1@WSX', start=0):
+    """Yields count generated users sharing one password, hashed once."""
+    password = make_password(password)
+    for i in range(start, start + count):
+        yield {'username': 'user{}'.format(i), 'email': 'user{}@example.com'.format(i), 'password': password,
+               'daily_kcal': 2000, 'daily_carbs': 250, 'daily_proteins': 100, 'daily_fat': 70}
 
 
-def add_discipline(name, calories_burn):
-    discipline = Discipline.objects.get_or_create(name=name, calories_burn=calories_burn)[0]
-    discipline.save()
-    return discipline
+def synthetic_products(count, names, seed=0):
+    """Yields count products with random nutrients in 100g, named after names with a number suffix if needed."""
+    rng = random.Random(seed)
+    names = list(dict.fromkeys(names))
+    for i in range(count):
+        name = names[i % len(names)]
+        if i >= len(names):
+            suffix = ' {}'.format(i)
+            name = name[:Product._meta.get_field('name').max_length - len(suffix)] + suffix
+        yield {'name': name, 'kcal': rng.randint(20, 600), 'carbs': rng.randint(0, 80),
+               'proteins': rng.randint(0, 40), 'fat': rng.randint(0, 40)}
 
 
-if __name__ == '__main__':
+def populate(users='populate/users.json', products='populate/products.json',
+             disciplines='populate/disciplines.json', batch_size=BATCH_SIZE, workers=None, quiet=False):
+    """Imports rows from files or iterables of rows."""
+    rows = lambda source: iter_json(source) if isinstance(source, str) else source
+    import_users(rows(users), batch_size, workers, Progress('users', quiet))
+    import_products(rows(products), batch_size, Progress('products', quiet))
+    import_disciplines(rows(disciplines), batch_size, Progress('disciplines', quiet))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Populate database with users, products and disciplines.')
+    parser.add_argument('--users', default='populate/users.json', help='JSON array or JSON lines file')
+    parser.add_argument('--products', default='populate/products.json', help='JSON array or JSON lines file')
+    parser.add_argument('--disciplines', default='populate/disciplines.json', help='JSON array or JSON lines file')
+    parser.add_argument('--synthetic-users', type=int, help='generate given number of users instead of reading file')
+    parser.add_argument('--synthetic-products', type=int,
+                        help='generate given number of products named after the ones in products file')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, help='processes hashing passwords, number of CPUs by default')
+    parser.add_argument('--quiet', action='store_true', help='do not print progress')
+    args = parser.parse_args()
+
+    users = args.users if args.synthetic_users is None else synthetic_users(args.synthetic_users)
+    products = args.products
+    if args.synthetic_products is not None:
+        products = synthetic_products(args.synthetic_products, [row['name'] for row in iter_json(args.products)])
+
     print("Start populating script...")
-    populate()
+    populate(users, products, args.disciplines, args.batch_size, args.workers, args.quiet)
     print("Done!")
+
+
+if __name__ == '__main__':
+    main()